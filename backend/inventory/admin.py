@@ -1,17 +1,51 @@
+from decimal import Decimal
+
 from django.contrib import admin
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .counts import EstimatedCountPaginator
 from .models import ProductMaster, StockMain, StockDetail
+from .search import search_products, search_transactions
+
+
+class IndexedSearchMixin:
+    """
+    Admin search answering `indexed_search_fields` from the search index
+    (indexed_search()) and the other `search_fields` with the admin's usual
+    lookups; an object matching either is found.
+    """
+    indexed_search_fields = ()
+
+    def indexed_search(self, queryset, search_term):
+        """Objects of the queryset whose indexed fields match the search term"""
+        return queryset.none()
+
+    def get_search_fields(self, request):
+        # The indexed fields are searched by indexed_search() instead
+        return [field for field in super().get_search_fields(request) if field not in self.indexed_search_fields]
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term.strip():
+            return results, may_have_duplicates
+        matches = self.indexed_search(queryset, search_term).order_by().values('pk')
+        return results | queryset.filter(pk__in=matches), may_have_duplicates
 
 
 @admin.register(ProductMaster)
-class ProductMasterAdmin(admin.ModelAdmin):
+class ProductMasterAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = [
         'product_code', 'product_name', 'category', 'unit', 
-        'unit_price', 'current_stock', 'is_active', 'created_at'
+        'unit_price', 'current_stock', 'reorder_point', 'needs_reorder', 'is_active', 'created_at'
     ]
-    list_filter = ['category', 'is_active', 'unit', 'created_at']
+    list_filter = ['category', 'is_active', 'needs_reorder', 'unit', 'created_at']
     search_fields = ['product_code', 'product_name', 'description']
-    readonly_fields = ['product_id', 'current_stock', 'created_at', 'updated_at']
+    indexed_search_fields = ['product_code', 'product_name']
+    readonly_fields = ['product_id', 'current_stock', 'needs_reorder', 'created_at', 'updated_at']
     ordering = ['product_name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Basic Information', {
@@ -20,6 +54,9 @@ class ProductMasterAdmin(admin.ModelAdmin):
         ('Pricing & Units', {
             'fields': ('unit', 'unit_price')
         }),
+        ('Reordering', {
+            'fields': ('reorder_point', 'reorder_quantity', 'needs_reorder')
+        }),
         ('Status', {
             'fields': ('is_active',)
         }),
@@ -29,25 +66,66 @@ class ProductMasterAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Stock is joined from the balance table instead of one query per row
+        return super().get_queryset(request).annotate(
+            stock_on_hand=Coalesce(
+                F('stock_balance__quantity'), Value(Decimal('0')),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )
+        )
+
+    def indexed_search(self, queryset, search_term):
+        return search_products(queryset, search_term)
+
+    def current_stock(self, obj):
+        return obj.stock_on_hand
+    current_stock.short_description = 'Current Stock'
+    current_stock.admin_order_field = 'stock_on_hand'
+
 
 class StockDetailInline(admin.TabularInline):
     model = StockDetail
     extra = 1
     fields = ['product', 'quantity', 'unit_price', 'total_price', 'batch_number', 'expiry_date', 'notes']
     readonly_fields = ['total_price']
+    autocomplete_fields = ['product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('transaction', 'product')
+
+
+class ProductCategoryFilter(admin.SimpleListFilter):
+    """Category filter listing the categories of the product table, not of every stock detail"""
+    title = 'category'
+    parameter_name = 'product__category'
+
+    def lookups(self, request, model_admin):
+        categories = ProductMaster.objects.exclude(category__isnull=True).exclude(category='').order_by(
+            'category'
+        ).values_list('category', flat=True).distinct()
+        return [(category, category) for category in categories]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(product__category=self.value())
+        return queryset
 
 
 @admin.register(StockMain)
-class StockMainAdmin(admin.ModelAdmin):
+class StockMainAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = [
         'transaction_code', 'transaction_type', 'transaction_date', 
         'supplier_customer', 'total_amount', 'details_count', 'created_by'
     ]
     list_filter = ['transaction_type', 'transaction_date', 'created_at']
     search_fields = ['transaction_code', 'reference_number', 'supplier_customer', 'notes']
+    indexed_search_fields = ['reference_number', 'supplier_customer']
     readonly_fields = ['transaction_id', 'transaction_code', 'created_at', 'updated_at']
     ordering = ['-transaction_date']
     inlines = [StockDetailInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Transaction Information', {
@@ -68,21 +146,36 @@ class StockMainAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Counted per row of the page only, from the stock detail transaction index
+        detail_count = StockDetail.objects.filter(transaction=OuterRef('pk')).order_by().values(
+            'transaction'
+        ).annotate(count=Count('pk')).values('count')
+        return super().get_queryset(request).annotate(detail_count=Coalesce(Subquery(detail_count), Value(0)))
+
+    def indexed_search(self, queryset, search_term):
+        return search_transactions(queryset, search_term)
+
     def details_count(self, obj):
-        return obj.details.count()
+        return obj.detail_count
     details_count.short_description = 'Items'
 
 
 @admin.register(StockDetail)
-class StockDetailAdmin(admin.ModelAdmin):
+class StockDetailAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = [
         'detail_id', 'transaction', 'product', 'quantity', 
         'unit_price', 'total_price', 'movement_type', 'created_at'
     ]
-    list_filter = ['transaction__transaction_type', 'product__category', 'created_at']
+    list_filter = ['transaction__transaction_type', ProductCategoryFilter, 'created_at']
+    list_select_related = ['transaction', 'product']
     search_fields = ['transaction__transaction_code', 'product__product_name', 'product__product_code']
+    indexed_search_fields = ['product__product_name', 'product__product_code']
     readonly_fields = ['detail_id', 'total_price', 'movement_type', 'created_at', 'updated_at']
+    autocomplete_fields = ['transaction', 'product']
     ordering = ['-created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Transaction Information', {
@@ -100,6 +193,15 @@ class StockDetailAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # The change form's title renders the detail through both related objects
+        return super().get_queryset(request).select_related('transaction', 'product')
+
+    def indexed_search(self, queryset, search_term):
+        # Details of the matching products, read from the product foreign key index
+        products = search_products(ProductMaster.objects.all(), search_term).order_by().values('pk')
+        return queryset.filter(product__in=products)
+
     def movement_type(self, obj):
         return obj.movement_type
     movement_type.short_description = 'Movement Type'
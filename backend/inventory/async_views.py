@@ -0,0 +1,122 @@
+"""
+Async versions of the read-heavy endpoints, served by the ASGI deployment.
+
+The dashboard, inventory summary and health check are routed here by
+warehouse_inventory.urls_asgi; every other endpoint, and all writes, stay on
+the synchronous DRF views. Responses match their DRF counterparts (JSON
+only), but independent queries run concurrently, e.g. a summary page and its
+total count.
+"""
+from math import ceil
+
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .conditional import ConditionalGetMixin
+from .parallel import gather_queries, run_query
+from .serializers import InventorySummarySerializer
+from .stats import aget_dashboard_stats
+from .views import DashboardStatsView, InventorySummaryView
+
+
+def json_response(data, status=200):
+    """Render data the way the DRF views do for JSON clients"""
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def error_response(exc):
+    """Render an API exception the way DRF's default exception handler does"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, status=exc.status_code)
+
+
+async def health_check(request):
+    return JsonResponse({'status': 'healthy', 'message': 'API is running'})
+
+
+class AsyncDashboardStatsView(ConditionalGetMixin, View):
+    """Dashboard statistics with the aggregate queries running concurrently"""
+    version_resources = DashboardStatsView.version_resources
+    version_lifetime = DashboardStatsView.version_lifetime
+    cache_responses = DashboardStatsView.cache_responses
+
+    async def get(self, request):
+        return await self.aconditional_get(request, self.get_stats)
+
+    async def get_stats(self, request):
+        try:
+            return json_response(await aget_dashboard_stats())
+        except Exception as e:
+            return json_response({'error': str(e)}, status=500)
+
+
+class AsyncInventorySummaryView(ConditionalGetMixin, View):
+    """Inventory summary page fetched concurrently with its total count"""
+    version_resources = InventorySummaryView.version_resources
+    page_size = api_settings.PAGE_SIZE or 20
+    page_query_param = 'page'
+    invalid_page_message = 'Invalid page.'
+
+    async def get(self, request):
+        return await self.aconditional_get(request, self.list)
+
+    async def list(self, request):
+        # Filters, sorting and as_of are shared with the DRF view
+        summary = InventorySummaryView(request=Request(request), args=(), kwargs={}, format_kwarg=None)
+        try:
+            queryset = await run_query(summary.get_queryset)
+            count, number, rows = await self.paginate(request, queryset)
+        except APIException as e:
+            return error_response(e)
+
+        return json_response({
+            'count': count,
+            'next': self.get_next_link(request, number, count),
+            'previous': self.get_previous_link(request, number),
+            'results': InventorySummarySerializer(rows, many=True).data,
+        })
+
+    async def paginate(self, request, queryset):
+        """(count, page number, rows) of the requested page, as PageNumberPagination pages"""
+        page = request.GET.get(self.page_query_param, 1)
+        if page == 'last':
+            count = await run_query(queryset.count)
+            number = self.num_pages(count)
+        else:
+            try:
+                number = int(page)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_page_message)
+            if number < 1:
+                raise NotFound(self.invalid_page_message)
+
+        start = (number - 1) * self.page_size
+        page_rows = lambda: list(queryset[start:start + self.page_size])
+        if page == 'last':
+            rows = await run_query(page_rows)
+        else:
+            count, rows = await gather_queries(queryset.count, page_rows)
+            if number > self.num_pages(count):
+                raise NotFound(self.invalid_page_message)
+        return count, number, rows
+
+    def num_pages(self, count):
+        return max(1, ceil(count / self.page_size))
+
+    def get_next_link(self, request, number, count):
+        if number >= self.num_pages(count):
+            return None
+        return replace_query_param(request.build_absolute_uri(), self.page_query_param, number + 1)
+
+    def get_previous_link(self, request, number):
+        if number <= 1:
+            return None
+        url = request.build_absolute_uri()
+        if number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, number - 1)
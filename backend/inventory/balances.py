@@ -0,0 +1,286 @@
+"""
+Maintenance of the materialized stock balance table (stckbal).
+
+Every StockDetail write applies its quantity and value delta to the product's
+StockBalance row inside the same database transaction, so reading the stock
+of a product never has to aggregate its movement history. Writes that lower
+a balance lock it first and are refused if it would go negative, and a balance
+crossing the product's reorder point flips its needs_reorder flag. The same deltas
+go to the daily movement rollup and, for movements dated before an existing
+stock checkpoint, to those checkpoints, and to the balance of the line's batch
+(stock outs without one are drawn from the batches first expired first out);
+the lines are valued at cost by inventory.valuation.
+"""
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .batches import apply_details_to_batches, apply_to_batches, revert_from_batches
+from .checkpoints import apply_details_to_checkpoints, apply_to_checkpoints, revert_from_checkpoints
+from .models import ProductMaster, ResourceVersion, StockBalance, StockDetail
+from .rollups import apply_details_to_rollup, apply_to_rollup, revert_from_rollup
+from .valuation import apply_details_to_valuation, revalue_on_commit, value_movements
+from .versions import bump_versions
+
+CENT = Decimal('0.01')
+
+
+class InsufficientStock(Exception):
+    """A stock write would take the balance of a product below zero"""
+
+    def __init__(self, product_id, available, requested):
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+        super().__init__(
+            f"Insufficient stock for product {product_id}: {available} available, {requested} requested."
+        )
+
+    def as_dict(self):
+        return {
+            'error': str(self),
+            'product_id': self.product_id,
+            'available': str(self.available),
+            'requested': str(self.requested),
+        }
+
+
+class InsufficientBatchStock(InsufficientStock):
+    """A stock write would take the balance of a batch below zero"""
+
+    def __init__(self, product_id, batch_number, expiry_date, available, requested):
+        self.batch_number = batch_number
+        self.expiry_date = expiry_date
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+        Exception.__init__(
+            self, f"Insufficient stock of batch {batch_number or '(none)'} of product {product_id}: "
+            f"{available} available, {requested} requested."
+        )
+
+    def as_dict(self):
+        return {
+            **super().as_dict(),
+            'batch_number': self.batch_number,
+            'expiry_date': self.expiry_date.isoformat() if self.expiry_date else None,
+        }
+
+
+def lock_balances(product_ids):
+    """
+    Lock the balance rows of the products until the current transaction ends
+    and return {product_id: quantity on hand}.
+
+    Rows are locked in product order so writers touching several products
+    cannot deadlock. Databases with row locks use SELECT ... FOR UPDATE;
+    SQLite has none, so a no-op UPDATE takes its database write lock first
+    and concurrent writers queue instead of reading a balance that is about
+    to change.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    balances = StockBalance.objects.filter(product_id__in=product_ids).order_by('product_id')
+    if connections[router.db_for_write(StockBalance)].features.has_select_for_update:
+        return dict(balances.select_for_update().values_list('product_id', 'quantity'))
+    balances.update(quantity=F('quantity'))
+    return dict(balances.values_list('product_id', 'quantity'))
+
+
+def check_availability(changes):
+    """
+    Lock the products whose stock a write lowers ({product_id: net quantity
+    change}) and raise InsufficientStock if any of them would go negative.
+    Call inside the transaction that makes the write.
+    """
+    decreases = {product_id: Decimal(change) for product_id, change in changes.items() if change < 0}
+    available = lock_balances(decreases)
+    for product_id in sorted(decreases):
+        on_hand = available.get(product_id, Decimal('0'))
+        if on_hand + decreases[product_id] < 0:
+            raise InsufficientStock(product_id, on_hand, -decreases[product_id])
+
+
+def _line_value(quantity, unit_price):
+    return Decimal(quantity) * Decimal(unit_price)
+
+
+def apply_movement(product_id, quantity, unit_price, movement_date=None, transaction_type=None, detail_id=None,
+                   batch_number=None, expiry_date=None):
+    """Add a stock movement to the balance of a product, creating the row if needed"""
+    quantity = Decimal(quantity)
+    value = _line_value(quantity, unit_price)
+    _apply_delta(product_id, quantity, value, movement_date)
+    refresh_reorder_flags([product_id])
+    apply_to_batches(product_id, batch_number, expiry_date, quantity, detail_id)
+    if movement_date is not None:
+        apply_to_checkpoints(product_id, quantity, value, movement_date)
+        if transaction_type is not None:
+            apply_to_rollup(product_id, movement_date, transaction_type, quantity, value)
+    if movement_date is not None and detail_id is not None:
+        value_movements([(product_id, detail_id, movement_date, quantity, unit_price)])
+    else:
+        revalue_on_commit([product_id])
+
+
+def apply_movements(details):
+    """Add stock details written without save() (e.g. bulk_create), one update per product"""
+    deltas = {}
+    for detail in details:
+        quantity, value, movement_date = deltas.get(detail.product_id, (Decimal('0'), Decimal('0'), None))
+        detail_date = detail.transaction.transaction_date
+        deltas[detail.product_id] = (
+            quantity + Decimal(detail.quantity),
+            value + _line_value(detail.quantity, detail.unit_price),
+            detail_date if movement_date is None else max(movement_date, detail_date),
+        )
+    for product_id, (quantity, value, movement_date) in deltas.items():
+        _apply_delta(product_id, quantity, value, movement_date)
+    refresh_reorder_flags(deltas)
+    apply_details_to_checkpoints(details)
+    apply_details_to_rollup(details)
+    apply_details_to_batches(details)
+    apply_details_to_valuation(details)
+
+
+def _apply_delta(product_id, quantity, value, movement_date):
+    updates = {
+        'quantity': F('quantity') + quantity,
+        'stock_value': F('stock_value') + value,
+        'updated_at': timezone.now(),
+    }
+    if movement_date is not None:
+        updates['last_movement_date'] = Greatest(
+            Coalesce(F('last_movement_date'), Value(movement_date)),
+            Value(movement_date)
+        )
+
+    if StockBalance.objects.filter(product_id=product_id).update(**updates):
+        return
+
+    _, created = StockBalance.objects.get_or_create(
+        product_id=product_id,
+        defaults={
+            'quantity': quantity,
+            'stock_value': value,
+            'last_movement_date': movement_date,
+        }
+    )
+    if not created:
+        # Another writer created the row between our update and insert
+        StockBalance.objects.filter(product_id=product_id).update(**updates)
+
+
+def revert_movement(product_id, quantity, unit_price, movement_date=None, transaction_type=None,
+                    batch_number=None, expiry_date=None, detail_id=None):
+    """Remove a previously applied stock movement from the balance of a product"""
+    quantity = Decimal(quantity)
+    value = _line_value(quantity, unit_price)
+    StockBalance.objects.filter(product_id=product_id).update(
+        quantity=F('quantity') - quantity,
+        stock_value=F('stock_value') - value,
+        updated_at=timezone.now(),
+    )
+    revert_from_batches(product_id, batch_number, expiry_date, quantity, detail_id)
+    refresh_last_movement([product_id])
+    refresh_reorder_flags([product_id])
+    if movement_date is not None:
+        revert_from_checkpoints(product_id, quantity, value, movement_date)
+        if transaction_type is not None:
+            revert_from_rollup(product_id, movement_date, transaction_type, quantity, value)
+    # Costs depend on the order of movements, so taking one out replays the product
+    revalue_on_commit([product_id])
+
+
+def refresh_last_movement(product_ids):
+    """Recompute the last movement date for the given products from their details"""
+    for product_id in set(product_ids):
+        last_date = StockDetail.objects.filter(product_id=product_id).aggregate(
+            last=Max('transaction__transaction_date')
+        )['last']
+        StockBalance.objects.filter(product_id=product_id).update(last_movement_date=last_date)
+
+
+def _reorder_flag_changes(product_ids=None):
+    """{needs_reorder: [product_id, ...]} for the products whose flag disagrees with their balance"""
+    products = ProductMaster.objects.order_by()
+    if product_ids is not None:
+        products = products.filter(pk__in=set(product_ids))
+    changes = {True: [], False: []}
+    for product_id, reorder_point, needs_reorder, quantity in products.values_list(
+        'pk', 'reorder_point', 'needs_reorder', 'stock_balance__quantity'
+    ):
+        below = (quantity or 0) < reorder_point
+        if below != needs_reorder:
+            changes[below].append(product_id)
+    return changes
+
+
+def refresh_reorder_flags(product_ids=None):
+    """Flip needs_reorder on the given products (or all) whose stock crossed their reorder point"""
+    for needs_reorder, changed in _reorder_flag_changes(product_ids).items():
+        if changed:
+            ProductMaster.objects.filter(pk__in=changed).update(needs_reorder=needs_reorder)
+
+
+def aggregate_balances():
+    """Compute the balance of every product from the full stock detail history"""
+    line_value = ExpressionWrapper(
+        F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=16, decimal_places=2)
+    )
+    rows = StockDetail.objects.order_by().values('product_id').annotate(
+        total_quantity=Sum('quantity'),
+        total_value=Sum(line_value),
+        last_date=Max('transaction__transaction_date'),
+    )
+    return {
+        row['product_id']: StockBalance(
+            product_id=row['product_id'],
+            quantity=row['total_quantity'] or 0,
+            # SQLite sums the line values as floats
+            stock_value=Decimal(row['total_value'] or 0).quantize(CENT),
+            last_movement_date=row['last_date'],
+        )
+        for row in rows
+    }
+
+
+def rebuild_balances(batch_size=1000):
+    """Replace the contents of the balance table with freshly aggregated balances"""
+    balances = aggregate_balances()
+    with transaction.atomic():
+        StockBalance.objects.all().delete()
+        StockBalance.objects.bulk_create(balances.values(), batch_size=batch_size)
+        refresh_reorder_flags()
+        bump_versions(ResourceVersion.STOCK)
+    return len(balances)
+
+
+def find_discrepancies():
+    """Return (product_id, stored, expected) for every balance that disagrees with the history"""
+    expected = aggregate_balances()
+    stored = {balance.product_id: balance for balance in StockBalance.objects.all()}
+
+    discrepancies = []
+    for product_id in expected.keys() | stored.keys():
+        want = expected.get(product_id)
+        have = stored.get(product_id)
+        want_state = (want.quantity, want.stock_value, want.last_movement_date) if want else (0, 0, None)
+        have_state = (have.quantity, have.stock_value, have.last_movement_date) if have else (0, 0, None)
+        if want_state != have_state:
+            discrepancies.append((product_id, have_state, want_state))
+    return sorted(discrepancies)
+
+
+def find_reorder_flag_discrepancies():
+    """Return (product_id, stored, expected) for every needs_reorder flag that disagrees with the balance"""
+    changes = _reorder_flag_changes()
+    return sorted(
+        (product_id, not needs_reorder, needs_reorder)
+        for needs_reorder, changed in changes.items() for product_id in changed
+    )
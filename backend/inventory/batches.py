@@ -0,0 +1,258 @@
+"""
+Batch balances (stckbatch), expiring stock and first-expired-first-out picks.
+
+Every stock detail write adds its quantity to the row of its product, batch
+number and expiry date inside the same database transaction, so the stock on
+hand per batch and the batches expiring in a window are read from one row per
+batch instead of grouping the movement history. Receipts without a batch
+number count towards the product's unbatched row. A stock out naming a batch
+may not take it below zero; one without a batch number is drawn from the
+product's batches first expired first out, and the batches it took from are
+recorded (stckbatchalloc) so deleting or editing the line puts them back and
+the balances can still be rebuilt from the history.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import StockBatchAllocation, StockBatchBalance, StockDetail
+
+
+def _batch_key(product_id, batch_number, expiry_date):
+    return product_id, batch_number or '', expiry_date
+
+
+def _batch_rows(product_id, batch_number, expiry_date):
+    return StockBatchBalance.objects.filter(
+        product_id=product_id, batch_number=batch_number, expiry_date=expiry_date
+    )
+
+
+def batch_quantities(keys):
+    """Return {(product_id, batch_number, expiry_date): quantity on hand} for the given batches"""
+    keys = {_batch_key(*key) for key in keys}
+    if not keys:
+        return {}
+    rows = StockBatchBalance.objects.filter(
+        product_id__in={product_id for product_id, _, _ in keys},
+        batch_number__in={batch_number for _, batch_number, _ in keys},
+    ).order_by().values_list('product_id', 'batch_number', 'expiry_date', 'quantity')
+    quantities = {key: Decimal('0') for key in keys}
+    for product_id, batch_number, expiry_date, quantity in rows:
+        if (product_id, batch_number, expiry_date) in quantities:
+            quantities[product_id, batch_number, expiry_date] = quantity
+    return quantities
+
+
+def _is_drawn_down(batch_number, quantity):
+    # Stock outs without a batch number are spread over the batches
+    return quantity < 0 and not batch_number
+
+
+def apply_to_batches(product_id, batch_number, expiry_date, quantity, detail_id=None):
+    """Add a movement to the balance of its batch, or draw an unbatched stock out from the batches"""
+    quantity = Decimal(quantity)
+    if _is_drawn_down(batch_number, quantity):
+        _draw_down(product_id, expiry_date, -quantity, detail_id)
+    else:
+        _apply_delta(*_batch_key(product_id, batch_number, expiry_date), quantity)
+
+
+def revert_from_batches(product_id, batch_number, expiry_date, quantity, detail_id=None):
+    """Remove a previously applied movement from the balance of its batch or the batches it was drawn from"""
+    quantity = Decimal(quantity)
+    if _is_drawn_down(batch_number, quantity) and detail_id is not None and _return_allocations(detail_id):
+        return
+    _apply_delta(*_batch_key(product_id, batch_number, expiry_date), -quantity)
+
+
+def _apply_delta(product_id, batch_number, expiry_date, quantity, check=True):
+    rows = _batch_rows(product_id, batch_number, expiry_date)
+    updates = {'quantity': F('quantity') + quantity, 'updated_at': timezone.now()}
+    if quantity < 0 and check:
+        # The batch has to hold what is taken out; the product's balance row is already locked
+        if not rows.filter(quantity__gte=-quantity).update(**updates):
+            from .balances import InsufficientBatchStock
+
+            available = rows.values_list('quantity', flat=True).first() or Decimal('0')
+            raise InsufficientBatchStock(product_id, batch_number, expiry_date, available, -quantity)
+    elif not rows.update(**updates):
+        _, created = StockBatchBalance.objects.get_or_create(
+            product_id=product_id, batch_number=batch_number, expiry_date=expiry_date,
+            defaults={'quantity': quantity}
+        )
+        if not created:
+            # Another writer created the row between our update and insert
+            rows.update(**updates)
+    # Used up batches have no row
+    rows.filter(quantity=0).delete()
+
+
+def _draw_down(product_id, expiry_date, quantity, detail_id):
+    """Take an unbatched stock out from the product's batches, first expired first out"""
+    own_key = _batch_key(product_id, None, expiry_date)
+    picks = []
+    remaining = quantity
+    for batch in drawdown_batches(product_id):
+        if remaining <= 0:
+            break
+        taken = min(remaining, batch.quantity)
+        picks.append(((product_id, batch.batch_number, batch.expiry_date), taken))
+        remaining -= taken
+    if remaining > 0:
+        # Only when the batch balances disagree with the product balance; keep the totals right
+        picks.append((own_key, remaining))
+
+    if detail_id is None or all(key == own_key for key, _ in picks):
+        # Taken from the line's own row, which is where the history puts it without a record
+        _apply_delta(*own_key, -quantity, check=False)
+        return
+
+    for key, taken in picks:
+        _apply_delta(*key, -taken, check=False)
+    StockBatchAllocation.objects.bulk_create([
+        StockBatchAllocation(
+            product_id=product_id, detail_id=detail_id, batch_number=key[1], expiry_date=key[2], quantity=taken
+        )
+        for key, taken in picks
+    ])
+
+
+def _return_allocations(detail_id):
+    """Put what a line drew from the batches back; False if it has no allocations"""
+    allocations = list(StockBatchAllocation.objects.filter(detail_id=detail_id))
+    for allocation in allocations:
+        _apply_delta(allocation.product_id, allocation.batch_number, allocation.expiry_date, allocation.quantity)
+    if allocations:
+        StockBatchAllocation.objects.filter(detail_id=detail_id).delete()
+    return bool(allocations)
+
+
+def apply_details_to_batches(details):
+    """Add stock details written without save() (e.g. bulk_create), one update per batch"""
+    deltas = {}
+    drawn_down = []
+    for detail in details:
+        if _is_drawn_down(detail.batch_number, detail.quantity):
+            drawn_down.append(detail)
+            continue
+        key = _batch_key(detail.product_id, detail.batch_number, detail.expiry_date)
+        deltas[key] = deltas.get(key, Decimal('0')) + Decimal(detail.quantity)
+    for key, quantity in deltas.items():
+        if quantity:
+            _apply_delta(*key, quantity)
+    # After the receipts, in line order, as if the lines had been saved one by one
+    for detail in drawn_down:
+        _draw_down(detail.product_id, detail.expiry_date, -Decimal(detail.quantity), detail.pk)
+
+
+def aggregate_batch_balances():
+    """Compute the balance of every batch from the stock detail history and the recorded draw-downs"""
+    allocations = StockBatchAllocation.objects.order_by()
+    rows = StockDetail.objects.exclude(pk__in=allocations.values('detail_id')).order_by().values(
+        'product_id', 'batch_number', 'expiry_date'
+    ).annotate(total_quantity=Sum('quantity'))
+    drawn = allocations.values('product_id', 'batch_number', 'expiry_date').annotate(
+        total_quantity=-Sum('quantity')
+    )
+    balances = {}
+    for row in [*rows, *drawn]:
+        key = _batch_key(row['product_id'], row['batch_number'], row['expiry_date'])
+        # NULL and empty batch numbers are the same unbatched row
+        quantity = balances.get(key, Decimal('0')) + (row['total_quantity'] or 0)
+        balances[key] = quantity
+    return {
+        key: StockBatchBalance(product_id=key[0], batch_number=key[1], expiry_date=key[2], quantity=quantity)
+        for key, quantity in balances.items() if quantity
+    }
+
+
+def rebuild_batch_balances(batch_size=1000):
+    """
+    Replace the contents of the batch balance table with freshly aggregated
+    balances. The recorded draw-downs are kept: they are part of the history.
+    """
+    balances = aggregate_batch_balances()
+    with transaction.atomic():
+        StockBatchBalance.objects.all().delete()
+        StockBatchBalance.objects.bulk_create(balances.values(), batch_size=batch_size)
+    return len(balances)
+
+
+def find_batch_discrepancies():
+    """Return (key, stored, expected) for every batch balance that disagrees with the history"""
+    expected = aggregate_batch_balances()
+    stored = {
+        (row.product_id, row.batch_number, row.expiry_date): row
+        for row in StockBatchBalance.objects.order_by()
+    }
+
+    discrepancies = []
+    for key in expected.keys() | stored.keys():
+        want = expected.get(key)
+        have = stored.get(key)
+        want_quantity = want.quantity if want else 0
+        have_quantity = have.quantity if have else 0
+        if want_quantity != have_quantity:
+            discrepancies.append((key, have_quantity, want_quantity))
+    return sorted(discrepancies, key=lambda discrepancy: (discrepancy[0][0], discrepancy[0][1], str(discrepancy[0][2])))
+
+
+def expiring_batches(within_days, include_expired=True, today=None):
+    """
+    Batches on hand that expire within the given number of days, soonest
+    first, read from the partial expiry index. Batches already past their
+    expiry date are included unless include_expired is false.
+    """
+    today = today or timezone.localdate()
+    batches = StockBatchBalance.objects.filter(
+        quantity__gt=0, expiry_date__isnull=False, expiry_date__lte=today + timedelta(days=within_days)
+    )
+    if not include_expired:
+        batches = batches.filter(expiry_date__gte=today)
+    return batches.order_by('expiry_date', 'product_id', 'batch_number')
+
+
+def _drawdown_rank(batch, today):
+    if batch.expiry_date is None:
+        return (1 if batch.batch_number else 2, date.min, batch.batch_number)
+    return (0 if batch.expiry_date >= today else 3, batch.expiry_date, batch.batch_number)
+
+
+def drawdown_batches(product_id, today=None, include_expired=True):
+    """
+    Batches of a product in the order a stock out should draw them down:
+    unexpired batches soonest expiry first, then batches without an expiry
+    date, then stock without a batch number, and expired batches last
+    (soonest expired first) unless include_expired is false.
+    """
+    today = today or timezone.localdate()
+    batches = StockBatchBalance.objects.filter(product_id=product_id, quantity__gt=0)
+    if not include_expired:
+        batches = batches.exclude(expiry_date__lt=today)
+    return sorted(batches, key=lambda batch: _drawdown_rank(batch, today))
+
+
+def fefo_batches(product_id, today=None):
+    """Batches a stock out of the product should draw down, in order; expired batches are left out"""
+    return drawdown_batches(product_id, today, include_expired=False)
+
+
+def fefo_allocation(product_id, quantity, today=None):
+    """
+    Split a stock out of a product over its batches, first expired first out.
+    Returns (picks, shortfall): picks are (batch, quantity) pairs and the
+    shortfall is what the unexpired batches cannot cover.
+    """
+    remaining = Decimal(quantity)
+    picks = []
+    for batch in fefo_batches(product_id, today):
+        if remaining <= 0:
+            break
+        taken = min(remaining, batch.quantity)
+        picks.append((batch, taken))
+        remaining -= taken
+    return picks, max(remaining, Decimal('0'))
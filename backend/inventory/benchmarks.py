@@ -0,0 +1,444 @@
+"""
+Synthetic warehouse data and the endpoint benchmark suite.
+
+seed_benchmark_data() generates a reproducible catalogue and movement history
+with the shape of a real warehouse: a few SKUs account for most movements
+(Zipf-distributed popularity), goods are received in batches that are shipped
+oldest first, perishable categories carry expiry dates and stock never goes
+below zero. Rows are written with bulk inserts and the derived tables
+(balances, daily rollups, checkpoints, search tokens) are brought up to date
+afterwards in one pass each.
+
+run_benchmarks() requests the read endpoints through the Django test client
+and records latency percentiles, query counts and peak Python memory per
+endpoint; compare_reports() checks a report against a baseline report.
+"""
+import bisect
+import itertools
+import platform
+import random
+import time
+import tracemalloc
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.db import connection, reset_queries, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .balances import rebuild_balances
+from .batches import rebuild_batch_balances
+from .checkpoints import create_checkpoint
+from .codes import transaction_codes
+from .models import (
+    ProductMaster, ResourceVersion, SearchToken, StockBalance, StockBatchAllocation, StockBatchBalance,
+    StockCheckpoint, StockCostLayer, StockDailyMovement, StockDetail, StockMain, StockValuation
+)
+from .rollups import rebuild_rollups
+from .search import SEARCH_FIELDS, index_rows
+from .stats import invalidate_dashboard_stats
+from .valuation import rebuild_valuations
+from .versions import bump_versions
+
+# Seeded rows are recognised by these prefixes so they can be removed again
+PRODUCT_CODE_PREFIX = 'SEED-'
+REFERENCE_PREFIX = 'SEED-'
+
+CENT = Decimal('0.01')
+CATEGORIES = [
+    'Food', 'Beverages', 'Pharmacy', 'Cosmetics', 'Electronics',
+    'Hardware', 'Stationery', 'Apparel', 'Household', 'Toys',
+]
+# Receipts of these categories carry an expiry date
+PERISHABLE_CATEGORIES = {'Food', 'Beverages', 'Pharmacy', 'Cosmetics'}
+UNITS = ['PCS', 'BOX', 'KG', 'LTR', 'PACK']
+ADJECTIVES = ['Classic', 'Premium', 'Compact', 'Organic', 'Heavy Duty', 'Deluxe', 'Eco', 'Mini', 'Pro', 'Family']
+NOUNS = ['Widget', 'Bundle', 'Kit', 'Pack', 'Set', 'Case', 'Bottle', 'Carton', 'Unit', 'Refill']
+SUPPLIERS = ['Acme Supply', 'Northwind Traders', 'Globex Wholesale', 'Initech Distribution', 'Umbrella Foods']
+CUSTOMERS = ['Store 101', 'Store 102', 'Store 205', 'Online Orders', 'Wholesale Account', 'Store 310']
+# Share of transactions per type, and how many more lines a document of the type tends to have
+TYPE_WEIGHTS = {'IN': 25, 'OUT': 65, 'ADJUST': 10}
+LINE_WEIGHTS = {'IN': 3.0, 'OUT': 1.0, 'ADJUST': 0.5}
+ZIPF_EXPONENT = 1.07
+
+
+class _Catalogue:
+    """Products with Zipf popularity and the stock, in receipt order, of every batch on hand"""
+
+    def __init__(self, products, rng):
+        self.rng = rng
+        self.products = products
+        self.by_id = {product.pk: product for product in products}
+        ranks = list(range(len(products)))
+        rng.shuffle(ranks)
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in ranks))
+        self.batches = {product.pk: deque() for product in products}
+        self.stocked = []
+        self.stocked_at = {}
+
+    def popular(self):
+        return self.products[bisect.bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+
+    def any_stocked(self):
+        return self.by_id[self.rng.choice(self.stocked)] if self.stocked else None
+
+    def receive(self, product_id, quantity, batch_number, expiry_date):
+        self.batches[product_id].append([batch_number, expiry_date, quantity])
+        if product_id not in self.stocked_at:
+            self.stocked_at[product_id] = len(self.stocked)
+            self.stocked.append(product_id)
+
+    def take(self, product_id, quantity):
+        """Take up to `quantity` from the oldest batch; returns (taken, batch_number, expiry_date)"""
+        batch = self.batches[product_id][0]
+        taken = min(quantity, batch[2])
+        batch[2] -= taken
+        if batch[2] == 0:
+            self.batches[product_id].popleft()
+            if not self.batches[product_id]:
+                self._unstock(product_id)
+        return taken, batch[0], batch[1]
+
+    def _unstock(self, product_id):
+        position = self.stocked_at.pop(product_id)
+        last = self.stocked.pop()
+        if last != product_id:
+            self.stocked[position] = last
+            self.stocked_at[last] = position
+
+
+def _create_products(count, rng, batch_size):
+    start = ProductMaster.objects.filter(product_code__startswith=PRODUCT_CODE_PREFIX).count()
+    products = []
+    for number in range(start, start + count):
+        products.append(ProductMaster(
+            product_code=f"{PRODUCT_CODE_PREFIX}{number:06d}",
+            product_name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}",
+            category=rng.choice(CATEGORIES),
+            unit=rng.choice(UNITS),
+            unit_price=Decimal(str(round(rng.lognormvariate(3, 0.8), 2))).quantize(CENT),
+        ))
+    ProductMaster.objects.bulk_create(products, batch_size=batch_size)
+
+    # Backends that cannot return ids from a bulk insert need one lookup by code
+    if products and products[0].pk is None:
+        ids = dict(ProductMaster.objects.filter(
+            product_code__in=[product.product_code for product in products]
+        ).values_list('product_code', 'pk'))
+        for product in products:
+            product.pk = ids[product.product_code]
+    index_rows(SearchToken.PRODUCT, [
+        (product.pk, *(getattr(product, field) for field in SEARCH_FIELDS[SearchToken.PRODUCT]))
+        for product in products
+    ], replace=False)
+    return products
+
+
+def _transaction_dates(count, end, days, rng):
+    """Sorted transaction moments over `days` up to `end`, busier on weekdays and in working hours"""
+    start = end - timedelta(days=days)
+    dates = []
+    while len(dates) < count:
+        moment = start + timedelta(seconds=rng.random() * days * 86400)
+        if moment.weekday() >= 5 and rng.random() > 0.4:
+            continue
+        moment = moment.replace(hour=rng.randint(6, 21))
+        if moment <= end:
+            dates.append(moment)
+    return sorted(dates)
+
+
+def _lines_per_transaction(types, total_lines, rng):
+    counts = [1] * len(types)
+    weights = list(itertools.accumulate(LINE_WEIGHTS[kind] for kind in types))
+    for index in rng.choices(range(len(types)), cum_weights=weights, k=max(0, total_lines - len(types))):
+        counts[index] += 1
+    return counts
+
+
+def _document(catalogue, kind, moment, line_count, number, rng):
+    """One transaction header and its lines; an OUT or ADJUST with nothing on hand becomes a receipt"""
+    if kind != 'IN' and not catalogue.stocked:
+        kind = 'IN'
+
+    header = StockMain(
+        transaction_type=kind,
+        transaction_date=moment,
+        reference_number=f"{REFERENCE_PREFIX}{number:08d}",
+        supplier_customer=rng.choice(SUPPLIERS if kind == 'IN' else CUSTOMERS),
+        created_by='seed_benchmark_data',
+    )
+    header.transaction_code = transaction_codes.next_code(StockMain.TRANSACTION_CODE_PREFIXES[kind])
+
+    lines = []
+    total_amount = Decimal('0')
+    for line_number in range(line_count):
+        if kind == 'OUT':
+            product = catalogue.popular()
+            if product.pk not in catalogue.stocked_at:
+                product = catalogue.any_stocked()
+                if product is None:
+                    break
+            quantity, batch_number, expiry_date = catalogue.take(product.pk, rng.randint(1, 12))
+            unit_price = product.unit_price * Decimal(str(round(rng.uniform(0.95, 1.1), 2)))
+        else:
+            product = catalogue.popular()
+            quantity = rng.randint(24, 240) if kind == 'IN' else rng.randint(1, 5)
+            batch_number = f"B{moment:%y%m%d}-{product.pk}-{line_number}"
+            expiry_date = (
+                moment.date() + timedelta(days=rng.randint(30, 540))
+                if product.category in PERISHABLE_CATEGORIES else None
+            )
+            catalogue.receive(product.pk, quantity, batch_number, expiry_date)
+            unit_price = product.unit_price * Decimal(str(round(rng.uniform(0.6, 0.8), 2)))
+
+        unit_price = unit_price.quantize(CENT)
+        detail = StockDetail(
+            transaction=header,
+            product_id=product.pk,
+            quantity=Decimal(quantity),
+            unit_price=unit_price,
+            total_price=(quantity * unit_price).quantize(CENT),
+            batch_number=batch_number,
+            expiry_date=expiry_date,
+        )
+        if kind == 'OUT':
+            detail.quantity = -detail.quantity
+        total_amount += detail.total_price
+        lines.append(detail)
+
+    header.total_amount = total_amount
+    return header, lines
+
+
+def _write_documents(documents, batch_size):
+    headers = [header for header, _ in documents]
+    StockMain.objects.bulk_create(headers, batch_size=batch_size)
+    if headers and headers[0].pk is None:
+        ids = dict(StockMain.objects.filter(
+            transaction_code__in=[header.transaction_code for header in headers]
+        ).values_list('transaction_code', 'pk'))
+        for header in headers:
+            header.pk = ids[header.transaction_code]
+    for header, lines in documents:
+        for line in lines:
+            line.transaction_id = header.pk
+    StockDetail.objects.bulk_create([line for _, lines in documents for line in lines], batch_size=batch_size)
+    index_rows(SearchToken.TRANSACTION, [
+        (header.pk, *(getattr(header, field) for field in SEARCH_FIELDS[SearchToken.TRANSACTION]))
+        for header in headers
+    ], replace=False)
+
+
+def seed_benchmark_data(products=1000, transactions=20000, lines=60000, days=365, seed=42,
+                        end=None, batch_size=1000, progress=None):
+    """
+    Insert `products` products and `transactions` transactions with `lines`
+    detail lines in total, dated over the `days` days before `end`. The same
+    seed and end produce the same data. Returns the counts written.
+    """
+    rng = random.Random(seed)
+    end = end or timezone.now()
+    lines = max(lines, transactions)
+
+    with transaction.atomic():
+        catalogue = _Catalogue(_create_products(products, rng, batch_size), rng)
+        if progress:
+            progress(f"{products} products")
+
+        types = rng.choices(list(TYPE_WEIGHTS), weights=list(TYPE_WEIGHTS.values()), k=transactions)
+        dates = _transaction_dates(transactions, end, days, rng)
+        counts = _lines_per_transaction(types, lines, rng)
+        reference_start = StockMain.objects.filter(reference_number__startswith=REFERENCE_PREFIX).count()
+
+        written_lines = 0
+        documents = []
+        for number, (kind, moment, line_count) in enumerate(zip(types, dates, counts)):
+            header, document_lines = _document(catalogue, kind, moment, line_count, reference_start + number, rng)
+            documents.append((header, document_lines))
+            written_lines += len(document_lines)
+            if len(documents) == batch_size:
+                _write_documents(documents, batch_size)
+                documents = []
+                if progress:
+                    progress(f"{number + 1} transactions")
+        _write_documents(documents, batch_size)
+
+        # bulk_create skips save() and signals, so the derived tables are rebuilt in one pass each
+        rebuild_balances(batch_size=batch_size)
+        rebuild_rollups(batch_size=batch_size)
+        rebuild_batch_balances(batch_size=batch_size)
+        rebuild_valuations(batch_size=batch_size)
+        for boundary in StockCheckpoint.objects.order_by('period_end').values_list(
+            'period_end', flat=True
+        ).distinct():
+            create_checkpoint(boundary)
+        invalidate_dashboard_stats()
+        bump_versions(ResourceVersion.PRODUCTS, ResourceVersion.TRANSACTIONS, ResourceVersion.STOCK)
+
+    return {'products': products, 'transactions': transactions, 'lines': written_lines}
+
+
+def _delete_rows(queryset):
+    """Delete the rows of a queryset with one statement, without loading them or sending signals"""
+    model = queryset.model
+    subquery, params = queryset.order_by().values('pk').query.sql_with_params()
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN "
+            f"(SELECT * FROM ({subquery}) seeded)",
+            params
+        )
+        return cursor.rowcount
+
+
+def clear_benchmark_data():
+    """Delete seeded products and transactions; returns (products, transactions) deleted"""
+    transactions = StockMain.objects.filter(reference_number__startswith=REFERENCE_PREFIX)
+    products = ProductMaster.objects.filter(product_code__startswith=PRODUCT_CODE_PREFIX)
+
+    with transaction.atomic():
+        # Seeded transactions only move seeded products, whose balances, rollups, checkpoints and costs go with them
+        _delete_rows(StockDetail.objects.filter(transaction__in=transactions))
+        SearchToken.objects.filter(entity=SearchToken.TRANSACTION, object_id__in=transactions.values('pk')).delete()
+        transaction_count = _delete_rows(transactions)
+
+        SearchToken.objects.filter(entity=SearchToken.PRODUCT, object_id__in=products.values('pk')).delete()
+        for model in (
+            StockBalance, StockBatchAllocation, StockBatchBalance, StockCheckpoint, StockCostLayer,
+            StockDailyMovement, StockValuation
+        ):
+            model.objects.filter(product__in=products).delete()
+        product_count = _delete_rows(products)
+
+        invalidate_dashboard_stats()
+        bump_versions(ResourceVersion.PRODUCTS, ResourceVersion.TRANSACTIONS, ResourceVersion.STOCK)
+    return product_count, transaction_count
+
+
+# (name, path) of every benchmarked request
+ENDPOINTS = [
+    ('inventory_summary', '/api/inventory-summary/'),
+    ('inventory_summary_low_stock', '/api/inventory-summary/?low_stock_only=true&sort_by=current_stock'),
+    ('inventory_summary_page_10', '/api/inventory-summary/?page=10'),
+    ('dashboard_stats', '/api/dashboard-stats/'),
+    ('transactions', '/api/transactions/'),
+    ('transactions_out', '/api/transactions/?transaction_type=OUT'),
+]
+# Latency changes smaller than this are noise whatever the relative change
+LATENCY_NOISE_MS = 1.0
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _measure(client, path, iterations, warmup):
+    for _ in range(warmup):
+        response = client.get(path, HTTP_ACCEPT='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        client.get(path, HTTP_ACCEPT='application/json')
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    # Every request clears the query log as it starts, so count from an empty log and before the next one
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        client.get(path, HTTP_ACCEPT='application/json')
+    query_count = len(queries)
+
+    tracemalloc.start()
+    try:
+        client.get(path, HTTP_ACCEPT='application/json')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'path': path,
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p90_ms': round(percentile(latencies, 0.9), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries': query_count,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(endpoints=None, iterations=30, warmup=3, cached=False, progress=None):
+    """
+    Benchmark the read endpoints and return the report. Response and
+    dashboard caches are disabled unless `cached`, so the queries are measured.
+    """
+    overrides = {'DEBUG': False, 'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+    if not cached:
+        overrides.update(API_RESPONSE_CACHE_TIMEOUT=0, DASHBOARD_STATS_CACHE_TIMEOUT=0)
+
+    results = {}
+    with override_settings(**overrides):
+        client = Client()
+        for name, path in ENDPOINTS:
+            if endpoints and name not in endpoints:
+                continue
+            results[name] = _measure(client, path, iterations, warmup)
+            if progress:
+                progress(name, results[name])
+
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': platform.platform(),
+        },
+        'dataset': {
+            'products': ProductMaster.objects.count(),
+            'transactions': StockMain.objects.count(),
+            'lines': StockDetail.objects.count(),
+        },
+        'iterations': iterations,
+        'cached': cached,
+        'endpoints': results,
+    }
+
+
+def compare_reports(report, baseline, tolerance=0.15):
+    """
+    Compare a report with a baseline. Returns (rows, regressions), each a list
+    of (endpoint, metric, baseline value, current value) tuples; latency and
+    memory regress when they grow by more than `tolerance`, query counts when
+    they grow at all.
+    """
+    rows = []
+    regressions = []
+    for name, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms', 'queries', 'peak_memory_kb'):
+            if metric not in previous:
+                continue
+            row = (name, metric, previous[metric], current[metric])
+            rows.append(row)
+            if metric == 'queries':
+                regressed = current[metric] > previous[metric]
+            else:
+                regressed = current[metric] > previous[metric] * (1 + tolerance)
+                if metric.endswith('_ms'):
+                    regressed = regressed and current[metric] - previous[metric] >= LATENCY_NOISE_MS
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
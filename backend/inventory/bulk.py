@@ -0,0 +1,165 @@
+"""
+Bulk ingestion of stock transactions.
+
+Documents are validated independently, every referenced product is resolved
+with a single IN query, and the valid documents are written with bulk_create
+inside one database transaction together with their stock balance updates.
+Documents that would take a product's stock, or a batch they name, below
+zero are rejected.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .balances import InsufficientBatchStock, InsufficientStock, apply_movements, lock_balances
+from .batches import batch_quantities
+from .codes import transaction_codes
+from .models import ProductMaster, ResourceVersion, StockDetail, StockMain
+from .search import index_objects
+from .serializers import BulkStockMainSerializer
+from .stats import invalidate_dashboard_stats
+from .versions import bump_versions
+
+CENT = Decimal('0.01')
+
+
+def _batch_key(detail):
+    return detail.product_id, detail.batch_number or '', detail.expiry_date
+
+
+def ingest_transactions(documents, batch_size=500):
+    """
+    Validate and insert many transactions at once.
+
+    Returns one result per document, in input order, with either the created
+    transaction id and code or the validation errors of the document.
+    """
+    results = [None] * len(documents)
+    valid = []
+    for index, document in enumerate(documents):
+        serializer = BulkStockMainSerializer(data=document)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'index': index, 'success': False, 'errors': serializer.errors}
+
+    # Resolve every referenced product in one query
+    product_ids = {line['product'] for _, data in valid for line in data['details']}
+    known_products = set(
+        ProductMaster.objects.filter(pk__in=product_ids).order_by().values_list('pk', flat=True)
+    )
+
+    documents_to_write = []
+    now = timezone.now()
+    for index, data in valid:
+        missing = sorted({line['product'] for line in data['details']} - known_products)
+        if missing:
+            results[index] = {
+                'index': index,
+                'success': False,
+                'errors': {'details': [f"Unknown product id(s): {', '.join(map(str, missing))}"]},
+            }
+            continue
+
+        details = data.pop('details')
+        header = StockMain(**data)
+        if header.transaction_date is None:
+            header.transaction_date = now
+        prefix = StockMain.TRANSACTION_CODE_PREFIXES.get(header.transaction_type, 'TXN')
+        header.transaction_code = transaction_codes.next_code(prefix)
+
+        total_amount = Decimal('0')
+        document_lines = []
+        for line in details:
+            detail = StockDetail(
+                transaction=header,
+                product_id=line['product'],
+                quantity=line['quantity'],
+                unit_price=line['unit_price'],
+                total_price=(line['quantity'] * line['unit_price']).quantize(CENT),
+                batch_number=line.get('batch_number'),
+                expiry_date=line.get('expiry_date'),
+                notes=line.get('notes'),
+            )
+            # For stock out transactions, make quantity negative
+            if header.transaction_type == 'OUT':
+                detail.quantity = -abs(detail.quantity)
+            total_amount += detail.total_price
+            document_lines.append(detail)
+        header.total_amount = total_amount
+        documents_to_write.append((index, header, document_lines))
+
+    with transaction.atomic():
+        # Documents are accepted in input order while the stock they take out is available
+        headers = []
+        lines = []
+        taken_out = {
+            detail.product_id for _, _, document_lines in documents_to_write
+            for detail in document_lines if detail.quantity < 0
+        }
+        available = lock_balances(taken_out)
+        # Batches named by a stock out may not go below zero either; receipts in earlier documents count
+        batches_available = batch_quantities(
+            _batch_key(detail) for _, _, document_lines in documents_to_write
+            for detail in document_lines if detail.quantity < 0 and detail.batch_number
+        )
+        for index, header, document_lines in documents_to_write:
+            changes = {}
+            batch_changes = {}
+            for detail in document_lines:
+                changes[detail.product_id] = changes.get(detail.product_id, Decimal('0')) + detail.quantity
+                key = _batch_key(detail)
+                if key in batches_available:
+                    batch_changes[key] = batch_changes.get(key, Decimal('0')) + detail.quantity
+            short = [
+                InsufficientStock(product_id, available.get(product_id, Decimal('0')), -change)
+                for product_id, change in sorted(changes.items())
+                if change < 0 and available.get(product_id, Decimal('0')) + change < 0
+            ]
+            short.extend(
+                InsufficientBatchStock(*key, batches_available[key], -change)
+                for key, change in sorted(batch_changes.items(), key=lambda item: (item[0][0], item[0][1]))
+                if change < 0 and batches_available[key] + change < 0
+            )
+            if short:
+                results[index] = {
+                    'index': index,
+                    'success': False,
+                    'errors': {'details': [str(error) for error in short]},
+                }
+                continue
+            for product_id, change in changes.items():
+                if product_id in taken_out:
+                    available[product_id] = available.get(product_id, Decimal('0')) + change
+            for key, change in batch_changes.items():
+                batches_available[key] += change
+            headers.append((index, header))
+            lines.extend(document_lines)
+
+        StockMain.objects.bulk_create([header for _, header in headers], batch_size=batch_size)
+
+        # Backends that cannot return ids from a bulk insert need one lookup by code
+        if headers and headers[0][1].pk is None:
+            ids = dict(StockMain.objects.filter(
+                transaction_code__in=[header.transaction_code for _, header in headers]
+            ).values_list('transaction_code', 'pk'))
+            for _, header in headers:
+                header.pk = ids[header.transaction_code]
+
+        StockDetail.objects.bulk_create(lines, batch_size=batch_size)
+
+        # bulk_create skips save() and signals, so balances, search tokens and caches are updated here
+        apply_movements(lines)
+        index_objects([header for _, header in headers])
+        invalidate_dashboard_stats()
+        bump_versions(ResourceVersion.TRANSACTIONS, ResourceVersion.STOCK)
+
+    for index, header in headers:
+        results[index] = {
+            'index': index,
+            'success': True,
+            'transaction_id': header.pk,
+            'transaction_code': header.transaction_code,
+        }
+    return results
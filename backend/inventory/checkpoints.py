@@ -0,0 +1,276 @@
+"""
+Point-in-time stock from periodic balance checkpoints (stckchkpt).
+
+A checkpoint stores the closing balance of every product with movements
+before a period boundary. The stock of a product as of a moment is read from
+the latest checkpoint at or before it plus the movements dated between that
+boundary and the moment, so historical queries only touch one period of
+history instead of all of it.
+
+Every product that has moved before a boundary has a row at that boundary,
+and movements dated before existing boundaries (backdated entries, edits and
+deletes) are applied to those rows as they are written.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    DateTimeField, DecimalField, ExpressionWrapper, F, Max, OuterRef, Subquery, Sum, Value
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import StockCheckpoint, StockDetail
+
+CENT = Decimal('0.01')
+PERIODS = ('month', 'week')
+
+# Lower bound of the movement window for products without a checkpoint
+BEGINNING = datetime(1900, 1, 1, tzinfo=timezone.utc)
+
+
+def _line_value():
+    return ExpressionWrapper(
+        F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=16, decimal_places=2)
+    )
+
+
+def parse_as_of(value):
+    """
+    Turn an as_of parameter into the exclusive upper bound of the movements it
+    covers: a date means the end of that day, a datetime includes that instant.
+    Raises ValueError when the value is not a date or datetime.
+    """
+    # parse_datetime() also accepts a bare date, so dates are tried first
+    day = parse_date(value)
+    if day is not None:
+        return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError("as_of must be a date (YYYY-MM-DD) or an ISO 8601 datetime.")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment + timedelta(microseconds=1)
+
+
+def period_boundaries(start, end, period='month'):
+    """Period boundaries after start and up to end (inclusive), in the current time zone"""
+    start = timezone.localtime(start)
+    if period == 'week':
+        boundary = datetime.combine(start.date() - timedelta(days=start.weekday()), time.min)
+        step = lambda day: day + timedelta(days=7)
+    else:
+        boundary = datetime.combine(start.date().replace(day=1), time.min)
+        step = lambda day: (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    boundary = timezone.make_aware(step(boundary))
+    while boundary <= end:
+        yield boundary
+        boundary = timezone.make_aware(step(timezone.make_naive(boundary)))
+
+
+def latest_boundary(before):
+    """The latest checkpoint boundary at or before the given moment, or None"""
+    return StockCheckpoint.objects.filter(period_end__lte=before).aggregate(
+        last=Max('period_end')
+    )['last']
+
+
+def stock_as_of(product_id, before):
+    """Quantity, value and last movement date of a product from movements dated before `before`"""
+    boundary = latest_boundary(before)
+    checkpoint = None
+    if boundary is not None:
+        checkpoint = StockCheckpoint.objects.filter(product_id=product_id, period_end=boundary).order_by().first()
+
+    delta = StockDetail.objects.filter(
+        product_id=product_id,
+        transaction__transaction_date__gte=boundary or BEGINNING,
+        transaction__transaction_date__lt=before,
+    ).aggregate(
+        total_quantity=Sum('quantity'), total_value=Sum(_line_value()), last=Max('transaction__transaction_date')
+    )
+
+    quantity = (checkpoint.quantity if checkpoint else Decimal('0')) + (delta['total_quantity'] or 0)
+    stock_value = (checkpoint.stock_value if checkpoint else Decimal('0')) + (delta['total_value'] or 0)
+    return {
+        'checkpoint': boundary,
+        'quantity': quantity,
+        'stock_value': stock_value,
+        'last_movement_date': delta['last'] or (checkpoint.last_movement_date if checkpoint else None),
+    }
+
+
+def annotate_stock_as_of(queryset, before):
+    """
+    Annotate a product queryset with current_stock and last_movement_date as
+    of `before`: the checkpoint at the latest boundary plus the movements since.
+    """
+    boundary = latest_boundary(before)
+    checkpoint = StockCheckpoint.objects.filter(product=OuterRef('pk'), period_end=boundary).order_by()
+    movements = StockDetail.objects.filter(
+        product=OuterRef('pk'),
+        transaction__transaction_date__gte=boundary or BEGINNING,
+        transaction__transaction_date__lt=before,
+    ).order_by().values('product')
+    quantity_field = DecimalField(max_digits=14, decimal_places=2)
+
+    return queryset.annotate(
+        current_stock=ExpressionWrapper(
+            Coalesce(Subquery(checkpoint.values('quantity')[:1]), Value(Decimal('0')), output_field=quantity_field)
+            + Coalesce(
+                Subquery(movements.annotate(total=Sum('quantity')).values('total')),
+                Value(Decimal('0')), output_field=quantity_field
+            ),
+            output_field=quantity_field
+        ),
+        last_movement_date=Coalesce(
+            Subquery(movements.annotate(last=Max('transaction__transaction_date')).values('last')),
+            Subquery(checkpoint.values('last_movement_date')[:1]),
+            output_field=DateTimeField()
+        ),
+    )
+
+
+def _boundaries_after(movement_date):
+    return list(
+        StockCheckpoint.objects.filter(period_end__gt=movement_date)
+        .order_by().values_list('period_end', flat=True).distinct()
+    )
+
+
+def apply_to_checkpoints(product_id, quantity, value, movement_date):
+    """Add a movement to the checkpoints taken after its date"""
+    boundaries = _boundaries_after(movement_date)
+    if not boundaries:
+        return
+
+    # The product may have had no history when those checkpoints were taken
+    existing = set(StockCheckpoint.objects.filter(
+        product_id=product_id, period_end__in=boundaries
+    ).values_list('period_end', flat=True))
+    StockCheckpoint.objects.bulk_create([
+        StockCheckpoint(product_id=product_id, period_end=boundary)
+        for boundary in boundaries if boundary not in existing
+    ])
+
+    StockCheckpoint.objects.filter(product_id=product_id, period_end__gt=movement_date).update(
+        quantity=F('quantity') + quantity,
+        stock_value=F('stock_value') + value,
+        last_movement_date=Greatest(
+            Coalesce(F('last_movement_date'), Value(movement_date)),
+            Value(movement_date)
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def revert_from_checkpoints(product_id, quantity, value, movement_date):
+    """Remove a movement from the checkpoints taken after its date"""
+    checkpoints = StockCheckpoint.objects.filter(product_id=product_id, period_end__gt=movement_date)
+    if not checkpoints.update(
+        quantity=F('quantity') - quantity,
+        stock_value=F('stock_value') - value,
+        updated_at=timezone.now(),
+    ):
+        return
+
+    for checkpoint in checkpoints.only('period_end'):
+        last = StockDetail.objects.filter(
+            product_id=product_id, transaction__transaction_date__lt=checkpoint.period_end
+        ).aggregate(last=Max('transaction__transaction_date'))['last']
+        StockCheckpoint.objects.filter(pk=checkpoint.pk).update(last_movement_date=last)
+
+
+def apply_details_to_checkpoints(details):
+    """Apply stock details written without save() that are dated before a checkpoint"""
+    latest = StockCheckpoint.objects.aggregate(last=Max('period_end'))['last']
+    if latest is None:
+        return
+    for detail in details:
+        movement_date = detail.transaction.transaction_date
+        if movement_date < latest:
+            apply_to_checkpoints(
+                detail.product_id, Decimal(detail.quantity),
+                Decimal(detail.quantity) * Decimal(detail.unit_price), movement_date
+            )
+
+
+def create_checkpoint(period_end):
+    """
+    Write the closing balances at one boundary from the previous boundary's
+    checkpoints plus the movements in between; returns the number of rows.
+    """
+    with transaction.atomic():
+        previous = StockCheckpoint.objects.filter(period_end__lt=period_end).aggregate(
+            last=Max('period_end')
+        )['last']
+
+        closing = {}
+        if previous is not None:
+            for row in StockCheckpoint.objects.filter(period_end=previous).values(
+                'product_id', 'quantity', 'stock_value', 'last_movement_date'
+            ):
+                closing[row['product_id']] = [row['quantity'], row['stock_value'], row['last_movement_date']]
+
+        movements = StockDetail.objects.filter(
+            transaction__transaction_date__gte=previous or BEGINNING,
+            transaction__transaction_date__lt=period_end,
+        ).order_by().values('product_id').annotate(
+            total_quantity=Sum('quantity'),
+            total_value=Sum(_line_value()),
+            last_date=Max('transaction__transaction_date'),
+        )
+        for row in movements:
+            quantity, stock_value, _ = closing.get(row['product_id'], [Decimal('0'), Decimal('0'), None])
+            closing[row['product_id']] = [
+                quantity + (row['total_quantity'] or 0),
+                stock_value + (row['total_value'] or 0),
+                row['last_date'],
+            ]
+
+        StockCheckpoint.objects.filter(period_end=period_end).delete()
+        StockCheckpoint.objects.bulk_create([
+            StockCheckpoint(
+                product_id=product_id,
+                period_end=period_end,
+                quantity=quantity,
+                stock_value=stock_value,
+                last_movement_date=last_date,
+            )
+            for product_id, (quantity, stock_value, last_date) in closing.items()
+        ], batch_size=1000)
+    return len(closing)
+
+
+def find_checkpoint_discrepancies():
+    """Return (product_id, period_end, stored, expected) for checkpoints that disagree with the history"""
+    discrepancies = []
+    for boundary in StockCheckpoint.objects.order_by('period_end').values_list('period_end', flat=True).distinct():
+        expected = {
+            row['product_id']: (
+                row['total_quantity'] or 0, Decimal(row['total_value'] or 0).quantize(CENT), row['last_date']
+            )
+            for row in StockDetail.objects.filter(transaction__transaction_date__lt=boundary)
+            .order_by().values('product_id').annotate(
+                total_quantity=Sum('quantity'),
+                total_value=Sum(_line_value()),
+                last_date=Max('transaction__transaction_date'),
+            )
+        }
+        stored = {
+            row[0]: row[1:]
+            for row in StockCheckpoint.objects.filter(period_end=boundary).values_list(
+                'product_id', 'quantity', 'stock_value', 'last_movement_date'
+            )
+        }
+        for product_id in expected.keys() | stored.keys():
+            want = expected.get(product_id, (0, 0, None))
+            have = stored.get(product_id, (0, 0, None))
+            if want != have:
+                discrepancies.append((product_id, boundary, have, want))
+    return sorted(discrepancies)
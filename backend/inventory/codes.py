@@ -0,0 +1,106 @@
+"""
+Transaction code allocation.
+
+Numbers are handed out from blocks reserved in the stckseq table, so a worker
+process only touches the database once per block. The counter is advanced
+with a single UPDATE, which row-locks on PostgreSQL and takes the database
+write lock on SQLite, so two workers can never reserve the same block.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TransactionCodeSequence
+
+
+class _Block:
+    """A reserved range of numbers [next_value, end) for one prefix"""
+
+    def __init__(self, start, end, using):
+        self.next_value = start
+        self.end = end
+        self.using = using
+        self.committed = False
+        # Keep one bound method so it can be found again among pending callbacks
+        self.confirm = self._confirm
+
+    def _confirm(self):
+        self.committed = True
+
+    @property
+    def exhausted(self):
+        return self.next_value >= self.end
+
+    @property
+    def valid(self):
+        """
+        False once the transaction that reserved the block has been rolled
+        back, since the counter update went with it and the numbers may be
+        handed to another worker.
+        """
+        if self.committed:
+            return True
+        pending = connections[self.using].run_on_commit
+        return any(entry[1] is self.confirm for entry in pending)
+
+    def take(self):
+        value = self.next_value
+        self.next_value += 1
+        return value
+
+
+class TransactionCodeAllocator:
+    """Hands out unique transaction codes from per-thread blocks of reserved numbers"""
+
+    def __init__(self, block_size=None):
+        self._block_size = block_size
+        self._local = threading.local()
+
+    @property
+    def block_size(self):
+        return self._block_size or settings.TRANSACTION_CODE_BLOCK_SIZE
+
+    def next_code(self, prefix):
+        """Return the next code for the prefix, e.g. IN2025072800000042"""
+        return self.format_code(prefix, self.next_value(prefix))
+
+    def next_value(self, prefix):
+        # Django connections are per thread, and so are the blocks reserved through them
+        blocks = getattr(self._local, 'blocks', None)
+        if blocks is None:
+            blocks = self._local.blocks = {}
+
+        block = blocks.get(prefix)
+        if block is None or block.exhausted or not block.valid:
+            block = blocks[prefix] = self._reserve(prefix)
+        return block.take()
+
+    @staticmethod
+    def format_code(prefix, value):
+        return f"{prefix}{timezone.now().strftime('%Y%m%d')}{value:08d}"
+
+    def _reserve(self, prefix):
+        size = self.block_size
+        using = router.db_for_write(TransactionCodeSequence)
+        sequences = TransactionCodeSequence.objects.using(using)
+
+        with transaction.atomic(using=using):
+            # Write before reading: SQLite cannot upgrade a read lock while another writer waits
+            advance = {'next_value': F('next_value') + size, 'updated_at': timezone.now()}
+            if not sequences.filter(prefix=prefix).update(**advance):
+                sequences.get_or_create(prefix=prefix)
+                sequences.filter(prefix=prefix).update(**advance)
+            end = sequences.filter(prefix=prefix).values_list('next_value', flat=True).get()
+
+        block = _Block(end - size, end, using)
+        if connections[using].in_atomic_block:
+            transaction.on_commit(block.confirm, using=using)
+        else:
+            block.confirm()
+        return block
+
+
+transaction_codes = TransactionCodeAllocator()
@@ -0,0 +1,127 @@
+"""
+Conditional GET for the read-heavy endpoints.
+
+The ETag of a response is derived from the request (view, path with query
+string, negotiated media type) and the version counters of the resources the
+response depends on, so it is known after one primary key lookup. A matching
+If-None-Match (or a fresh If-Modified-Since) is answered with 304 Not
+Modified before the view builds a queryset. Otherwise the rendered response
+is served from the cache under its ETag, and only rendered when missing. The
+counters' nonces are part of the ETag, so a cache that outlives its database
+(flushed, restored or a new test database) never serves the old bodies.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .parallel import run_query
+from .versions import get_versions
+
+CACHE_KEY_PREFIX = 'inventory:response:'
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified support for API views whose responses only change when
+    one of `version_resources` is written. Views whose responses also depend
+    on the clock set `version_lifetime` to the seconds a response stays valid,
+    and views whose bodies carry the time they are served at set
+    `cache_responses` to false to keep the 304s but render every 200. Wrap a
+    GET handler with conditional_get(), or aconditional_get() in async
+    views.
+    """
+    version_resources = ()
+    version_lifetime = None
+    cache_responses = True
+
+    def get_etag(self, request, versions):
+        parts = [
+            type(self).__name__,
+            getattr(self, 'action', None) or '',
+            request.get_full_path(),
+            getattr(request, 'accepted_media_type', None) or '',
+        ]
+        parts += [f"{name}:{nonce}:{version}" for name, (version, _, nonce) in sorted(versions.items())]
+        if self.version_lifetime:
+            parts += [str(timezone.localdate()), str(int(time.time() // self.version_lifetime))]
+        return '"%s"' % hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def get_last_modified(self, versions):
+        moments = [updated_at.timestamp() for _, updated_at, _ in versions.values() if updated_at]
+        if self.version_lifetime:
+            moments.append(time.time() // self.version_lifetime * self.version_lifetime)
+        return int(max(moments)) if moments else None
+
+    def get_cache_key(self, etag, versions):
+        if not self.cache_responses:
+            return None
+        # Without a counter row there is no nonce to tell this database's responses from another's
+        if not all(nonce for _, _, nonce in versions.values()):
+            return None
+        return CACHE_KEY_PREFIX + etag.strip('"')
+
+    def conditional_get(self, request, handler, *args, **kwargs):
+        versions = get_versions(self.version_resources)
+        etag = self.get_etag(request, versions)
+        last_modified = self.get_last_modified(versions)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = self.get_cache_key(etag, versions)
+            response = self.cached_response(key, handler, request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    async def aconditional_get(self, request, handler, *args, **kwargs):
+        """conditional_get() for async views; `handler` is a coroutine function"""
+        versions = await run_query(get_versions, self.version_resources)
+        etag = self.get_etag(request, versions)
+        last_modified = self.get_last_modified(versions)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = self.get_cache_key(etag, versions)
+            response = await self.acached_response(key, handler, request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def set_validators(self, response, etag, last_modified):
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Clients may keep the response but have to revalidate it on every use
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+    def cached_response(self, key, handler, request, *args, **kwargs):
+        if key is None:
+            return handler(request, *args, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'render'):
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+            cache.set(key, (response.content, response['Content-Type']), settings.API_RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    async def acached_response(self, key, handler, request, *args, **kwargs):
+        if key is None:
+            return await handler(request, *args, **kwargs)
+        cached = await cache.aget(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(key, (response.content, response['Content-Type']), settings.API_RESPONSE_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,85 @@
+"""
+Row count estimates for the admin change lists.
+
+A change list counts its rows to number its pages, and a COUNT(*) reads the
+whole table (or the whole filtered range), so on tables with millions of
+stock details it costs more than the page itself. PostgreSQL keeps an
+estimate of every table's size in pg_class and can estimate the rows a
+filtered query returns from its plan; SQLite keeps table sizes in
+sqlite_stat1 once ANALYZE has run (partial indexes, which only count the rows
+they cover, are left out). Small results are still counted exactly.
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def _postgresql_estimate(queryset, connection):
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            # -1 until the table has been vacuumed or analyzed
+            return row[0] if row and row[0] >= 0 else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _sqlite_estimate(queryset, connection):
+    # Only whole tables have a size in the statistics
+    if queryset.query.where:
+        return None
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            return None
+        # A partial index only counts the rows it covers
+        cursor.execute(
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND (idx IS NULL OR idx NOT IN "
+            "(SELECT name FROM pragma_index_list(%s) WHERE partial))",
+            [table, table]
+        )
+        rows = cursor.fetchall()
+    # The first number of an index's statistics is the number of rows in the table
+    return max(int(row[0].split()[0]) for row in rows) if rows else None
+
+
+ESTIMATORS = {
+    'postgresql': _postgresql_estimate,
+    'sqlite': _sqlite_estimate,
+}
+
+
+def estimated_count(queryset):
+    """Estimated number of rows of the queryset, or None when the database cannot tell"""
+    connection = connections[queryset.db]
+    estimator = ESTIMATORS.get(connection.vendor)
+    if estimator is None or queryset.query.distinct or queryset.query.combinator:
+        return None
+    return estimator(queryset, connection)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting large results from the database's estimate instead of
+    a COUNT(*). Results estimated below ADMIN_ESTIMATED_COUNT_THRESHOLD rows,
+    or that cannot be estimated, are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return self.object_list.count()
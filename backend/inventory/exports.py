@@ -0,0 +1,119 @@
+"""
+Streaming CSV and newline-delimited JSON exports.
+
+Rows are read as values_list() tuples through a chunked iterator and written
+to the response as they arrive, so an export never builds model instances
+or holds more than one chunk of rows in memory.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (column name, field path) of each export
+TRANSACTION_COLUMNS = [
+    ('transaction_id', 'transaction_id'),
+    ('transaction_code', 'transaction_code'),
+    ('transaction_type', 'transaction_type'),
+    ('transaction_date', 'transaction_date'),
+    ('reference_number', 'reference_number'),
+    ('supplier_customer', 'supplier_customer'),
+    ('total_amount', 'total_amount'),
+    ('created_by', 'created_by'),
+    ('detail_id', 'details__detail_id'),
+    ('product_id', 'details__product_id'),
+    ('product_code', 'details__product__product_code'),
+    ('product_name', 'details__product__product_name'),
+    ('quantity', 'details__quantity'),
+    ('unit_price', 'details__unit_price'),
+    ('total_price', 'details__total_price'),
+    ('batch_number', 'details__batch_number'),
+    ('expiry_date', 'details__expiry_date'),
+]
+
+STOCK_DETAIL_COLUMNS = [
+    ('detail_id', 'detail_id'),
+    ('transaction_id', 'transaction_id'),
+    ('transaction_code', 'transaction__transaction_code'),
+    ('transaction_type', 'transaction__transaction_type'),
+    ('transaction_date', 'transaction__transaction_date'),
+    ('product_id', 'product_id'),
+    ('product_code', 'product__product_code'),
+    ('product_name', 'product__product_name'),
+    ('quantity', 'quantity'),
+    ('unit_price', 'unit_price'),
+    ('total_price', 'total_price'),
+    ('batch_number', 'batch_number'),
+    ('expiry_date', 'expiry_date'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+]
+
+STOCK_MOVEMENT_COLUMNS = [
+    ('transaction_id', 'transaction_id'),
+    ('transaction_code', 'transaction__transaction_code'),
+    ('transaction_type', 'transaction__transaction_type'),
+    ('transaction_date', 'transaction__transaction_date'),
+    ('quantity', 'quantity'),
+    ('unit_price', 'unit_price'),
+    ('total_price', 'total_price'),
+    ('reference_number', 'transaction__reference_number'),
+    ('notes', 'notes'),
+]
+
+
+def get_export_format(request):
+    """The requested export format, or None when it is not supported"""
+    export_format = request.query_params.get('export_format', 'csv').lower()
+    return export_format if export_format in EXPORT_FORMATS else None
+
+
+def invalid_format_message():
+    return f"export_format must be one of: {', '.join(EXPORT_FORMATS)}"
+
+
+class _Echo:
+    """File-like object whose write() hands the written line back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(names, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(names, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(names, rows, export_format):
+    """The lines of a CSV or NDJSON export of the rows, generated one row at a time"""
+    return _csv_lines(names, rows) if export_format == 'csv' else _ndjson_lines(names, rows)
+
+
+def export_rows(queryset, columns, chunk_size=2000):
+    """(column names, row iterator) of the columns of the queryset"""
+    names = [name for name, _ in columns]
+    return names, queryset.values_list(*(path for _, path in columns)).iterator(chunk_size=chunk_size)
+
+
+def stream_export(queryset, columns, export_format, basename, chunk_size=2000):
+    """Stream the columns of the queryset as a CSV or NDJSON attachment"""
+    lines = export_lines(*export_rows(queryset, columns, chunk_size), export_format)
+
+    filename = f"{basename}-{timezone.now().strftime('%Y%m%d%H%M%S')}.{export_format}"
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
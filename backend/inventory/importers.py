@@ -0,0 +1,214 @@
+"""
+High-volume product catalogue import.
+
+The CSV file is read row by row and processed in chunks: each chunk is
+validated in Python, its existing product codes are resolved with one IN
+query, and the whole chunk is written with one prepared
+INSERT ... ON CONFLICT (product_code) DO UPDATE statement run through
+executemany(). That is the statement bulk_create(update_conflicts=True)
+emits, without compiling SQL and preparing every value through the ORM.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .balances import refresh_reorder_flags
+from .models import LOW_STOCK_THRESHOLD, ProductMaster, ResourceVersion, SearchToken
+from .search import index_rows
+from .stats import invalidate_dashboard_stats
+from .versions import bump_versions
+
+IMPORT_COLUMNS = [
+    'product_code', 'product_name', 'description', 'category', 'unit', 'unit_price',
+    'reorder_point', 'reorder_quantity', 'is_active'
+]
+DECIMAL_COLUMNS = ['unit_price', 'reorder_point', 'reorder_quantity']
+# Digits and decimal places allowed by the model fields, checked before the raw upsert reaches the database
+DECIMAL_VALIDATORS = {
+    column: DecimalValidator(field.max_digits, field.decimal_places)
+    for column, field in ((column, ProductMaster._meta.get_field(column)) for column in DECIMAL_COLUMNS)
+}
+REQUIRED_COLUMNS = ['product_code', 'product_name']
+MAX_LENGTHS = {'product_code': 50, 'product_name': 200, 'category': 100, 'unit': 20}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'active'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'inactive'}
+DEFAULTS = {
+    'description': None, 'category': None, 'unit': 'PCS', 'unit_price': Decimal('0.00'),
+    'reorder_point': Decimal(LOW_STOCK_THRESHOLD), 'reorder_quantity': Decimal('0.00'), 'is_active': True
+}
+
+
+class ImportResult:
+    """Running totals of an import, including the rejected rows"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.rejected = []
+
+    @property
+    def processed(self):
+        return self.created + self.updated + len(self.rejected)
+
+    def as_dict(self, max_rejected=100):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'rejected': len(self.rejected),
+            'rejected_rows': [
+                {'line': line, 'product_code': code, 'errors': errors}
+                for line, code, errors in self.rejected[:max_rejected]
+            ],
+        }
+
+
+def _clean_row(row, columns):
+    """Return (product fields, errors) for one CSV row"""
+    values = {}
+    errors = []
+    for column in columns:
+        value = (row.get(column) or '').strip()
+        if column in MAX_LENGTHS and len(value) > MAX_LENGTHS[column]:
+            errors.append(f"{column} is longer than {MAX_LENGTHS[column]} characters.")
+        values[column] = value
+
+    for column in REQUIRED_COLUMNS:
+        if not values.get(column):
+            errors.append(f"{column} is required.")
+
+    if 'description' in values:
+        values['description'] = values['description'] or None
+    if 'category' in values:
+        values['category'] = values['category'] or None
+    if 'unit' in values:
+        values['unit'] = values['unit'] or 'PCS'
+    for column in DECIMAL_COLUMNS:
+        if column not in values:
+            continue
+        label = column.replace('_', ' ').capitalize()
+        try:
+            values[column] = Decimal(values[column] or DEFAULTS[column]).quantize(Decimal('0.01'))
+            if values[column] < 0:
+                errors.append(f"{label} cannot be negative.")
+            DECIMAL_VALIDATORS[column](values[column])
+        except InvalidOperation:
+            errors.append(f"{label} must be a number.")
+        except ValidationError as e:
+            errors.extend(f"{label}: {message}" for message in e.messages)
+    if 'is_active' in values:
+        flag = values['is_active'].lower()
+        if flag in TRUE_VALUES or not flag:
+            values['is_active'] = True
+        elif flag in FALSE_VALUES:
+            values['is_active'] = False
+        else:
+            errors.append("is_active must be true or false.")
+
+    return values, errors
+
+
+def _upsert_statement(columns):
+    """INSERT ... ON CONFLICT (product_code) DO UPDATE for the imported columns"""
+    quote = connection.ops.quote_name
+    insert_columns = IMPORT_COLUMNS + ['needs_reorder', 'created_at', 'updated_at']
+    update_columns = [column for column in columns if column != 'product_code'] + ['updated_at']
+    return (
+        f"INSERT INTO {quote(ProductMaster._meta.db_table)} "
+        f"({', '.join(quote(column) for column in insert_columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(insert_columns))}) "
+        f"ON CONFLICT ({quote('product_code')}) DO UPDATE SET "
+        + ', '.join(f"{quote(column)} = EXCLUDED.{quote(column)}" for column in update_columns)
+    )
+
+
+def _write_chunk(chunk, columns, result, dry_run):
+    """Upsert one chunk of cleaned rows keyed on product_code"""
+    codes = list(chunk)
+    existing = dict(
+        ProductMaster.objects.filter(product_code__in=codes).order_by().values_list('product_code', 'product_name')
+    )
+    result.updated += len(existing)
+    result.created += len(codes) - len(existing)
+    if dry_run:
+        return
+
+    # Columns missing from the file take the model defaults on insert and are left alone on update
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = []
+    for values in chunk.values():
+        row = [values.get(column, DEFAULTS.get(column)) for column in IMPORT_COLUMNS]
+        # New products have no stock, so they need reordering whenever their reorder point is above zero
+        rows.append(row + [row[IMPORT_COLUMNS.index('reorder_point')] > 0, now, now])
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(_upsert_statement(columns), rows)
+
+        # Only new and renamed products need search tokens. Upserts do not return
+        # primary keys on every backend, so those products are looked up by code.
+        if 'reorder_point' in columns and existing:
+            refresh_reorder_flags(
+                ProductMaster.objects.filter(product_code__in=list(existing)).values_list('pk', flat=True)
+            )
+
+        created = [code for code in codes if code not in existing]
+        renamed = [
+            code for code in existing
+            if chunk[code].get('product_name', existing[code]) != existing[code]
+        ]
+        for reindex, replace in ((created, False), (renamed, True)):
+            if reindex:
+                index_rows(SearchToken.PRODUCT, list(
+                    ProductMaster.objects.filter(product_code__in=reindex).order_by().values_list(
+                        'pk', 'product_code', 'product_name'
+                    )
+                ), replace=replace)
+
+
+def import_products(text_file, chunk_size=5000, dry_run=False, progress=None):
+    """
+    Import products from a CSV text stream with a header row.
+
+    Rows whose product_code already exists update that product; only the
+    columns present in the file are overwritten. Invalid rows are collected
+    in the result instead of aborting the import. `progress` is called with
+    the running result after every chunk.
+    """
+    reader = csv.DictReader(text_file)
+    header = [name.strip() for name in (reader.fieldnames or [])]
+    reader.fieldnames = header
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+    columns = [column for column in IMPORT_COLUMNS if column in header]
+
+    result = ImportResult()
+    chunk = {}
+    for row in reader:
+        values, errors = _clean_row(row, columns)
+        if errors:
+            # line_num counts the header as line 1
+            result.rejected.append((reader.line_num, values.get('product_code', ''), errors))
+            continue
+
+        # A code repeated within the file keeps its last row
+        chunk[values['product_code']] = values
+        if len(chunk) >= chunk_size:
+            _write_chunk(chunk, columns, result, dry_run)
+            chunk = {}
+            if progress:
+                progress(result)
+
+    if chunk:
+        _write_chunk(chunk, columns, result, dry_run)
+    if progress:
+        progress(result)
+
+    if not dry_run:
+        invalidate_dashboard_stats()
+        bump_versions(ResourceVersion.PRODUCTS)
+    return result
@@ -0,0 +1,92 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/api/dashboard-stats/', '/api/inventory-summary/', '/api/health/']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare read endpoint latency under concurrent load between a running WSGI "
+        "and a running ASGI deployment"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://127.0.0.1:8000', help="Base URL of the WSGI deployment")
+        parser.add_argument('--asgi', default='http://127.0.0.1:8001', help="Base URL of the ASGI deployment")
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help=f"Path to request, repeatable (default: {', '.join(DEFAULT_PATHS)})"
+        )
+        parser.add_argument('--concurrency', type=int, default=32, help="Requests in flight at once")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per path and deployment")
+        parser.add_argument(
+            '--bust-cache', action='store_true',
+            help="Add a unique query parameter to every request so cached responses are not reused"
+        )
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        deployments = {'wsgi': options['wsgi'].rstrip('/'), 'asgi': options['asgi'].rstrip('/')}
+        results = []
+        for path in options['paths'] or DEFAULT_PATHS:
+            for name, base_url in deployments.items():
+                self.request(base_url + path, options)  # warm up connections and caches
+                results.append({'path': path, 'deployment': name, **self.measure(base_url + path, options)})
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results, options)
+
+        failed = [result for result in results if result['errors']]
+        if failed:
+            raise CommandError(
+                "Requests failed: " + "; ".join(f"{r['deployment']} {r['path']}: {r['errors']}" for r in failed)
+            )
+
+    def request(self, url, options, number=0):
+        if options['bust_cache']:
+            url += ('&' if '?' in url else '?') + f"_bench={time.time_ns()}-{number}"
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers={'Accept': 'application/json'}), timeout=30) as response:
+                response.read()
+                status = response.status
+        except HTTPError as e:
+            status = e.code
+        except URLError as e:
+            raise CommandError(f"Cannot reach {url}: {e.reason}")
+        return status, time.perf_counter() - started
+
+    def measure(self, url, options):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            outcomes = list(pool.map(lambda number: self.request(url, options, number), range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in outcomes)
+        percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+        return {
+            'requests': len(outcomes),
+            'errors': sum(1 for status, _ in outcomes if status >= 400),
+            'requests_per_second': round(len(outcomes) / elapsed, 1),
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(latencies[-1] * 1000, 2),
+        }
+
+    def report(self, results, options):
+        self.stdout.write(
+            f"{options['requests']} requests per path and deployment, {options['concurrency']} concurrent"
+        )
+        self.stdout.write(f"{'path':<32} {'server':<6} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for result in results:
+            self.stdout.write(
+                f"{result['path']:<32} {result['deployment']:<6} {result['requests_per_second']:>8} "
+                f"{result['p50_ms']:>9} {result['p99_ms']:>9} {result['max_ms']:>9}"
+            )
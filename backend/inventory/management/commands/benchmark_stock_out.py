@@ -0,0 +1,122 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from inventory.balances import InsufficientStock, lock_balances
+from inventory.models import ProductMaster, StockBalance, StockDetail, StockMain
+
+
+class Command(BaseCommand):
+    help = (
+        "Ship a product from many threads at once and check that stock never goes negative; "
+        "reports stock-out throughput under contention"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent pickers")
+        parser.add_argument('--orders', type=int, default=200, help="Stock-out transactions attempted in total")
+        parser.add_argument('--stock', type=int, default=100, help="Units received before shipping starts")
+        parser.add_argument('--quantity', type=int, default=1, help="Units shipped per transaction")
+        parser.add_argument(
+            '--keep', action='store_true',
+            help="Keep the benchmark product and its transactions instead of deleting them"
+        )
+
+    def handle(self, *args, **options):
+        product = ProductMaster.objects.create(
+            product_code=f"BENCH-{timezone.now():%Y%m%d%H%M%S%f}",
+            product_name="Stock-out benchmark product",
+            unit_price=Decimal('1.00'),
+        )
+        try:
+            self.write(product, 'IN', options['stock'])
+            report = self.run(product, options)
+            self.verify(product, options, report)
+        finally:
+            if not options['keep']:
+                StockMain.objects.filter(details__product=product).delete()
+                product.delete()
+
+    def write(self, product, transaction_type, quantity):
+        """Write a one-line transaction the way the transaction create endpoint does"""
+        with transaction.atomic():
+            if transaction_type in ('OUT', 'ADJUST'):
+                lock_balances([product.pk])
+            header = StockMain.objects.create(transaction_type=transaction_type, reference_number='BENCH')
+            StockDetail.objects.create(
+                transaction=header, product=product, quantity=Decimal(quantity), unit_price=Decimal('1.00')
+            )
+
+    def run(self, product, options):
+        remaining = iter(range(options['orders']))
+        counter_lock = threading.Lock()
+        report = {'shipped': 0, 'conflicts': 0, 'errors': [], 'latencies': []}
+        report_lock = threading.Lock()
+
+        def picker():
+            try:
+                while True:
+                    with counter_lock:
+                        if next(remaining, None) is None:
+                            return
+                    started = time.perf_counter()
+                    outcome = 'shipped'
+                    try:
+                        self.write(product, 'OUT', options['quantity'])
+                    except InsufficientStock:
+                        outcome = 'conflicts'
+                    except OperationalError as e:
+                        outcome = str(e)
+                    elapsed = time.perf_counter() - started
+                    with report_lock:
+                        report['latencies'].append(elapsed)
+                        if outcome in ('shipped', 'conflicts'):
+                            report[outcome] += 1
+                        else:
+                            report['errors'].append(outcome)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=picker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report['elapsed'] = time.perf_counter() - started
+
+        latencies = sorted(report['latencies'])
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+        self.stdout.write(
+            f"{options['threads']} threads, {options['orders']} orders of {options['quantity']} "
+            f"against {options['stock']} units on {connection.vendor}:\n"
+            f"  shipped {report['shipped']}, refused {report['conflicts']}, errors {len(report['errors'])}\n"
+            f"  {report['elapsed']:.2f}s, {report['shipped'] / report['elapsed']:.1f} shipped/s, "
+            f"{len(latencies) / report['elapsed']:.1f} attempts/s\n"
+            f"  latency p50 {percentile(0.5):.1f} ms, p95 {percentile(0.95):.1f} ms, max {percentile(1):.1f} ms"
+        )
+        return report
+
+    def verify(self, product, options, report):
+        balance = StockBalance.objects.get(product=product).quantity
+        history = StockDetail.objects.filter(product=product).aggregate(total=Sum('quantity'))['total']
+        expected_shipped = min(options['orders'], options['stock'] // options['quantity'])
+
+        problems = []
+        if balance < 0:
+            problems.append(f"stock went negative ({balance})")
+        if balance != history:
+            problems.append(f"balance {balance} does not match the movement history {history}")
+        if report['shipped'] != expected_shipped and not report['errors']:
+            problems.append(f"shipped {report['shipped']} orders, expected {expected_shipped}")
+        for error in sorted(set(report['errors'])):
+            problems.append(f"database error: {error}")
+
+        if problems:
+            raise CommandError("Stock-out check failed: " + "; ".join(problems))
+        self.stdout.write(self.style.SUCCESS(f"Stock never went negative; final balance {balance}."))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from inventory.checkpoints import (
+    PERIODS, create_checkpoint, find_checkpoint_discrepancies, period_boundaries
+)
+from inventory.models import StockCheckpoint, StockMain
+
+
+class Command(BaseCommand):
+    help = "Write closing stock balance checkpoints at period boundaries, or verify them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period', choices=PERIODS, default='month',
+            help="Length of the periods between checkpoints"
+        )
+        parser.add_argument(
+            '--through', type=str,
+            help="Last date (YYYY-MM-DD) to write checkpoints up to; defaults to today"
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Delete all checkpoints and write them again from the stock detail history"
+        )
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only compare stored checkpoints with the stock detail history"
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            discrepancies = find_checkpoint_discrepancies()
+            for product_id, period_end, stored, expected in discrepancies:
+                self.stdout.write(
+                    f"Product {product_id} at {period_end:%Y-%m-%d %H:%M}: stored {stored} != expected {expected}"
+                )
+            if discrepancies:
+                raise CommandError(f"{len(discrepancies)} stock checkpoint(s) out of sync.")
+            self.stdout.write(self.style.SUCCESS("All stock checkpoints are in sync."))
+            return
+
+        through = timezone.now()
+        if options['through']:
+            day = parse_date(options['through'])
+            if day is None:
+                raise CommandError("--through must be a date (YYYY-MM-DD).")
+            through = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.max.time()))
+
+        if options['rebuild']:
+            StockCheckpoint.objects.all().delete()
+
+        first_date = StockMain.objects.aggregate(first=Min('transaction_date'))['first']
+        if first_date is None:
+            self.stdout.write("No stock transactions yet, nothing to checkpoint.")
+            return
+
+        # Boundaries already written are kept, so only new periods cost anything
+        latest = StockCheckpoint.objects.aggregate(last=Max('period_end'))['last']
+        written = 0
+        for boundary in period_boundaries(first_date, through, options['period']):
+            if latest is not None and boundary <= latest:
+                continue
+            count = create_checkpoint(boundary)
+            written += 1
+            self.stdout.write(f"{boundary:%Y-%m-%d %H:%M}: {count} product balance(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} checkpoint period(s)."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from inventory.queryplans import check_hot_queries, plans_checked
+
+
+class Command(BaseCommand):
+    help = "Print the query plans of the hot list/filter paths and check that they use indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strict', action='store_true',
+            help="Exit with an error if any hot query falls back to a full table scan"
+        )
+
+    def handle(self, *args, **options):
+        if not plans_checked():
+            raise CommandError(f"Query plans are not checked on {connection.vendor}.")
+
+        full_scans = []
+        for name, plan, scanned in check_hot_queries():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            if scanned:
+                full_scans.append(f"{name}: {', '.join(scanned)}")
+
+        if full_scans:
+            message = "Full table scans found:\n  " + "\n  ".join(full_scans)
+            if options['strict']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("All hot queries use indexes."))
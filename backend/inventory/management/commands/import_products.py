@@ -0,0 +1,59 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importers import import_products
+
+
+class Command(BaseCommand):
+    help = "Import or update products from a CSV file keyed on product_code"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with a header row (product_code and product_name required)")
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Rows written per upsert statement"
+        )
+        parser.add_argument(
+            '--rejects',
+            help="Write rejected rows with their errors to this CSV file"
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Validate the file and count creates/updates without writing"
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(result):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{result.processed} rows: {result.created} created, {result.updated} updated, "
+                f"{len(result.rejected)} rejected ({elapsed:.1f}s)"
+            )
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as text_file:
+                result = import_products(
+                    text_file,
+                    chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'],
+                    progress=progress,
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if options['rejects'] and result.rejected:
+            with open(options['rejects'], 'w', newline='') as rejects_file:
+                writer = csv.writer(rejects_file)
+                writer.writerow(['line', 'product_code', 'errors'])
+                for line, code, errors in result.rejected:
+                    writer.writerow([line, code, ' '.join(errors)])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created + result.updated} product(s) "
+            f"({result.created} created, {result.updated} updated), "
+            f"rejected {len(result.rejected)} row(s) in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.batches import find_batch_discrepancies, rebuild_batch_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild the batch balance table from stock details, or verify it against them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only compare stored batch balances with the stock detail history"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of batch balance rows inserted per query"
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            discrepancies = find_batch_discrepancies()
+            for (product_id, batch_number, expiry_date), stored, expected in discrepancies:
+                self.stdout.write(
+                    f"Product {product_id} batch {batch_number or '-'} expiring {expiry_date or '-'}: "
+                    f"stored {stored} != expected {expected}"
+                )
+            if discrepancies:
+                raise CommandError(f"{len(discrepancies)} batch balance(s) out of sync.")
+            self.stdout.write(self.style.SUCCESS("All batch balances are in sync."))
+            return
+
+        count = rebuild_batch_balances(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} batch balance(s)."))
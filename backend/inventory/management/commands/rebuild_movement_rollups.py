@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.rollups import find_rollup_discrepancies, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily movement rollup table from stock details, or verify it against them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only compare stored rollups with the stock detail history"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of rollup rows inserted per query"
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            discrepancies = find_rollup_discrepancies()
+            for (product_id, day, transaction_type), stored, expected in discrepancies:
+                self.stdout.write(
+                    f"Product {product_id} {day} {transaction_type}: stored {stored} != expected {expected}"
+                )
+            if discrepancies:
+                raise CommandError(f"{len(discrepancies)} daily rollup row(s) out of sync.")
+            self.stdout.write(self.style.SUCCESS("All daily movement rollups are in sync."))
+            return
+
+        count = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily movement rollup row(s)."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from inventory.search import rebuild_search_index, uses_trigram_search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product and transaction search token table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help="Number of objects tokenized per batch"
+        )
+
+    def handle(self, *args, **options):
+        if uses_trigram_search():
+            self.stdout.write("PostgreSQL searches through trigram indexes; there is nothing to rebuild.")
+            return
+
+        count = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} product(s) and transaction(s)."))
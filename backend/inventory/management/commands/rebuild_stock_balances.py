@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.balances import find_discrepancies, find_reorder_flag_discrepancies, rebuild_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stock balance table and reorder flags from stock details, or verify them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only compare stored balances with the stock detail history"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of balance rows inserted per query"
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            discrepancies = find_discrepancies()
+            for product_id, stored, expected in discrepancies:
+                self.stdout.write(
+                    f"Product {product_id}: stored {stored} != expected {expected}"
+                )
+            flags = find_reorder_flag_discrepancies()
+            for product_id, stored, expected in flags:
+                self.stdout.write(f"Product {product_id}: needs_reorder {stored} != expected {expected}")
+            if discrepancies or flags:
+                raise CommandError(
+                    f"{len(discrepancies)} stock balance(s) and {len(flags)} reorder flag(s) out of sync."
+                )
+            self.stdout.write(self.style.SUCCESS("All stock balances are in sync."))
+            return
+
+        count = rebuild_balances(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stock balances for {count} product(s)."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import StockValuation
+from inventory.valuation import find_valuation_discrepancies, rebuild_valuations, valuation_method
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the stock detail history into the cost valuation tables, or verify them against it. "
+        "Run after changing INVENTORY_VALUATION_METHOD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only compare stored valuations with a replay of the stock detail history"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of valuation and cost layer rows inserted per query"
+        )
+
+    def handle(self, *args, **options):
+        method = valuation_method()
+        if options['verify']:
+            if StockValuation.objects.exclude(method=method).exists():
+                raise CommandError(
+                    f"Stored valuations use another method than {method}; run rebuild_valuations first."
+                )
+            discrepancies = find_valuation_discrepancies()
+            for product_id, stored, expected in discrepancies:
+                self.stdout.write(f"Product {product_id}: stored {stored} != expected {expected}")
+            if discrepancies:
+                raise CommandError(f"{len(discrepancies)} product valuation(s) out of sync.")
+            self.stdout.write(self.style.SUCCESS(f"All product valuations ({method}) are in sync."))
+            return
+
+        count = rebuild_valuations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Valued {count} product(s) with the {method} method."))
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.benchmarks import ENDPOINTS, compare_reports, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the read endpoints through the test client and write latency, query count "
+        "and memory figures to a JSON report, optionally compared against a baseline report"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help="Timed requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per endpoint first")
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints', choices=[name for name, _ in ENDPOINTS],
+            help="Endpoint to benchmark, repeatable (default: all)"
+        )
+        parser.add_argument(
+            '--cached', action='store_true',
+            help="Keep the response and dashboard caches on instead of measuring the queries"
+        )
+        parser.add_argument('--output', type=str, help="Write the JSON report to this file")
+        parser.add_argument('--baseline', type=str, help="Compare against this earlier JSON report")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.15,
+            help="Relative latency or memory growth over the baseline reported as a regression"
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        self.stdout.write(f"{'endpoint':<30} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KB':>9}")
+        report = run_benchmarks(
+            endpoints=options['endpoints'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            cached=options['cached'],
+            progress=lambda name, result: self.stdout.write(
+                f"{name:<30} {result['p50_ms']:>8} {result['p90_ms']:>8} {result['p99_ms']:>8} "
+                f"{result['queries']:>8} {result['peak_memory_kb']:>9}"
+            ),
+        )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Report written to {options['output']}.")
+
+        if baseline is None:
+            return
+        if baseline.get('cached') != report['cached']:
+            self.stdout.write(self.style.WARNING("The baseline was run with a different --cached setting."))
+        if baseline.get('dataset') != report['dataset']:
+            self.stdout.write(self.style.WARNING(
+                f"Dataset differs from the baseline ({baseline.get('dataset')} vs {report['dataset']})."
+            ))
+
+        rows, regressions = compare_reports(report, baseline, options['tolerance'])
+        self.stdout.write(f"\n{'endpoint':<30} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+        for name, metric, previous, current in rows:
+            change = f"{(current - previous) / previous:+.0%}" if previous else 'n/a'
+            flag = '  REGRESSION' if (name, metric, previous, current) in regressions else ''
+            self.stdout.write(f"{name:<30} {metric:<15} {previous:>10} {current:>10} {change:>8}{flag}")
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} metric(s) regressed against {options['baseline']}.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
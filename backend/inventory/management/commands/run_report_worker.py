@@ -0,0 +1,43 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory.reports import ReportWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background reports until stopped (SIGINT or SIGTERM let the running jobs finish). "
+        "Start several workers, on one host or many, to run more reports at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.REPORT_WORKER_CONCURRENCY,
+            help="Jobs run at a time by this worker (default REPORT_WORKER_CONCURRENCY)"
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.REPORT_WORKER_POLL_INTERVAL,
+            help="Seconds between looks at an empty queue (default REPORT_WORKER_POLL_INTERVAL)"
+        )
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        worker = ReportWorker(concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping once the running reports finish...")
+            worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        self.stdout.write(f"Report worker {worker.name} running {worker.concurrency} job(s) at a time.")
+        worker.run(once=options['once'], on_finish=self.report_finished)
+
+    def report_finished(self, job, succeeded):
+        if succeeded:
+            self.stdout.write(self.style.SUCCESS(f"Job {job.pk} ({job.report}) done."))
+        else:
+            self.stdout.write(self.style.ERROR(f"Job {job.pk} ({job.report}) failed."))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from inventory.benchmarks import clear_benchmark_data, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible synthetic warehouse (skewed SKU popularity, batches, expiry dates) "
+        "for performance benchmarks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help="Number of products to create")
+        parser.add_argument('--transactions', type=int, default=20000, help="Number of transactions to create")
+        parser.add_argument('--lines', type=int, default=60000, help="Total number of transaction detail lines")
+        parser.add_argument('--days', type=int, default=365, help="Days of history the transactions are spread over")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data")
+        parser.add_argument(
+            '--end-date', type=str,
+            help="Last day (YYYY-MM-DD) of the generated history; defaults to now"
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows inserted per query")
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Delete previously seeded products and transactions first"
+        )
+
+    def handle(self, *args, **options):
+        if min(options['products'], options['transactions'], options['days']) < 1:
+            raise CommandError("--products, --transactions and --days must be at least 1.")
+
+        end = None
+        if options['end_date']:
+            day = parse_date(options['end_date'])
+            if day is None:
+                raise CommandError("--end-date must be a date (YYYY-MM-DD).")
+            end = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.max.time()))
+
+        if options['clear']:
+            products, transactions = clear_benchmark_data()
+            self.stdout.write(f"Deleted {products} seeded product(s) and {transactions} transaction(s).")
+
+        counts = seed_benchmark_data(
+            products=options['products'],
+            transactions=options['transactions'],
+            lines=options['lines'],
+            days=options['days'],
+            seed=options['seed'],
+            end=end,
+            batch_size=options['batch_size'],
+            progress=lambda message: self.stdout.write(f"  {message}"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {counts['products']} product(s), {counts['transactions']} transaction(s) "
+            f"and {counts['lines']} detail line(s)."
+        ))
@@ -0,0 +1,53 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from inventory.querylog import KINDS, N_PLUS_ONE, slow_query_log
+
+
+class Command(BaseCommand):
+    help = "Print the slow-query log: slow statements with their plans and N+1 patterns, newest first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help="Entries to print (default 20)")
+        parser.add_argument('--kind', choices=KINDS, help="Only entries of this kind")
+        parser.add_argument('--view', help="Only entries of this view, e.g. InventorySummaryView.get")
+        parser.add_argument('--json', action='store_true', help="Print the entries as JSON")
+        parser.add_argument('--clear', action='store_true', help="Empty the log instead of printing it")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            slow_query_log.clear()
+            self.stdout.write(self.style.SUCCESS("Slow-query log cleared."))
+            return
+
+        entries = slow_query_log.entries(kind=options['kind'], view=options['view'], limit=options['limit'])
+        if options['json']:
+            self.stdout.write(json.dumps(entries, cls=DjangoJSONEncoder, indent=2))
+            return
+
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            self.stdout.write(self.style.WARNING("SLOW_QUERY_LOG_ENABLED is off; no new entries are recorded."))
+        if not entries:
+            self.stdout.write("No entries.")
+        for entry in entries:
+            self.write_entry(entry)
+
+    def write_entry(self, entry):
+        if entry['kind'] == N_PLUS_ONE:
+            measure = f"{entry['count']} executions, {entry['duration_ms']:.1f} ms in total"
+        else:
+            measure = f"{entry['duration_ms']:.1f} ms"
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{entry['recorded_at']:%Y-%m-%d %H:%M:%S} {entry['kind']} {entry['view']} "
+            f"{entry['method']} {entry['path']}: {measure}"
+        ))
+        self.stdout.write(f"  {entry['sql']}")
+        if entry['params']:
+            self.stdout.write(f"  params: {entry['params']}")
+        if entry['plan']:
+            self.stdout.write("  plan:")
+            for line in entry['plan'].splitlines():
+                self.stdout.write(f"    {line}")
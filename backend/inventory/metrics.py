@@ -0,0 +1,298 @@
+"""
+Per-view request metrics in the Prometheus text format.
+
+RequestMetricsMiddleware times every request and labels it with the view and
+action it resolved to (e.g. ProductMasterViewSet.stock_movements). Database
+queries are counted and timed by a wrapper installed on every connection,
+which adds to the request found in a context variable, so queries run on the
+worker threads of the async views count too.
+
+Each process aggregates into fixed histogram buckets in memory and merges
+them every METRICS_FLUSH_INTERVAL seconds into a SQLite file shared by all
+gunicorn workers, so memory and file size only grow with the number of
+views, methods and status codes. /api/metrics/ renders the merged totals.
+"""
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+HISTOGRAMS = {
+    'duration': DURATION_BUCKETS,
+    'queries': QUERY_BUCKETS,
+}
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class _RequestStats:
+    """Queries run for the request being handled, possibly from several threads"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.lock = threading.Lock()
+
+    def add_query(self, duration):
+        with self.lock:
+            self.queries += 1
+            self.db_time += duration
+
+
+_current_request = ContextVar('inventory_request_stats', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(time.perf_counter() - started)
+
+
+def install_query_recorder(connection):
+    """Count and time the queries of a database connection for the metrics"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def view_label(request):
+    """'ViewClass.action' (or the function name) of the view a request resolved to"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if view_class is None:
+        return getattr(func, '__name__', 'unknown')
+    actions = getattr(func, 'actions', None) or {}
+    method = request.method.lower()
+    return f"{view_class.__name__}.{actions.get(method, method)}"
+
+
+def _bucket_index(buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+    return len(buckets)
+
+
+class MetricsStore:
+    """In-process aggregation merged periodically into a SQLite file shared by every worker"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS series ("
+        " view TEXT, method TEXT, status TEXT, requests INTEGER, duration_sum REAL,"
+        " queries_sum INTEGER, db_time_sum REAL, PRIMARY KEY (view, method, status))",
+        "CREATE TABLE IF NOT EXISTS buckets ("
+        " view TEXT, method TEXT, status TEXT, histogram TEXT, bucket INTEGER, count INTEGER,"
+        " PRIMARY KEY (view, method, status, histogram, bucket))",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._schema_ready = False
+
+    def observe(self, view, method, status, duration, queries, db_time):
+        """Add one request; returns True when the observations are due to be flushed"""
+        key = (view, method if method in METHODS else 'OTHER', str(status))
+        with self._lock:
+            series = self._pending.get(key)
+            if series is None:
+                series = self._pending[key] = {
+                    'requests': 0, 'duration_sum': 0.0, 'queries_sum': 0, 'db_time_sum': 0.0,
+                    'duration': [0] * (len(DURATION_BUCKETS) + 1),
+                    'queries': [0] * (len(QUERY_BUCKETS) + 1),
+                }
+            series['requests'] += 1
+            series['duration_sum'] += duration
+            series['queries_sum'] += queries
+            series['db_time_sum'] += db_time
+            series['duration'][_bucket_index(DURATION_BUCKETS, duration)] += 1
+            series['queries'][_bucket_index(QUERY_BUCKETS, queries)] += 1
+            return time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL
+
+    def _connect(self):
+        connection = sqlite3.connect(settings.METRICS_LOCATION, timeout=5)
+        if not self._schema_ready:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._schema_ready = True
+        return connection
+
+    def flush(self):
+        """Merge this process's observations into the shared file"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        series_rows = []
+        bucket_rows = []
+        for (view, method, status), series in pending.items():
+            series_rows.append((
+                view, method, status, series['requests'], series['duration_sum'],
+                series['queries_sum'], series['db_time_sum'],
+            ))
+            for histogram in HISTOGRAMS:
+                bucket_rows += [
+                    (view, method, status, histogram, bucket, count)
+                    for bucket, count in enumerate(series[histogram]) if count
+                ]
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO series VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (view, method, status) DO UPDATE SET "
+                        "requests = requests + excluded.requests, "
+                        "duration_sum = duration_sum + excluded.duration_sum, "
+                        "queries_sum = queries_sum + excluded.queries_sum, "
+                        "db_time_sum = db_time_sum + excluded.db_time_sum",
+                        series_rows
+                    )
+                    connection.executemany(
+                        "INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (view, method, status, histogram, bucket) DO UPDATE SET "
+                        "count = count + excluded.count",
+                        bucket_rows
+                    )
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            # Metrics must never break a request; the observations are dropped
+            logger.exception("Could not write request metrics to %s", settings.METRICS_LOCATION)
+
+    def collect(self):
+        """Flush, then read the totals of every worker: (series rows, {key: {histogram: counts}})"""
+        self.flush()
+        connection = self._connect()
+        try:
+            series = connection.execute(
+                "SELECT view, method, status, requests, duration_sum, queries_sum, db_time_sum "
+                "FROM series ORDER BY view, method, status"
+            ).fetchall()
+            histograms = {}
+            for view, method, status, histogram, bucket, count in connection.execute(
+                "SELECT view, method, status, histogram, bucket, count FROM buckets"
+            ):
+                counts = histograms.setdefault((view, method, status), {
+                    name: [0] * (len(buckets) + 1) for name, buckets in HISTOGRAMS.items()
+                })
+                counts[histogram][bucket] = count
+        finally:
+            connection.close()
+        return series, histograms
+
+
+metrics_store = MetricsStore()
+atexit.register(metrics_store.flush)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, labels, buckets, counts, total, value_sum):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {total}')
+    lines.append(f'{name}_sum{{{labels}}} {value_sum:g}')
+    lines.append(f'{name}_count{{{labels}}} {total}')
+    return lines
+
+
+def render_prometheus():
+    """All workers' metrics in the Prometheus text exposition format"""
+    series, histograms = metrics_store.collect()
+    duration = [
+        '# HELP http_request_duration_seconds Request latency by view and action.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    queries = [
+        '# HELP http_request_db_queries Database queries per request by view and action.',
+        '# TYPE http_request_db_queries histogram',
+    ]
+    db_time = [
+        '# HELP http_request_db_duration_seconds_total Time spent in database queries by view and action.',
+        '# TYPE http_request_db_duration_seconds_total counter',
+    ]
+    for view, method, status, requests, duration_sum, queries_sum, db_time_sum in series:
+        labels = f'view="{_escape(view)}",method="{method}",status="{status}"'
+        counts = histograms.get((view, method, status), {})
+        duration += _histogram_lines(
+            'http_request_duration_seconds', labels, DURATION_BUCKETS,
+            counts.get('duration', []), requests, duration_sum
+        )
+        queries += _histogram_lines(
+            'http_request_db_queries', labels, QUERY_BUCKETS,
+            counts.get('queries', []), requests, queries_sum
+        )
+        db_time.append(f'http_request_db_duration_seconds_total{{{labels}}} {db_time_sum:g}')
+    return '\n'.join(duration + queries + db_time) + '\n'
+
+
+class RequestMetricsMiddleware:
+    """Record latency, query count and query time of every request under its view label"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = _RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        if self.record(request, response, time.perf_counter() - started, stats):
+            metrics_store.flush()
+        return response
+
+    async def __acall__(self, request):
+        stats = _RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        if self.record(request, response, time.perf_counter() - started, stats):
+            # Keep the file write off the event loop
+            await sync_to_async(metrics_store.flush, thread_sensitive=False)()
+        return response
+
+    def record(self, request, response, duration, stats):
+        return metrics_store.observe(
+            view_label(request), request.method, response.status_code,
+            duration, stats.queries, stats.db_time
+        )
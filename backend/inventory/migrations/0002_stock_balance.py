@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:29
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Sum
+import django.db.models.deletion
+
+
+def populate_balances(apps, schema_editor):
+    StockDetail = apps.get_model('inventory', 'StockDetail')
+    StockBalance = apps.get_model('inventory', 'StockBalance')
+    line_value = ExpressionWrapper(
+        F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=16, decimal_places=2)
+    )
+    rows = StockDetail.objects.order_by().values('product_id').annotate(
+        total_quantity=Sum('quantity'),
+        total_value=Sum(line_value),
+        last_date=Max('transaction__transaction_date'),
+    )
+    StockBalance.objects.bulk_create([
+        StockBalance(
+            product_id=row['product_id'],
+            quantity=row['total_quantity'] or 0,
+            stock_value=row['total_value'] or 0,
+            last_movement_date=row['last_date'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('product', models.OneToOneField(help_text='Product this balance belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_balance', serialize=False, to='inventory.productmaster')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, help_text='Quantity on hand', max_digits=14)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, help_text='Value of stock on hand at transaction prices', max_digits=16)),
+                ('last_movement_date', models.DateTimeField(blank=True, help_text='Date of the latest stock movement', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Stock Balance',
+                'verbose_name_plural': 'Stock Balances',
+                'db_table': 'stckbal',
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
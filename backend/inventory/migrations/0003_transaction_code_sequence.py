@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_stock_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionCodeSequence',
+            fields=[
+                ('prefix', models.CharField(help_text='Transaction code prefix', max_length=10, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1, help_text='First number not yet handed out')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Transaction Code Sequence',
+                'verbose_name_plural': 'Transaction Code Sequences',
+                'db_table': 'stckseq',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_transaction_code_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockdetail',
+            index=models.Index(fields=['-created_at'], name='stckdetail_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdetail',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['-created_at'], name='stckdetail_in_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdetail',
+            index=models.Index(condition=models.Q(('quantity__lt', 0)), fields=['-created_at'], name='stckdetail_out_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdetail',
+            index=models.Index(fields=['product', 'transaction'], name='stckdetail_prod_txn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmain',
+            index=models.Index(fields=['-transaction_date'], name='stckmain_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmain',
+            index=models.Index(fields=['transaction_type', '-transaction_date'], name='stckmain_type_date_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:34
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Trigram indexes on the expressions icontains compiles to on PostgreSQL
+TRIGRAM_INDEXES = [
+    ('prodmast_code_trgm_idx', 'prodmast', 'product_code'),
+    ('prodmast_name_trgm_idx', 'prodmast', 'product_name'),
+    ('stckmain_ref_trgm_idx', 'stckmain', 'reference_number'),
+    ('stckmain_party_trgm_idx', 'stckmain', 'supplier_customer'),
+]
+
+# Frozen copy of inventory.search.tokenize
+TOKEN_RE = re.compile(r'[^\W_]+')
+TOKEN_LENGTH = 100
+
+
+def tokenize(*values):
+    tokens = set()
+    for value in values:
+        if value:
+            value = unicodedata.normalize('NFC', value).lower()
+            tokens.update(token[:TOKEN_LENGTH] for token in TOKEN_RE.findall(value))
+    return tokens
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRIGRAM_INDEXES:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} '
+                f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+            )
+        return
+
+    SearchToken = apps.get_model('inventory', 'SearchToken')
+    sources = [
+        ('product', apps.get_model('inventory', 'ProductMaster'), ('product_code', 'product_name')),
+        ('transaction', apps.get_model('inventory', 'StockMain'), ('reference_number', 'supplier_customer')),
+    ]
+    for entity, model, fields in sources:
+        tokens = []
+        for row in model.objects.order_by().values_list('pk', *fields).iterator():
+            tokens.extend(
+                SearchToken(entity=entity, object_id=row[0], token=token)
+                for token in tokenize(*row[1:])
+            )
+        SearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, _, _ in TRIGRAM_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('token_id', models.AutoField(primary_key=True, serialize=False)),
+                ('entity', models.CharField(choices=[('product', 'Product'), ('transaction', 'Transaction')], help_text='Kind of indexed object', max_length=20)),
+                ('object_id', models.IntegerField(help_text='Primary key of the indexed object')),
+                ('token', models.CharField(help_text='Lower-cased word', max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Search Token',
+                'verbose_name_plural': 'Search Tokens',
+                'db_table': 'srchtoken',
+                'indexes': [models.Index(fields=['entity', 'token', 'object_id'], name='srchtoken_lookup_idx'), models.Index(fields=['entity', 'object_id'], name='srchtoken_object_idx')],
+            },
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stockdetail',
+            name='stckdetail_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stockmain',
+            name='stckmain_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='stockdetail',
+            index=models.Index(fields=['-created_at', '-detail_id'], name='stckdetail_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmain',
+            index=models.Index(fields=['-transaction_date', '-transaction_id'], name='stckmain_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('checkpoint_id', models.AutoField(primary_key=True, serialize=False)),
+                ('period_end', models.DateTimeField(help_text='End of the period (exclusive); the balance covers movements dated before it')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, help_text='Quantity on hand at the end of the period', max_digits=14)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, help_text='Value of stock on hand at the end of the period', max_digits=16)),
+                ('last_movement_date', models.DateTimeField(blank=True, help_text='Date of the latest movement before period end', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(help_text='Product this checkpoint belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='stock_checkpoints', to='inventory.productmaster')),
+            ],
+            options={
+                'verbose_name': 'Stock Checkpoint',
+                'verbose_name_plural': 'Stock Checkpoints',
+                'db_table': 'stckchkpt',
+                'ordering': ['product', '-period_end'],
+                'indexes': [models.Index(fields=['period_end'], name='stckchkpt_period_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockcheckpoint',
+            constraint=models.UniqueConstraint(fields=('product', 'period_end'), name='stckchkpt_product_period_uniq'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:53
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    StockDetail = apps.get_model('inventory', 'StockDetail')
+    StockDailyMovement = apps.get_model('inventory', 'StockDailyMovement')
+    line_value = ExpressionWrapper(
+        F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=16, decimal_places=2)
+    )
+    rows = StockDetail.objects.order_by().annotate(
+        day=TruncDate('transaction__transaction_date')
+    ).values('product_id', 'day', 'transaction__transaction_type').annotate(
+        total_quantity=Sum('quantity'),
+        value=Sum(line_value),
+        lines=Count('detail_id'),
+    )
+    StockDailyMovement.objects.bulk_create([
+        StockDailyMovement(
+            product_id=row['product_id'],
+            day=row['day'],
+            transaction_type=row['transaction__transaction_type'],
+            quantity=row['total_quantity'] or 0,
+            total_value=row['value'] or 0,
+            movement_count=row['lines'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stock_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockDailyMovement',
+            fields=[
+                ('rollup_id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField(help_text='Transaction date (in the server time zone)')),
+                ('transaction_type', models.CharField(choices=[('IN', 'Stock In'), ('OUT', 'Stock Out'), ('ADJUST', 'Stock Adjustment')], help_text='Type of the transactions', max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, help_text='Sum of the moved quantities (negative for stock out)', max_digits=14)),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, help_text='Sum of the moved quantities at their unit prices', max_digits=16)),
+                ('movement_count', models.IntegerField(default=0, help_text='Number of stock detail lines')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(help_text='Product moved', on_delete=django.db.models.deletion.CASCADE, related_name='daily_movements', to='inventory.productmaster')),
+            ],
+            options={
+                'verbose_name': 'Stock Daily Movement',
+                'verbose_name_plural': 'Stock Daily Movements',
+                'db_table': 'stckdaily',
+                'ordering': ['product', 'day', 'transaction_type'],
+                'indexes': [models.Index(fields=['day', 'product'], name='stckdaily_day_product_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockdailymovement',
+            constraint=models.UniqueConstraint(fields=('product', 'day', 'transaction_type'), name='stckdaily_product_day_type_uniq'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_versions(apps, schema_editor):
+    ResourceVersion = apps.get_model('inventory', 'ResourceVersion')
+    ResourceVersion.objects.bulk_create([
+        ResourceVersion(name=name) for name in ('products', 'transactions', 'stock')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_daily_movement_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVersion',
+            fields=[
+                ('name', models.CharField(choices=[('products', 'Products'), ('transactions', 'Stock transactions'), ('stock', 'Stock details and balances')], help_text='Resource name', max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0, help_text='Number of committed writes to the resource')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Time of the latest committed write')),
+            ],
+            options={
+                'verbose_name': 'Resource Version',
+                'verbose_name_plural': 'Resource Versions',
+                'db_table': 'resver',
+            },
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
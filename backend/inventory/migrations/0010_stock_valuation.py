@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_valuations(apps, schema_editor):
+    # The costing itself is plain Python, shared with the rebuild_valuations command
+    from inventory.valuation import replay_history
+
+    StockDetail = apps.get_model('inventory', 'StockDetail')
+    StockValuation = apps.get_model('inventory', 'StockValuation')
+    StockCostLayer = apps.get_model('inventory', 'StockCostLayer')
+    rows = StockDetail.objects.order_by('product_id', 'transaction__transaction_date', 'detail_id').values_list(
+        'product_id', 'detail_id', 'transaction__transaction_date', 'quantity', 'unit_price'
+    ).iterator(chunk_size=2000)
+    valuations, layers = [], []
+    for product_id, state, (valued_through, last_detail_id) in replay_history(
+        rows, settings.INVENTORY_VALUATION_METHOD
+    ):
+        valuations.append(StockValuation(
+            product_id=product_id, method=state.method, quantity=state.quantity,
+            cost_value=state.cost_value, unit_cost=state.unit_cost,
+            valued_through=valued_through, last_detail_id=last_detail_id,
+        ))
+        layers += [
+            StockCostLayer(
+                product_id=product_id, detail_id=detail_id, received_at=received_at,
+                quantity=quantity, unit_cost=unit_cost
+            )
+            for detail_id, received_at, quantity, unit_cost in state.layers
+        ]
+    StockValuation.objects.bulk_create(valuations, batch_size=1000)
+    StockCostLayer.objects.bulk_create(layers, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_resource_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockValuation',
+            fields=[
+                ('product', models.OneToOneField(help_text='Product this valuation belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_valuation', serialize=False, to='inventory.productmaster')),
+                ('method', models.CharField(choices=[('average', 'Weighted average cost'), ('fifo', 'First in, first out')], help_text='Costing method of the valuation', max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, help_text='Quantity on hand', max_digits=14)),
+                ('cost_value', models.DecimalField(decimal_places=4, default=0, help_text='Cost of the stock on hand', max_digits=20)),
+                ('unit_cost', models.DecimalField(blank=True, decimal_places=6, help_text='Average cost per unit on hand, or the latest receipt cost when none is on hand', max_digits=18, null=True)),
+                ('valued_through', models.DateTimeField(help_text='Transaction date of the latest movement valued')),
+                ('last_detail_id', models.IntegerField(help_text='Stock detail line of the latest movement valued')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Stock Valuation',
+                'verbose_name_plural': 'Stock Valuations',
+                'db_table': 'stckval',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockCostLayer',
+            fields=[
+                ('layer_id', models.AutoField(primary_key=True, serialize=False)),
+                ('detail_id', models.IntegerField(help_text='Stock detail line that received the layer')),
+                ('received_at', models.DateTimeField(help_text='Transaction date of the receipt')),
+                ('quantity', models.DecimalField(decimal_places=2, help_text='Quantity of the receipt not issued yet', max_digits=14)),
+                ('unit_cost', models.DecimalField(decimal_places=2, help_text='Cost per unit of the receipt', max_digits=10)),
+                ('product', models.ForeignKey(help_text='Product received', on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='inventory.productmaster')),
+            ],
+            options={
+                'verbose_name': 'Stock Cost Layer',
+                'verbose_name_plural': 'Stock Cost Layers',
+                'db_table': 'stckcostlyr',
+                'indexes': [models.Index(fields=['product', 'received_at', 'detail_id'], name='stckcostlyr_product_fifo_idx')],
+            },
+        ),
+        migrations.RunPython(populate_valuations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:27
+
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def populate_batch_balances(apps, schema_editor):
+    StockDetail = apps.get_model('inventory', 'StockDetail')
+    StockBatchBalance = apps.get_model('inventory', 'StockBatchBalance')
+    balances = {}
+    rows = StockDetail.objects.order_by().values('product_id', 'batch_number', 'expiry_date').annotate(
+        total_quantity=Sum('quantity'),
+    )
+    for row in rows:
+        key = (row['product_id'], row['batch_number'] or '', row['expiry_date'])
+        balances[key] = balances.get(key, 0) + (row['total_quantity'] or 0)
+    StockBatchBalance.objects.bulk_create([
+        StockBatchBalance(product_id=product_id, batch_number=batch_number, expiry_date=expiry_date, quantity=quantity)
+        for (product_id, batch_number, expiry_date), quantity in balances.items() if quantity
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_stock_valuation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBatchBalance',
+            fields=[
+                ('batch_balance_id', models.AutoField(primary_key=True, serialize=False)),
+                ('batch_number', models.CharField(blank=True, default='', help_text='Batch or lot number, empty for stock moved without one', max_length=100)),
+                ('expiry_date', models.DateField(blank=True, help_text='Expiry date of the batch, if any', null=True)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, help_text='Quantity of the batch on hand', max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(help_text='Product of the batch', on_delete=django.db.models.deletion.CASCADE, related_name='batch_balances', to='inventory.productmaster')),
+            ],
+            options={
+                'verbose_name': 'Stock Batch Balance',
+                'verbose_name_plural': 'Stock Batch Balances',
+                'db_table': 'stckbatch',
+                'ordering': ['product', 'expiry_date', 'batch_number'],
+                'indexes': [models.Index(condition=models.Q(('expiry_date__isnull', False), ('quantity__gt', 0)), fields=['expiry_date', 'product', 'batch_number'], name='stckbatch_onhand_expiry_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockbatchbalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('expiry_date__isnull', False)), fields=('product', 'batch_number', 'expiry_date'), name='stckbatch_product_batch_expiry_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockbatchbalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('expiry_date__isnull', True)), fields=('product', 'batch_number'), name='stckbatch_product_batch_uniq'),
+        ),
+        migrations.RunPython(populate_batch_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:31
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def populate_reorder_flags(apps, schema_editor):
+    ProductMaster = apps.get_model('inventory', 'ProductMaster')
+    below = []
+    for product_id, reorder_point, quantity in ProductMaster.objects.order_by().values_list(
+        'pk', 'reorder_point', 'stock_balance__quantity'
+    ):
+        if (quantity or 0) < reorder_point:
+            below.append(product_id)
+    ProductMaster.objects.update(needs_reorder=False)
+    for start in range(0, len(below), 1000):
+        ProductMaster.objects.filter(pk__in=below[start:start + 1000]).update(needs_reorder=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_stock_batch_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productmaster',
+            name='needs_reorder',
+            field=models.BooleanField(default=True, editable=False, help_text='Stock on hand is below the reorder point, kept up to date on every balance change'),
+        ),
+        migrations.AddField(
+            model_name='productmaster',
+            name='reorder_point',
+            field=models.DecimalField(decimal_places=2, default=10, help_text='Stock on hand below this is low stock and should be reordered', max_digits=12, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='productmaster',
+            name='reorder_quantity',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Quantity to order at a time (0 to order up to the reorder point)', max_digits=12, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddIndex(
+            model_name='productmaster',
+            index=models.Index(condition=models.Q(('is_active', True), ('needs_reorder', True)), fields=['product_name', 'product_id'], name='prodmast_reorder_idx'),
+        ),
+        migrations.RunPython(populate_reorder_flags, migrations.RunPython.noop),
+    ]
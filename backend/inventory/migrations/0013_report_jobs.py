@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_reorder_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('job_id', models.AutoField(primary_key=True, serialize=False)),
+                ('report', models.CharField(help_text='Name of the report', max_length=50)),
+                ('export_format', models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'Newline-delimited JSON')], default='csv', help_text='Format of the result file', max_length=10)),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Normalized report parameters')),
+                ('params_hash', models.CharField(help_text='Digest of report, format and parameters', max_length=64)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', help_text='Job status', max_length=10)),
+                ('requested_by', models.CharField(blank=True, help_text='User who requested the report', max_length=150, null=True)),
+                ('worker', models.CharField(blank=True, help_text='Worker running or that ran the job', max_length=100, null=True)),
+                ('attempts', models.IntegerField(default=0, help_text='Number of times a worker started the job')),
+                ('data_versions', models.JSONField(blank=True, default=dict, help_text='Version counters of the resources the result was read at, for reusing it')),
+                ('row_count', models.IntegerField(default=0, help_text='Rows written to the result so far')),
+                ('result_file', models.CharField(blank=True, help_text='Result file under REPORTS_ROOT', max_length=255, null=True)),
+                ('result_size', models.BigIntegerField(blank=True, help_text='Size of the result file in bytes', null=True)),
+                ('error', models.TextField(blank=True, help_text='Error of a failed job', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, help_text='When a worker last started the job', null=True)),
+                ('finished_at', models.DateTimeField(blank=True, help_text='When the job finished', null=True)),
+            ],
+            options={
+                'verbose_name': 'Report Job',
+                'verbose_name_plural': 'Report Jobs',
+                'db_table': 'rptjob',
+                'ordering': ['-created_at', '-job_id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['created_at', 'job_id'], name='rptjob_queued_idx'), models.Index(fields=['params_hash', '-created_at'], name='rptjob_params_idx')],
+            },
+        ),
+    ]
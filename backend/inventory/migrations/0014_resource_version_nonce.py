@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:47
+
+from django.db import migrations, models
+import inventory.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_report_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resourceversion',
+            name='nonce',
+            field=models.CharField(default=inventory.models.new_version_nonce, help_text='Random token of this counter row, so versions of different databases never match', max_length=16),
+        ),
+    ]
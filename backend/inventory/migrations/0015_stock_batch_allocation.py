@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_resource_version_nonce'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBatchAllocation',
+            fields=[
+                ('allocation_id', models.AutoField(primary_key=True, serialize=False)),
+                ('detail_id', models.IntegerField(help_text='Stock detail line drawn from the batch')),
+                ('batch_number', models.CharField(blank=True, default='', help_text='Batch or lot number drawn from, empty for stock without one', max_length=100)),
+                ('expiry_date', models.DateField(blank=True, help_text='Expiry date of the batch, if any', null=True)),
+                ('quantity', models.DecimalField(decimal_places=2, help_text='Quantity taken from the batch', max_digits=14)),
+                ('product', models.ForeignKey(help_text='Product taken out', on_delete=django.db.models.deletion.CASCADE, related_name='batch_allocations', to='inventory.productmaster')),
+            ],
+            options={
+                'verbose_name': 'Stock Batch Allocation',
+                'verbose_name_plural': 'Stock Batch Allocations',
+                'db_table': 'stckbatchalloc',
+                'indexes': [models.Index(fields=['detail_id'], name='stckbatchalloc_detail_idx')],
+            },
+        ),
+    ]
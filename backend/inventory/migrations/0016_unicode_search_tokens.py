@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:05
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Frozen copy of inventory.search.tokenize; earlier tokens only kept ASCII letters and digits
+TOKEN_RE = re.compile(r'[^\W_]+')
+TOKEN_LENGTH = 100
+
+
+def tokenize(*values):
+    tokens = set()
+    for value in values:
+        if value:
+            value = unicodedata.normalize('NFC', value).lower()
+            tokens.update(token[:TOKEN_LENGTH] for token in TOKEN_RE.findall(value))
+    return tokens
+
+
+def reindex_search_tokens(apps, schema_editor):
+    # PostgreSQL searches the columns through trigram indexes and keeps no tokens
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+
+    SearchToken = apps.get_model('inventory', 'SearchToken')
+    sources = [
+        ('product', apps.get_model('inventory', 'ProductMaster'), ('product_code', 'product_name')),
+        ('transaction', apps.get_model('inventory', 'StockMain'), ('reference_number', 'supplier_customer')),
+    ]
+    SearchToken.objects.all().delete()
+    for entity, model, fields in sources:
+        tokens = []
+        for row in model.objects.order_by().values_list('pk', *fields).iterator():
+            tokens.extend(
+                SearchToken(entity=entity, object_id=row[0], token=token)
+                for token in tokenize(*row[1:])
+            )
+        SearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_stock_batch_allocation'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_search_tokens, migrations.RunPython.noop),
+    ]
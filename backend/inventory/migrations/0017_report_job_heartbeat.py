@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_unicode_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='When the running job last reported progress', null=True),
+        ),
+    ]
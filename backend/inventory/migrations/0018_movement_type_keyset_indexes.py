@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_report_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stockdetail',
+            name='stckdetail_in_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stockdetail',
+            name='stckdetail_out_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='stockdetail',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['-created_at', '-detail_id'], name='stckdetail_in_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdetail',
+            index=models.Index(condition=models.Q(('quantity__lt', 0)), fields=['-created_at', '-detail_id'], name='stckdetail_out_created_id_idx'),
+        ),
+    ]
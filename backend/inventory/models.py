@@ -1,8 +1,15 @@
-from django.db import models
+import secrets
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
 
+# Reorder point of products that do not set their own: less stock than this is low stock
+LOW_STOCK_THRESHOLD = 10
+
+
 class ProductMaster(models.Model):
     """
     Product Master Table (prodmast)
@@ -21,6 +28,25 @@ class ProductMaster(models.Model):
         validators=[MinValueValidator(0.00)],
         help_text="Unit price"
     )
+    reorder_point = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=LOW_STOCK_THRESHOLD,
+        validators=[MinValueValidator(0)],
+        help_text="Stock on hand below this is low stock and should be reordered"
+    )
+    reorder_quantity = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+        help_text="Quantity to order at a time (0 to order up to the reorder point)"
+    )
+    needs_reorder = models.BooleanField(
+        default=True,
+        editable=False,
+        help_text="Stock on hand is below the reorder point, kept up to date on every balance change"
+    )
     is_active = models.BooleanField(default=True, help_text="Product status")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -30,21 +56,35 @@ class ProductMaster(models.Model):
         verbose_name = 'Product Master'
         verbose_name_plural = 'Product Masters'
         ordering = ['product_name']
+        indexes = [
+            # Low stock listings and counts only read the active products below their reorder point
+            models.Index(
+                fields=['product_name', 'product_id'], name='prodmast_reorder_idx',
+                condition=models.Q(needs_reorder=True, is_active=True)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product_code} - {self.product_name}"
 
+    def save(self, *args, **kwargs):
+        # A new or changed reorder point can move the product in or out of low stock
+        quantity = None
+        if self.pk:
+            quantity = StockBalance.objects.filter(product_id=self.pk).values_list('quantity', flat=True).first()
+        self.needs_reorder = (quantity or 0) < Decimal(self.reorder_point)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'reorder_point' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'needs_reorder'}
+        super().save(*args, **kwargs)
+
     @property
     def current_stock(self):
-        """Calculate current stock level for this product"""
-        from django.db.models import Sum
-        # Sum all stock movements (positive for in, negative for out)
-        stock_movements = StockDetail.objects.filter(
-            product=self
-        ).aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
-        return stock_movements
+        """Current stock level for this product, read from its stock balance"""
+        try:
+            return self.stock_balance.quantity
+        except StockBalance.DoesNotExist:
+            return 0
 
 
 class StockMain(models.Model):
@@ -57,6 +97,11 @@ class StockMain(models.Model):
         ('OUT', 'Stock Out'),
         ('ADJUST', 'Stock Adjustment'),
     ]
+    TRANSACTION_CODE_PREFIXES = {
+        'IN': 'IN',
+        'OUT': 'OUT',
+        'ADJUST': 'ADJ'
+    }
 
     transaction_id = models.AutoField(primary_key=True)
     transaction_code = models.CharField(max_length=50, unique=True, help_text="Unique transaction code")
@@ -85,6 +130,12 @@ class StockMain(models.Model):
         verbose_name = 'Stock Transaction'
         verbose_name_plural = 'Stock Transactions'
         ordering = ['-transaction_date']
+        indexes = [
+            # Date range listing and keyset pages ordered by newest first
+            models.Index(fields=['-transaction_date', '-transaction_id'], name='stckmain_date_id_idx'),
+            # Type filter combined with a date range
+            models.Index(fields=['transaction_type', '-transaction_date'], name='stckmain_type_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.transaction_code} - {self.get_transaction_type_display()}"
@@ -92,13 +143,47 @@ class StockMain(models.Model):
     def save(self, *args, **kwargs):
         # Auto-generate transaction code if not provided
         if not self.transaction_code:
-            prefix = {
-                'IN': 'IN',
-                'OUT': 'OUT', 
-                'ADJUST': 'ADJ'
-            }.get(self.transaction_type, 'TXN')
-            self.transaction_code = f"{prefix}{timezone.now().strftime('%Y%m%d%H%M%S')}"
-        super().save(*args, **kwargs)
+            from .codes import transaction_codes
+            prefix = self.TRANSACTION_CODE_PREFIXES.get(self.transaction_type, 'TXN')
+            self.transaction_code = transaction_codes.next_code(prefix)
+
+        previous = None
+        if self.pk:
+            previous = StockMain.objects.filter(pk=self.pk).values(
+                'transaction_date', 'transaction_type'
+            ).first()
+        date_changed = previous is not None and previous['transaction_date'] != self.transaction_date
+        type_changed = previous is not None and previous['transaction_type'] != self.transaction_type
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # Moving a transaction in time can change the last movement date of its
+            # products and the stock checkpoints between the old and new date
+            if date_changed:
+                from .balances import refresh_last_movement
+                from .checkpoints import apply_to_checkpoints, revert_from_checkpoints
+                refresh_last_movement(self.details.values_list('product_id', flat=True).distinct())
+                for detail in self.details.only('product_id', 'quantity', 'unit_price'):
+                    value = detail.quantity * detail.unit_price
+                    revert_from_checkpoints(detail.product_id, detail.quantity, value, previous['transaction_date'])
+                    apply_to_checkpoints(detail.product_id, detail.quantity, value, self.transaction_date)
+                # and the order in which the lines are costed
+                from .valuation import revalue_on_commit
+                revalue_on_commit(self.details.values_list('product_id', flat=True).distinct())
+
+            # The lines move to the daily rollup of the new day and type
+            if date_changed or type_changed:
+                from .rollups import apply_to_rollup, revert_from_rollup
+                for detail in self.details.only('product_id', 'quantity', 'unit_price'):
+                    value = detail.quantity * detail.unit_price
+                    revert_from_rollup(
+                        detail.product_id, previous['transaction_date'], previous['transaction_type'],
+                        detail.quantity, value
+                    )
+                    apply_to_rollup(
+                        detail.product_id, self.transaction_date, self.transaction_type, detail.quantity, value
+                    )
 
 
 class StockDetail(models.Model):
@@ -148,6 +233,21 @@ class StockDetail(models.Model):
         verbose_name = 'Stock Detail'
         verbose_name_plural = 'Stock Details'
         ordering = ['-created_at']
+        indexes = [
+            # Stock detail listing and keyset pages ordered by newest first
+            models.Index(fields=['-created_at', '-detail_id'], name='stckdetail_created_id_idx'),
+            # Movement type filters are on the sign of quantity, paged on the same key
+            models.Index(
+                fields=['-created_at', '-detail_id'], name='stckdetail_in_created_id_idx',
+                condition=models.Q(quantity__gt=0)
+            ),
+            models.Index(
+                fields=['-created_at', '-detail_id'], name='stckdetail_out_created_id_idx',
+                condition=models.Q(quantity__lt=0)
+            ),
+            # Product movement history joined to its transactions
+            models.Index(fields=['product', 'transaction'], name='stckdetail_prod_txn_idx'),
+        ]
 
     def __str__(self):
         return f"{self.transaction.transaction_code} - {self.product.product_name} ({self.quantity})"
@@ -160,8 +260,37 @@ class StockDetail(models.Model):
         # For stock out transactions, make quantity negative
         if self.transaction.transaction_type == 'OUT':
             self.quantity = -abs(self.quantity)
-        
-        super().save(*args, **kwargs)
+
+        from .balances import apply_movement, check_availability, revert_movement
+
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = StockDetail.objects.filter(pk=self.pk).values(
+                    'product_id', 'quantity', 'unit_price', 'batch_number', 'expiry_date',
+                    'transaction__transaction_date', 'transaction__transaction_type'
+                ).first()
+
+            # Stock outs and downward adjustments lock the balance and may not take it below zero
+            changes = {self.product_id: Decimal(self.quantity)}
+            if previous:
+                changes[previous['product_id']] = changes.get(previous['product_id'], 0) - previous['quantity']
+            check_availability(changes)
+
+            super().save(*args, **kwargs)
+
+            # Keep the product and batch balances, daily rollup and any later checkpoints in step with this line
+            if previous:
+                revert_movement(
+                    previous['product_id'], previous['quantity'], previous['unit_price'],
+                    previous['transaction__transaction_date'], previous['transaction__transaction_type'],
+                    previous['batch_number'], previous['expiry_date'], self.pk
+                )
+            apply_movement(
+                self.product_id, self.quantity, self.unit_price,
+                self.transaction.transaction_date, self.transaction.transaction_type, self.pk,
+                self.batch_number, self.expiry_date
+            )
 
     @property
     def movement_type(self):
@@ -169,3 +298,461 @@ class StockDetail(models.Model):
         if self.quantity > 0:
             return "IN"
         return "OUT"
+
+
+class StockBalance(models.Model):
+    """
+    Stock Balance Table (stckbal)
+    Stores the materialized on-hand balance of each product, maintained on every stock detail write
+    """
+    product = models.OneToOneField(
+        ProductMaster,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stock_balance',
+        help_text="Product this balance belongs to"
+    )
+    quantity = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="Quantity on hand"
+    )
+    stock_value = models.DecimalField(
+        max_digits=16,
+        decimal_places=2,
+        default=0,
+        help_text="Value of stock on hand at transaction prices"
+    )
+    last_movement_date = models.DateTimeField(blank=True, null=True, help_text="Date of the latest stock movement")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckbal'
+        verbose_name = 'Stock Balance'
+        verbose_name_plural = 'Stock Balances'
+
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity}"
+
+
+class StockValuation(models.Model):
+    """
+    Stock Valuation Table (stckval)
+    Stores the cost of each product's stock on hand, maintained incrementally by inventory.valuation
+    """
+    AVERAGE = 'average'
+    FIFO = 'fifo'
+    METHODS = [
+        (AVERAGE, 'Weighted average cost'),
+        (FIFO, 'First in, first out'),
+    ]
+
+    product = models.OneToOneField(
+        ProductMaster,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stock_valuation',
+        help_text="Product this valuation belongs to"
+    )
+    method = models.CharField(max_length=10, choices=METHODS, help_text="Costing method of the valuation")
+    quantity = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="Quantity on hand"
+    )
+    cost_value = models.DecimalField(
+        max_digits=20,
+        decimal_places=4,
+        default=0,
+        help_text="Cost of the stock on hand"
+    )
+    unit_cost = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        blank=True,
+        null=True,
+        help_text="Average cost per unit on hand, or the latest receipt cost when none is on hand"
+    )
+    valued_through = models.DateTimeField(help_text="Transaction date of the latest movement valued")
+    last_detail_id = models.IntegerField(help_text="Stock detail line of the latest movement valued")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckval'
+        verbose_name = 'Stock Valuation'
+        verbose_name_plural = 'Stock Valuations'
+
+    def __str__(self):
+        return f"{self.product_id} - {self.cost_value} ({self.method})"
+
+
+class StockCostLayer(models.Model):
+    """
+    Stock Cost Layer Table (stckcostlyr)
+    Stores the receipts still on hand of each product for FIFO valuation, oldest first
+    """
+    layer_id = models.AutoField(primary_key=True)
+    product = models.ForeignKey(
+        ProductMaster,
+        on_delete=models.CASCADE,
+        related_name='cost_layers',
+        help_text="Product received"
+    )
+    detail_id = models.IntegerField(help_text="Stock detail line that received the layer")
+    received_at = models.DateTimeField(help_text="Transaction date of the receipt")
+    quantity = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        help_text="Quantity of the receipt not issued yet"
+    )
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, help_text="Cost per unit of the receipt")
+
+    class Meta:
+        db_table = 'stckcostlyr'
+        verbose_name = 'Stock Cost Layer'
+        verbose_name_plural = 'Stock Cost Layers'
+        indexes = [
+            # Layers are issued in receipt order
+            models.Index(fields=['product', 'received_at', 'detail_id'], name='stckcostlyr_product_fifo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity} @ {self.unit_cost}"
+
+
+class StockBatchBalance(models.Model):
+    """
+    Stock Batch Balance Table (stckbatch)
+    Stores the quantity on hand of each product per batch and expiry date, maintained on every stock detail write
+    """
+    batch_balance_id = models.AutoField(primary_key=True)
+    product = models.ForeignKey(
+        ProductMaster,
+        on_delete=models.CASCADE,
+        related_name='batch_balances',
+        help_text="Product of the batch"
+    )
+    batch_number = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Batch or lot number, empty for stock moved without one"
+    )
+    expiry_date = models.DateField(blank=True, null=True, help_text="Expiry date of the batch, if any")
+    quantity = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="Quantity of the batch on hand"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckbatch'
+        verbose_name = 'Stock Batch Balance'
+        verbose_name_plural = 'Stock Batch Balances'
+        ordering = ['product', 'expiry_date', 'batch_number']
+        constraints = [
+            # One row per product, batch and expiry date; NULL dates need their own constraint
+            models.UniqueConstraint(
+                fields=['product', 'batch_number', 'expiry_date'], name='stckbatch_product_batch_expiry_uniq',
+                condition=models.Q(expiry_date__isnull=False)
+            ),
+            models.UniqueConstraint(
+                fields=['product', 'batch_number'], name='stckbatch_product_batch_uniq',
+                condition=models.Q(expiry_date__isnull=True)
+            ),
+        ]
+        indexes = [
+            # Expiring stock is a range scan over the batches on hand, soonest first
+            models.Index(
+                fields=['expiry_date', 'product', 'batch_number'], name='stckbatch_onhand_expiry_idx',
+                condition=models.Q(quantity__gt=0, expiry_date__isnull=False)
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.batch_number or '-'} - {self.quantity}"
+
+
+class StockBatchAllocation(models.Model):
+    """
+    Stock Batch Allocation Table (stckbatchalloc)
+    Stores the batches a stock out without a batch number was drawn from, first expired first out
+    """
+    allocation_id = models.AutoField(primary_key=True)
+    product = models.ForeignKey(
+        ProductMaster,
+        on_delete=models.CASCADE,
+        related_name='batch_allocations',
+        help_text="Product taken out"
+    )
+    detail_id = models.IntegerField(help_text="Stock detail line drawn from the batch")
+    batch_number = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Batch or lot number drawn from, empty for stock without one"
+    )
+    expiry_date = models.DateField(blank=True, null=True, help_text="Expiry date of the batch, if any")
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, help_text="Quantity taken from the batch")
+
+    class Meta:
+        db_table = 'stckbatchalloc'
+        verbose_name = 'Stock Batch Allocation'
+        verbose_name_plural = 'Stock Batch Allocations'
+        indexes = [
+            # Reverting a line returns what it took to its batches
+            models.Index(fields=['detail_id'], name='stckbatchalloc_detail_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.detail_id} {self.batch_number or '-'} - {self.quantity}"
+
+
+class StockCheckpoint(models.Model):
+    """
+    Stock Checkpoint Table (stckchkpt)
+    Stores the closing balance of each product at a period boundary, for point-in-time stock queries
+    """
+    checkpoint_id = models.AutoField(primary_key=True)
+    product = models.ForeignKey(
+        ProductMaster,
+        on_delete=models.CASCADE,
+        related_name='stock_checkpoints',
+        help_text="Product this checkpoint belongs to"
+    )
+    period_end = models.DateTimeField(
+        help_text="End of the period (exclusive); the balance covers movements dated before it"
+    )
+    quantity = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="Quantity on hand at the end of the period"
+    )
+    stock_value = models.DecimalField(
+        max_digits=16,
+        decimal_places=2,
+        default=0,
+        help_text="Value of stock on hand at the end of the period"
+    )
+    last_movement_date = models.DateTimeField(blank=True, null=True, help_text="Date of the latest movement before period end")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckchkpt'
+        verbose_name = 'Stock Checkpoint'
+        verbose_name_plural = 'Stock Checkpoints'
+        ordering = ['product', '-period_end']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'period_end'], name='stckchkpt_product_period_uniq'),
+        ]
+        indexes = [
+            # Latest boundary before a date and the boundaries after a backdated movement
+            models.Index(fields=['period_end'], name='stckchkpt_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.period_end:%Y-%m-%d} - {self.quantity}"
+
+
+class StockDailyMovement(models.Model):
+    """
+    Stock Daily Movement Table (stckdaily)
+    Stores the quantity and value moved per product, day and transaction type, maintained on every stock detail write
+    """
+    rollup_id = models.AutoField(primary_key=True)
+    product = models.ForeignKey(
+        ProductMaster,
+        on_delete=models.CASCADE,
+        related_name='daily_movements',
+        help_text="Product moved"
+    )
+    day = models.DateField(help_text="Transaction date (in the server time zone)")
+    transaction_type = models.CharField(
+        max_length=10,
+        choices=StockMain.TRANSACTION_TYPES,
+        help_text="Type of the transactions"
+    )
+    quantity = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="Sum of the moved quantities (negative for stock out)"
+    )
+    total_value = models.DecimalField(
+        max_digits=16,
+        decimal_places=2,
+        default=0,
+        help_text="Sum of the moved quantities at their unit prices"
+    )
+    movement_count = models.IntegerField(default=0, help_text="Number of stock detail lines")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckdaily'
+        verbose_name = 'Stock Daily Movement'
+        verbose_name_plural = 'Stock Daily Movements'
+        ordering = ['product', 'day', 'transaction_type']
+        constraints = [
+            # Also serves the date range read of a product's time series
+            models.UniqueConstraint(fields=['product', 'day', 'transaction_type'], name='stckdaily_product_day_type_uniq'),
+        ]
+        indexes = [
+            # Category time series read every product of the category for a date range
+            models.Index(fields=['day', 'product'], name='stckdaily_day_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.day} {self.transaction_type} - {self.quantity}"
+
+
+class TransactionCodeSequence(models.Model):
+    """
+    Transaction Code Sequence Table (stckseq)
+    Stores the next unreserved transaction code number for each code prefix
+    """
+    prefix = models.CharField(max_length=10, primary_key=True, help_text="Transaction code prefix")
+    next_value = models.BigIntegerField(default=1, help_text="First number not yet handed out")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stckseq'
+        verbose_name = 'Transaction Code Sequence'
+        verbose_name_plural = 'Transaction Code Sequences'
+
+    def __str__(self):
+        return f"{self.prefix} - {self.next_value}"
+
+
+def new_version_nonce():
+    return secrets.token_hex(8)
+
+
+class ResourceVersion(models.Model):
+    """
+    Resource Version Table (resver)
+    Stores a counter per API resource, bumped on every committed write, that identifies cached responses
+    """
+    PRODUCTS = 'products'
+    TRANSACTIONS = 'transactions'
+    STOCK = 'stock'
+    RESOURCES = [
+        (PRODUCTS, 'Products'),
+        (TRANSACTIONS, 'Stock transactions'),
+        (STOCK, 'Stock details and balances'),
+    ]
+
+    name = models.CharField(max_length=50, primary_key=True, choices=RESOURCES, help_text="Resource name")
+    version = models.BigIntegerField(default=0, help_text="Number of committed writes to the resource")
+    updated_at = models.DateTimeField(default=timezone.now, help_text="Time of the latest committed write")
+    nonce = models.CharField(
+        max_length=16, default=new_version_nonce,
+        help_text="Random token of this counter row, so versions of different databases never match"
+    )
+
+    class Meta:
+        db_table = 'resver'
+        verbose_name = 'Resource Version'
+        verbose_name_plural = 'Resource Versions'
+
+    def __str__(self):
+        return f"{self.name} - {self.version}"
+
+
+class SearchToken(models.Model):
+    """
+    Search Token Table (srchtoken)
+    Stores the lower-cased words of searched columns for prefix search on databases without trigram indexes
+    """
+    PRODUCT = 'product'
+    TRANSACTION = 'transaction'
+    ENTITY_TYPES = [
+        (PRODUCT, 'Product'),
+        (TRANSACTION, 'Transaction'),
+    ]
+    TOKEN_LENGTH = 100
+
+    token_id = models.AutoField(primary_key=True)
+    entity = models.CharField(max_length=20, choices=ENTITY_TYPES, help_text="Kind of indexed object")
+    object_id = models.IntegerField(help_text="Primary key of the indexed object")
+    token = models.CharField(max_length=TOKEN_LENGTH, help_text="Lower-cased word")
+
+    class Meta:
+        db_table = 'srchtoken'
+        verbose_name = 'Search Token'
+        verbose_name_plural = 'Search Tokens'
+        indexes = [
+            models.Index(fields=['entity', 'token', 'object_id'], name='srchtoken_lookup_idx'),
+            models.Index(fields=['entity', 'object_id'], name='srchtoken_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entity} {self.object_id} - {self.token}"
+
+
+class ReportJob(models.Model):
+    """
+    Report Job Table (rptjob)
+    Stores the queue of background reports run by run_report_worker and the files they produced
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    FORMATS = [
+        ('csv', 'CSV'),
+        ('ndjson', 'Newline-delimited JSON'),
+    ]
+
+    job_id = models.AutoField(primary_key=True)
+    report = models.CharField(max_length=50, help_text="Name of the report")
+    export_format = models.CharField(max_length=10, choices=FORMATS, default='csv', help_text="Format of the result file")
+    params = models.JSONField(default=dict, blank=True, help_text="Normalized report parameters")
+    params_hash = models.CharField(max_length=64, help_text="Digest of report, format and parameters")
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED, help_text="Job status")
+    requested_by = models.CharField(max_length=150, blank=True, null=True, help_text="User who requested the report")
+    worker = models.CharField(max_length=100, blank=True, null=True, help_text="Worker running or that ran the job")
+    attempts = models.IntegerField(default=0, help_text="Number of times a worker started the job")
+    data_versions = models.JSONField(
+        default=dict, blank=True,
+        help_text="Version counters of the resources the result was read at, for reusing it"
+    )
+    row_count = models.IntegerField(default=0, help_text="Rows written to the result so far")
+    result_file = models.CharField(max_length=255, blank=True, null=True, help_text="Result file under REPORTS_ROOT")
+    result_size = models.BigIntegerField(blank=True, null=True, help_text="Size of the result file in bytes")
+    error = models.TextField(blank=True, null=True, help_text="Error of a failed job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True, help_text="When a worker last started the job")
+    heartbeat_at = models.DateTimeField(
+        blank=True, null=True, help_text="When the running job last reported progress"
+    )
+    finished_at = models.DateTimeField(blank=True, null=True, help_text="When the job finished")
+
+    class Meta:
+        db_table = 'rptjob'
+        verbose_name = 'Report Job'
+        verbose_name_plural = 'Report Jobs'
+        ordering = ['-created_at', '-job_id']
+        indexes = [
+            # Workers claim the oldest queued job
+            models.Index(
+                fields=['created_at', 'job_id'], name='rptjob_queued_idx',
+                condition=models.Q(status='queued')
+            ),
+            # Reuse of a job with the same parameters, newest first
+            models.Index(fields=['params_hash', '-created_at'], name='rptjob_params_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id} {self.report} - {self.status}"
@@ -0,0 +1,166 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a WHERE clause on the ordering key of the last row
+of the previous page instead of an OFFSET, so every page costs the same
+index range read no matter how deep it is. The total count is optional.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+BIGINT_MAX = 2 ** 63 - 1
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate on a unique, composite ordering key.
+
+    `ordering` lists the key fields, all ascending or all descending, with a
+    unique field (normally the primary key) last, e.g.
+    ('-transaction_date', '-transaction_id').
+    """
+    ordering = ()
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        # The total is optional since it is the only part that grows with the table
+        self.count = None
+        if request.query_params.get(self.count_query_param, 'true').lower() != 'false':
+            self.count = queryset.count()
+
+        position = self.decode_cursor(request, queryset.model)
+        rows = list(self.page_queryset(queryset, position))
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def page_queryset(self, queryset, position=None):
+        """The query of the page after the position (the first page without one), plus one row"""
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        return queryset[:self.page_size + 1]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def after(self, position):
+        """Rows strictly after the position: (a, b) > (x, y) == a > x OR (a = x AND b > y)"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        # The OR alone gives SQLite no range to read the index by, so bound the leading column too
+        leading = self.ordering[0]
+        bound = 'lte' if leading.startswith('-') else 'gte'
+        return Q(**{f'{leading.lstrip("-")}__{bound}': position[0]}) & condition
+
+    def position_of(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(row, dict):
+                value = row[name]
+            else:
+                value = row
+                for part in name.split('__'):
+                    value = getattr(value, part)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def ordering_fields(self, model):
+        """Model fields of the ordering key, following relations"""
+        fields = []
+        for field in self.ordering:
+            opts = model._meta
+            for part in field.lstrip('-').split('__'):
+                model_field = opts.get_field(part)
+                if model_field.related_model is not None:
+                    opts = model_field.related_model._meta
+            fields.append(model_field)
+        return fields
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursors come from the client, so every value has to be a valid value of its field
+        try:
+            position = [
+                field.clean(value, None) for field, value in zip(self.ordering_fields(model), position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        # No database stores a wider integer (and SQLite declares no range for its fields)
+        if any(value is None or (isinstance(value, int) and abs(value) > BIGINT_MAX) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class TransactionPagination(KeysetPagination):
+    ordering = ('-transaction_date', '-transaction_id')
+
+
+class StockDetailPagination(KeysetPagination):
+    ordering = ('-created_at', '-detail_id')
+
+
+class StockMovementPagination(KeysetPagination):
+    ordering = ('-transaction__transaction_date', '-detail_id')
@@ -0,0 +1,32 @@
+"""
+Concurrent database queries for the async views.
+
+Django's async queryset methods (acount(), aaggregate(), ...) hand every call
+to the single thread-sensitive executor, so gathering several of them still
+runs the queries one after another. The helpers here run each query in a
+worker thread with its own database connection instead, so independent
+queries overlap and a response waits for the slowest one rather than for
+their sum. Worker connections follow CONN_MAX_AGE like request connections.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+
+def _on_worker_connection(func, args):
+    try:
+        return func(*args)
+    finally:
+        for connection in connections.all(initialized_only=True):
+            connection.close_if_unusable_or_obsolete()
+
+
+async def run_query(func, *args):
+    """Run a function that queries the database on a worker connection"""
+    return await sync_to_async(_on_worker_connection, thread_sensitive=False)(func, args)
+
+
+async def gather_queries(*funcs):
+    """Run independent query functions concurrently and return their results in order"""
+    return await asyncio.gather(*(run_query(func) for func in funcs))
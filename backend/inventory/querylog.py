@@ -0,0 +1,270 @@
+"""
+Slow-query log with EXPLAIN capture and N+1 detection.
+
+Opt in with SLOW_QUERY_LOG_ENABLED. Like the request metrics, a wrapper on
+every database connection times the statements of the request found in a
+context variable. A statement slower than SLOW_QUERY_THRESHOLD_MS is logged
+with its view, the shape of its parameters (their types, never their values)
+and its plan: EXPLAIN (EXPLAIN QUERY PLAN on SQLite) runs on the same
+connection right after it. A statement run SLOW_QUERY_REPEAT_THRESHOLD times
+or more within one request is logged as an N+1 pattern.
+
+The log is a ring buffer of the last SLOW_QUERY_LOG_SIZE entries in the
+METRICS_LOCATION SQLite file, so the entries of every worker can be read from
+/api/slow-queries/ and with the show_slow_queries command.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, transaction
+
+from .metrics import view_label
+
+logger = logging.getLogger(__name__)
+
+SLOW = 'slow'
+N_PLUS_ONE = 'n+1'
+KINDS = (SLOW, N_PLUS_ONE)
+
+# Statements that can be explained; transaction control and DDL are neither explained nor counted
+EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+# Slow statements logged per request, so one pathological request cannot flush the whole log
+MAX_SLOW_PER_REQUEST = 20
+MAX_SQL_LENGTH = 4000
+
+
+def params_shape(params, many=False):
+    """The types of a statement's parameters, e.g. '(int, str × 3)' or '50 × (int, Decimal)'"""
+    if many:
+        if not isinstance(params, (list, tuple)):
+            return 'many'
+        return f"{len(params)} × {params_shape(params[0]) if params else '()'}"
+    if params is None:
+        return ''
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+
+    runs = []
+    for value in params:
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return '(' + ', '.join(name if count == 1 else f'{name} × {count}' for name, count in runs) + ')'
+
+
+def explain(connection, sql, params):
+    """The query plan of a statement, or why it could not be read"""
+    token = _explaining.set(True)
+    try:
+        # A savepoint keeps a failing EXPLAIN from breaking the request's transaction
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        _explaining.reset(token)
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+class _RequestQueries:
+    """Statements run for the request being handled, possibly from several threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # sql -> [executions, total seconds, parameter shape of the first execution]
+        self.statements = {}
+        self.slow = []
+        self.plans = {}
+
+    def add(self, connection, sql, params, many, duration):
+        if not EXPLAINABLE.match(sql):
+            return
+        with self.lock:
+            statement = self.statements.get(sql)
+            if statement is None:
+                statement = self.statements[sql] = [0, 0.0, params_shape(params, many)]
+            statement[0] += 1
+            statement[1] += duration
+            slow = duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS and len(self.slow) < MAX_SLOW_PER_REQUEST
+            needs_plan = slow and not many and sql not in self.plans
+            if needs_plan:
+                self.plans[sql] = None  # claimed, so concurrent repeats do not explain it again
+        if not slow:
+            return
+
+        if needs_plan:
+            plan = explain(connection, sql, params)
+            with self.lock:
+                self.plans[sql] = plan
+        with self.lock:
+            self.slow.append((sql, statement[2], duration, self.plans.get(sql)))
+
+    def entries(self, request):
+        """Log entries for this request: its slow statements and repeated ones"""
+        recorded_at = time.time()
+        context = (view_label(request), request.method, request.path[:500])
+        entries = [
+            (recorded_at, SLOW, *context, sql[:MAX_SQL_LENGTH], shape, duration * 1000, 1, plan)
+            for sql, shape, duration, plan in self.slow
+        ]
+        entries += [
+            (recorded_at, N_PLUS_ONE, *context, sql[:MAX_SQL_LENGTH], shape, total * 1000, count, None)
+            for sql, (count, total, shape) in self.statements.items()
+            if count >= settings.SLOW_QUERY_REPEAT_THRESHOLD
+        ]
+        return entries
+
+
+_current_request = ContextVar('inventory_request_queries', default=None)
+_explaining = ContextVar('inventory_explaining', default=False)
+
+
+def _log_query(execute, sql, params, many, context):
+    queries = _current_request.get()
+    if queries is None or _explaining.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    queries.add(context['connection'], sql, params, many, time.perf_counter() - started)
+    return result
+
+
+def install_query_logger(connection):
+    """Time the statements of a database connection for the slow-query log"""
+    if _log_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_log_query)
+
+
+class SlowQueryLog:
+    """Ring buffer of log entries in a SQLite file shared by every worker"""
+
+    COLUMNS = (
+        'id', 'recorded_at', 'kind', 'view', 'method', 'path', 'sql', 'params',
+        'duration_ms', 'count', 'plan',
+    )
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS slow_queries ("
+        " id INTEGER PRIMARY KEY, recorded_at REAL, kind TEXT, view TEXT, method TEXT, path TEXT,"
+        " sql TEXT, params TEXT, duration_ms REAL, count INTEGER, plan TEXT)"
+    )
+
+    def __init__(self):
+        self._schema_ready = False
+
+    def _connect(self):
+        connection = sqlite3.connect(settings.METRICS_LOCATION, timeout=5)
+        if not self._schema_ready:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(self.SCHEMA)
+            self._schema_ready = True
+        return connection
+
+    def append(self, entries):
+        """Add entries and drop the oldest beyond SLOW_QUERY_LOG_SIZE"""
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.executemany(
+                        f"INSERT INTO slow_queries ({', '.join(self.COLUMNS[1:])}) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        entries
+                    )
+                    connection.execute(
+                        "DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?",
+                        (settings.SLOW_QUERY_LOG_SIZE,)
+                    )
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            # The log must never break a request; the entries are dropped
+            logger.exception("Could not write the slow-query log to %s", settings.METRICS_LOCATION)
+
+    def entries(self, kind=None, view=None, limit=None):
+        """Logged entries as dicts, newest first"""
+        conditions, params = [], []
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if view:
+            conditions.append("view = ?")
+            params.append(view)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM slow_queries {where}ORDER BY id DESC LIMIT ?",
+                (*params, limit or -1)
+            ).fetchall()
+        finally:
+            connection.close()
+        entries = [dict(zip(self.COLUMNS, row)) for row in rows]
+        for entry in entries:
+            entry['recorded_at'] = datetime.fromtimestamp(entry['recorded_at'], tz=timezone.utc)
+        return entries
+
+    def clear(self):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM slow_queries")
+        finally:
+            connection.close()
+
+
+slow_query_log = SlowQueryLog()
+
+
+class SlowQueryLogMiddleware:
+    """Log the slow and repeated statements of every request when SLOW_QUERY_LOG_ENABLED is set"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = _RequestQueries()
+        token = _current_request.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        entries = queries.entries(request)
+        if entries:
+            slow_query_log.append(entries)
+        return response
+
+    async def __acall__(self, request):
+        queries = _RequestQueries()
+        token = _current_request.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        entries = queries.entries(request)
+        if entries:
+            # Keep the file write off the event loop
+            await sync_to_async(slow_query_log.append, thread_sensitive=False)(entries)
+        return response
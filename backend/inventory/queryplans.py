@@ -0,0 +1,104 @@
+"""
+Query plan checks for the hot list and filter paths.
+
+The querysets are built through the views and their paginators, first and
+later pages alike, so a change to a view's filtering or a paginator's
+ordering is checked against the indexes that back it. A plan line
+reading a whole table row by row counts as a full scan.
+"""
+import re
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+
+from .models import ProductMaster
+from .pagination import StockMovementPagination
+from .views import (
+    ExpiringStockView, InventorySummaryView, ProductMasterViewSet, ReorderSuggestionView, StockDetailViewSet,
+    StockMainViewSet
+)
+
+# Plan lines that mean a whole table is read row by row
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!.*\bUSING\b)(\w+)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+def plans_checked():
+    """Whether the plans of the configured database can be checked"""
+    return connection.vendor in FULL_SCAN_PATTERNS
+
+
+def explain(queryset):
+    if connection.vendor != 'postgresql':
+        return queryset.explain()
+    # Small tables are cheaper to scan, so ask the planner what it would do at scale
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+def _view(view_class, params, action='list'):
+    view = view_class()
+    view.request = Request(RequestFactory().get('/', params))
+    view.format_kwarg = None
+    view.action = action
+    return view
+
+
+def view_queryset(view_class, params):
+    return _view(view_class, params).get_queryset()
+
+
+def _first_page(view_class, params):
+    """The page query of a page-numbered list view"""
+    view = _view(view_class, params)
+    return view.get_queryset()[:view.paginator.page_size]
+
+
+def _keyset_pages(name, paginator, queryset, position):
+    """The first page and the page after position of a keyset paginated list"""
+    yield name, paginator.page_queryset(queryset)
+    yield f'{name}, next page', paginator.page_queryset(queryset, position)
+
+
+def hot_queries():
+    """(name, queryset) of the hot views' queries, built through the views and their paginators"""
+    end = timezone.now()
+    start = end - timedelta(days=30)
+    date_range = {'start_date': start.isoformat(), 'end_date': end.isoformat()}
+    # Any position works for the plan; pages after one compare the whole ordering key
+    position = [end, 2 ** 31 - 1]
+
+    for name, view_class, params in (
+        ('transactions by date range', StockMainViewSet, date_range),
+        ('transactions by type and date range', StockMainViewSet, {'transaction_type': 'IN', **date_range}),
+        ('stock details, newest first', StockDetailViewSet, {}),
+        ('stock details, stock in only', StockDetailViewSet, {'movement_type': 'IN'}),
+        ('stock details, stock out only', StockDetailViewSet, {'movement_type': 'OUT'}),
+    ):
+        view = _view(view_class, params)
+        yield from _keyset_pages(name, view.paginator, view.get_queryset(), position)
+
+    product = ProductMaster.objects.order_by('pk').first() or ProductMaster(pk=0)
+    movements = _view(ProductMasterViewSet, date_range, action='stock_movements').get_movements(product)
+    yield from _keyset_pages('product stock movements by date range', StockMovementPagination(), movements, position)
+
+    yield 'inventory summary, low stock only', _first_page(InventorySummaryView, {'low_stock_only': 'true'})
+    yield 'reorder suggestions', _first_page(ReorderSuggestionView, {})
+    yield 'batches expiring within 30 days', _first_page(ExpiringStockView, {'within_days': '30'})
+
+
+def check_hot_queries():
+    """(name, plan, [fully scanned tables]) of every hot query"""
+    pattern = FULL_SCAN_PATTERNS[connection.vendor]
+    results = []
+    for name, queryset in hot_queries():
+        plan = explain(queryset)
+        results.append((name, plan, sorted(set(pattern.findall(plan)))))
+    return results
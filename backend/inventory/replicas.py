@@ -0,0 +1,165 @@
+"""
+Read replicas with read-your-writes stickiness.
+
+DATABASE_REPLICA_URLS adds the replica databases (replica1, replica2, ...)
+next to the primary ('default'). ReplicaRoutingMiddleware picks one replica
+for each GET, HEAD or OPTIONS request and ReplicaRouter sends the request's
+reads there, so list, report and dashboard queries stay off the primary.
+Writes, reads inside a transaction and everything outside a request (the
+management commands, unless they use use_replica()) go to the primary.
+
+A request that writes reads from the primary from then on, and its response
+carries a recent-write cookie and X-Recent-Write header. Requests that send
+either back within REPLICA_STICKY_SECONDS read from the primary too, so a
+client sees its own writes however far the replicas lag behind.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+RECENT_WRITE_COOKIE = 'recent_write'
+RECENT_WRITE_HEADER = 'X-Recent-Write'
+
+
+class _Routing:
+    """Database the current request reads from: a replica alias, or None for the primary"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.wrote = False
+
+
+_routing = ContextVar('inventory_read_database', default=None)
+
+
+def current_replica():
+    """Alias of the replica the current request or block reads from, or None"""
+    state = _routing.get()
+    return state.alias if state is not None else None
+
+
+@contextmanager
+def use_replica(alias=None):
+    """Read from a replica (a random one unless given) inside the block, e.g. in reporting jobs"""
+    replicas = settings.REPLICA_DATABASES
+    token = _routing.set(_Routing(alias or (random.choice(replicas) if replicas else None)))
+    try:
+        yield current_replica()
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    """Reads of replica-routed requests go to their replica, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.alias is None:
+            return DEFAULT_DB_ALIAS
+        # Related objects are read from the database their instance came from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            # Read your own writes for the rest of the request
+            state.alias = None
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every database holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        return db == DEFAULT_DB_ALIAS
+
+
+def _stream_from(state, content):
+    """Iterate a streaming response with its request's database routing still in effect"""
+    iterator = iter(content)
+    while True:
+        token = _routing.set(state)
+        try:
+            chunk = next(iterator, None)
+        finally:
+            _routing.reset(token)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    """Route the reads of safe requests to a replica unless the client wrote recently"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _Routing(self.read_alias(request))
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = _Routing(self.read_alias(request))
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(request, response, state)
+
+    def read_alias(self, request):
+        if request.method not in SAFE_METHODS or self.recently_wrote(request):
+            return None
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def recently_wrote(self, request):
+        for value in (request.COOKIES.get(RECENT_WRITE_COOKIE), request.headers.get(RECENT_WRITE_HEADER)):
+            if not value:
+                continue
+            try:
+                written_at = float(value)
+            except ValueError:
+                return True
+            if time.time() - written_at < settings.REPLICA_STICKY_SECONDS:
+                return True
+        return False
+
+    def finish(self, request, response, state):
+        if state.wrote or (request.method not in SAFE_METHODS and response.status_code < 400):
+            written_at = f'{time.time():.3f}'
+            response.set_cookie(
+                RECENT_WRITE_COOKIE, written_at, max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+            response[RECENT_WRITE_HEADER] = written_at
+        elif state.alias is not None and response.streaming and not response.is_async:
+            # Exports query while they stream, after this middleware has returned
+            response.streaming_content = _stream_from(state, response.streaming_content)
+        return response
@@ -0,0 +1,471 @@
+"""
+Background reports: a database-backed job queue and the worker that runs it.
+
+POST /api/reports/ records a ReportJob. `manage.py run_report_worker` claims
+queued jobs with a conditional UPDATE, so any number of worker processes can
+share the table without a message broker, runs them on a pool of threads and
+writes each result to a file under REPORTS_ROOT that the API serves once the
+job is done. Reports read from a replica when replicas are configured.
+
+A request for the same report, format and parameters reuses the queued or
+running job, or the finished one while its file has not expired and the
+version counters of the resources it read are unchanged.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from time import monotonic
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .exports import STOCK_DETAIL_COLUMNS, TRANSACTION_COLUMNS, export_lines, export_rows
+from .models import (
+    ProductMaster, ReportJob, ResourceVersion, StockDailyMovement, StockDetail, StockMain
+)
+from .replicas import use_replica
+from .rollups import SERIES_PREFIXES
+from .versions import get_versions
+
+logger = logging.getLogger(__name__)
+
+# Jobs given up on after this many abandoned runs
+MAX_ATTEMPTS = 3
+# Rows between progress updates of a running job
+PROGRESS_ROWS = 5000
+# Seconds between heartbeats of a running job that is slow to produce rows
+HEARTBEAT_INTERVAL = 30
+# Seconds between purges of expired results
+PURGE_INTERVAL = 60
+
+
+def _date(name, value):
+    day = parse_date(str(value))
+    if day is None:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD).")
+    return day
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Report:
+    """
+    A report: its parameters, the resources it reads and a function returning
+    (column names, row iterator) for normalized parameters.
+    """
+
+    def __init__(self, name, description, resources, params, rows, default_days=None):
+        self.name = name
+        self.description = description
+        self.resources = resources
+        self.params = params
+        self.rows = rows
+        self.default_days = default_days
+
+    def clean(self, params):
+        """Normalized copy of the parameters; raises ValueError if they are invalid"""
+        params = dict(params or {})
+        unknown = sorted(set(params) - set(self.params))
+        if unknown:
+            raise ValueError(f"Unknown parameter(s) for {self.name}: {', '.join(unknown)}.")
+
+        cleaned = {}
+        for name, value in params.items():
+            if value in (None, ''):
+                continue
+            if name.endswith('_date'):
+                cleaned[name] = _date(name, value)
+            elif name == 'product':
+                try:
+                    cleaned[name] = int(value)
+                except (TypeError, ValueError):
+                    raise ValueError("product must be a product id.")
+            elif name == 'transaction_type':
+                types = dict(StockMain.TRANSACTION_TYPES)
+                if value not in types:
+                    raise ValueError(f"transaction_type must be one of: {', '.join(types)}.")
+                cleaned[name] = value
+            else:
+                cleaned[name] = str(value)
+
+        # Relative windows are pinned to dates so identical requests share a result
+        if self.default_days is not None:
+            cleaned.setdefault('end_date', timezone.localdate())
+            cleaned.setdefault('start_date', cleaned['end_date'] - timedelta(days=self.default_days - 1))
+        if cleaned.get('start_date') and cleaned.get('end_date') and cleaned['start_date'] > cleaned['end_date']:
+            raise ValueError("start_date must not be after end_date.")
+        return {name: value.isoformat() if hasattr(value, 'isoformat') else value for name, value in cleaned.items()}
+
+    def describe(self):
+        return {'report': self.name, 'description': self.description, 'params': list(self.params)}
+
+
+def _date_range(queryset, params, field):
+    if params.get('start_date'):
+        queryset = queryset.filter(**{f'{field}__gte': _day_start(_date('start_date', params['start_date']))})
+    if params.get('end_date'):
+        end = _date('end_date', params['end_date']) + timedelta(days=1)
+        queryset = queryset.filter(**{f'{field}__lt': _day_start(end)})
+    return queryset
+
+
+def _inventory_valuation(params):
+    quantity_field = DecimalField(max_digits=14, decimal_places=2)
+    products = ProductMaster.objects.filter(is_active=True)
+    if params.get('category'):
+        products = products.filter(category__icontains=params['category'])
+    products = products.annotate(
+        quantity=Coalesce(F('stock_balance__quantity'), Value(Decimal('0')), output_field=quantity_field),
+        cost_value=Coalesce(
+            F('stock_valuation__cost_value'), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=20, decimal_places=4)
+        ),
+    ).annotate(
+        list_value=ExpressionWrapper(
+            F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=16, decimal_places=2)
+        ),
+    ).order_by('product_code')
+    return export_rows(products, [
+        ('product_id', 'product_id'),
+        ('product_code', 'product_code'),
+        ('product_name', 'product_name'),
+        ('category', 'category'),
+        ('unit', 'unit'),
+        ('quantity', 'quantity'),
+        ('unit_price', 'unit_price'),
+        ('list_value', 'list_value'),
+        ('unit_cost', 'stock_valuation__unit_cost'),
+        ('cost_value', 'cost_value'),
+        ('valuation_method', 'stock_valuation__method'),
+        ('reorder_point', 'reorder_point'),
+        ('needs_reorder', 'needs_reorder'),
+    ])
+
+
+def _movement_summary(params):
+    rollups = StockDailyMovement.objects.filter(
+        day__gte=_date('start_date', params['start_date']),
+        day__lte=_date('end_date', params['end_date']),
+    )
+    if params.get('category'):
+        rollups = rollups.filter(product__category__icontains=params['category'])
+
+    totals = {}
+    columns = [
+        ('product_id', 'product_id'),
+        ('product_code', 'product__product_code'),
+        ('product_name', 'product__product_name'),
+    ]
+    for transaction_type, prefix in SERIES_PREFIXES.items():
+        for measure, field in (('quantity', 'quantity'), ('value', 'total_value')):
+            totals[f'{prefix}_{measure}'] = Sum(field, filter=Q(transaction_type=transaction_type))
+    totals.update(
+        net_quantity=Sum('quantity'),
+        net_value=Sum('total_value'),
+        movement_count=Sum('movement_count'),
+    )
+    columns += [(name, name) for name in totals]
+    rows = rollups.order_by().values('product_id', 'product__product_code', 'product__product_name').annotate(
+        **totals
+    ).order_by('product__product_code')
+    return export_rows(rows, columns)
+
+
+def _transactions(params):
+    transactions = _date_range(StockMain.objects.all(), params, 'transaction_date')
+    if params.get('transaction_type'):
+        transactions = transactions.filter(transaction_type=params['transaction_type'])
+    transactions = transactions.order_by('-transaction_date', '-transaction_id', 'details__detail_id')
+    return export_rows(transactions, TRANSACTION_COLUMNS)
+
+
+def _stock_details(params):
+    details = _date_range(StockDetail.objects.all(), params, 'transaction__transaction_date')
+    if params.get('product'):
+        details = details.filter(product_id=params['product'])
+    return export_rows(details.order_by('-created_at', '-detail_id'), STOCK_DETAIL_COLUMNS)
+
+
+REPORTS = {report.name: report for report in (
+    Report(
+        'inventory_valuation', "Stock on hand of every active product at list price and at cost",
+        (ResourceVersion.PRODUCTS, ResourceVersion.STOCK), ('category',), _inventory_valuation,
+    ),
+    Report(
+        'movement_summary', "In, out and adjustment totals per product over a period (default the last 30 days)",
+        (ResourceVersion.PRODUCTS, ResourceVersion.STOCK), ('start_date', 'end_date', 'category'),
+        _movement_summary, default_days=30,
+    ),
+    Report(
+        'transactions', "Transactions with their line items",
+        (ResourceVersion.PRODUCTS, ResourceVersion.TRANSACTIONS, ResourceVersion.STOCK),
+        ('start_date', 'end_date', 'transaction_type'), _transactions,
+    ),
+    Report(
+        'stock_details', "Stock detail lines",
+        (ResourceVersion.PRODUCTS, ResourceVersion.TRANSACTIONS, ResourceVersion.STOCK),
+        ('start_date', 'end_date', 'product'), _stock_details,
+    ),
+)}
+
+
+def _version_numbers(resources):
+    return {name: f"{nonce}:{version}" for name, (version, _, nonce) in get_versions(resources).items()}
+
+
+def params_hash(report, export_format, params):
+    key = json.dumps([report, export_format, params], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def result_path(job):
+    return os.path.join(settings.REPORTS_ROOT, job.result_file)
+
+
+def is_fresh(job):
+    """Whether a finished job's result can be served for a new request"""
+    if job.status != ReportJob.DONE or not job.result_file:
+        return False
+    if job.finished_at < timezone.now() - timedelta(seconds=settings.REPORT_RESULT_TTL):
+        return False
+    if job.data_versions != _version_numbers(REPORTS[job.report].resources):
+        return False
+    return os.path.exists(result_path(job))
+
+
+def submit_report(report, export_format='csv', params=None, requested_by=None, refresh=False):
+    """
+    Queue a report and return (job, reused). Unless refresh is set, a queued,
+    running or fresh finished job with the same parameters is returned instead.
+    Raises ValueError for unknown reports and invalid parameters.
+    """
+    if report not in REPORTS:
+        raise ValueError(f"report must be one of: {', '.join(REPORTS)}")
+    if export_format not in dict(ReportJob.FORMATS):
+        raise ValueError(f"export_format must be one of: {', '.join(dict(ReportJob.FORMATS))}")
+    params = REPORTS[report].clean(params)
+    digest = params_hash(report, export_format, params)
+
+    if not refresh:
+        jobs = ReportJob.objects.filter(params_hash=digest).order_by('-created_at', '-job_id')
+        pending = jobs.filter(status__in=(ReportJob.QUEUED, ReportJob.RUNNING)).first()
+        if pending is not None:
+            return pending, True
+        done = jobs.filter(status=ReportJob.DONE).first()
+        if done is not None and is_fresh(done):
+            return done, True
+
+    job = ReportJob.objects.create(
+        report=report, export_format=export_format, params=params, params_hash=digest,
+        requested_by=requested_by
+    )
+    return job, False
+
+
+def claim_job(worker):
+    """Mark the oldest queued job as running by the worker and return it, or None if none is queued"""
+    queued = ReportJob.objects.filter(status=ReportJob.QUEUED)
+    while True:
+        job_id = queued.order_by('created_at', 'job_id').values_list('pk', flat=True).first()
+        if job_id is None:
+            return None
+        # Only one worker's UPDATE still finds the job queued
+        now = timezone.now()
+        claimed = queued.filter(pk=job_id).update(
+            status=ReportJob.RUNNING, worker=worker, attempts=F('attempts') + 1,
+            started_at=now, heartbeat_at=now, row_count=0, error=None
+        )
+        if claimed:
+            return ReportJob.objects.get(pk=job_id)
+
+
+class JobAbandoned(Exception):
+    """The running job was requeued or failed by housekeeping and belongs to another attempt now"""
+
+
+def _jobs(job):
+    # Progress writes go straight to the primary so the report keeps reading from its replica.
+    # Only this attempt's run may write: once the job is requeued another worker owns it.
+    return ReportJob.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=job.pk, status=ReportJob.RUNNING, worker=job.worker, attempts=job.attempts
+    )
+
+
+def _heartbeat(job, row_count):
+    if not _jobs(job).update(row_count=row_count, heartbeat_at=timezone.now()):
+        raise JobAbandoned(f"Report job {job.pk} attempt {job.attempts} was given up on.")
+
+
+def _counted(job, rows, counter):
+    beat_at = monotonic()
+    for row in rows:
+        counter[0] += 1
+        if counter[0] % PROGRESS_ROWS == 0 or monotonic() - beat_at >= HEARTBEAT_INTERVAL:
+            _heartbeat(job, counter[0])
+            beat_at = monotonic()
+        yield row
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def run_job(job):
+    """Run a claimed job, write its result file and record the outcome"""
+    report = REPORTS.get(job.report)
+    # Each attempt writes its own files, so a run given up on cannot touch the retry's
+    result_file = f"{job.report}-{job.pk}-{job.attempts}.{job.export_format}"
+    path = os.path.join(settings.REPORTS_ROOT, result_file)
+    partial = f"{path}.part"
+    counter = [0]
+    try:
+        if report is None:
+            raise ValueError(f"Unknown report {job.report}.")
+        os.makedirs(settings.REPORTS_ROOT, exist_ok=True)
+        with use_replica():
+            # Read before the data, so a write in between makes the result stale rather than fresh
+            versions = _version_numbers(report.resources)
+            names, rows = report.rows(job.params)
+            with open(partial, 'w', encoding='utf-8', newline='') as result:
+                for line in export_lines(names, _counted(job, rows, counter), job.export_format):
+                    result.write(line)
+        os.replace(partial, path)
+    except JobAbandoned:
+        logger.warning("Report job %s (%s) attempt %s was given up on; stopping", job.pk, job.report, job.attempts)
+        _remove(partial)
+        return False
+    except Exception as e:
+        logger.exception("Report job %s (%s) failed", job.pk, job.report)
+        _remove(partial)
+        _jobs(job).update(
+            status=ReportJob.FAILED, error=f"{type(e).__name__}: {e}", row_count=counter[0],
+            finished_at=timezone.now()
+        )
+        return False
+
+    finished = _jobs(job).update(
+        status=ReportJob.DONE, result_file=result_file, result_size=os.path.getsize(path),
+        row_count=counter[0], data_versions=versions, finished_at=timezone.now()
+    )
+    if not finished:
+        # Given up on between the last heartbeat and now; the retry's outcome stands
+        _remove(path)
+        return False
+    job.result_file = result_file
+    return True
+
+
+def requeue_abandoned():
+    """Queue again the running jobs without a heartbeat for REPORT_JOB_TIMEOUT, failing those out of attempts"""
+    cutoff = timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+    abandoned = ReportJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=ReportJob.RUNNING,
+    )
+    failed = abandoned.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ReportJob.FAILED, finished_at=timezone.now(),
+        error=f"Abandoned by its worker {MAX_ATTEMPTS} times (stopped or timed out)."
+    )
+    requeued = abandoned.filter(attempts__lt=MAX_ATTEMPTS).update(status=ReportJob.QUEUED, worker=None)
+    return requeued, failed
+
+
+def purge_expired():
+    """Delete the finished jobs older than REPORT_RESULT_TTL and their result files"""
+    cutoff = timezone.now() - timedelta(seconds=settings.REPORT_RESULT_TTL)
+    expired = ReportJob.objects.filter(status__in=(ReportJob.DONE, ReportJob.FAILED), finished_at__lt=cutoff)
+    for job in expired.exclude(result_file=None).only('pk', 'result_file'):
+        try:
+            os.remove(result_path(job))
+        except FileNotFoundError:
+            pass
+    count, _ = expired.delete()
+    return count
+
+
+def _release_connections():
+    for connection in connections.all(initialized_only=True):
+        connection.close_if_unusable_or_obsolete()
+
+
+class ReportWorker:
+    """Claims queued report jobs and runs up to `concurrency` of them at a time on threads"""
+
+    def __init__(self, concurrency=None, poll_interval=None, name=None):
+        self.concurrency = concurrency or settings.REPORT_WORKER_CONCURRENCY
+        # SQLite cannot commit a write while another connection holds a read open,
+        # so a report streaming its rows would block the progress writes of the others
+        self.serial = connections[DEFAULT_DB_ALIAS].vendor == 'sqlite'
+        if self.serial:
+            self.concurrency = 1
+        self.poll_interval = poll_interval if poll_interval is not None else settings.REPORT_WORKER_POLL_INTERVAL
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.stop_event = threading.Event()
+        self.purged_at = None
+
+    def stop(self):
+        """Claim no more jobs; run() returns once the running ones finish"""
+        self.stop_event.set()
+
+    def _run(self, job):
+        try:
+            return run_job(job)
+        finally:
+            _release_connections()
+
+    def housekeeping(self):
+        now = timezone.now()
+        if self.purged_at is None or (now - self.purged_at).total_seconds() >= PURGE_INTERVAL:
+            requeue_abandoned()
+            purge_expired()
+            self.purged_at = now
+
+    def run(self, once=False, on_finish=None):
+        """
+        Run jobs until stop() is called, or with once=True until the queue is
+        empty. on_finish is called with each job and whether it succeeded.
+        """
+        running = {}
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='report-worker') as pool:
+            while not self.stop_event.is_set():
+                if not (self.serial and running):
+                    self.housekeeping()
+                claimed = False
+                while len(running) < self.concurrency:
+                    job = claim_job(self.name)
+                    if job is None:
+                        break
+                    claimed = True
+                    running[pool.submit(self._run, job)] = job
+                _release_connections()
+
+                if once and not running and not claimed:
+                    break
+                if running:
+                    finished, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        job = running.pop(future)
+                        if on_finish is not None:
+                            on_finish(job, future.result())
+                else:
+                    self.stop_event.wait(self.poll_interval)
+
+            for future in wait(running).done:
+                if on_finish is not None:
+                    on_finish(running[future], future.result())
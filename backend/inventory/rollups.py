@@ -0,0 +1,200 @@
+"""
+Daily movement rollups (stckdaily) and the time series read from them.
+
+Every stock detail write adds its quantity and value to the row of its
+product, day and transaction type inside the same database transaction, so
+a chart over a date range reads one row per product, day and type at most
+instead of every movement in the range.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import StockDailyMovement, StockDetail
+
+CENT = Decimal('0.01')
+BUCKETS = ('day', 'week', 'month')
+
+# Time series columns per transaction type
+SERIES_PREFIXES = {'IN': 'in', 'OUT': 'out', 'ADJUST': 'adjust'}
+
+
+def _rollup_key(product_id, movement_date, transaction_type):
+    return product_id, timezone.localdate(movement_date), transaction_type
+
+
+def apply_to_rollup(product_id, movement_date, transaction_type, quantity, value):
+    """Add a movement to the daily rollup of its product"""
+    _apply_delta(*_rollup_key(product_id, movement_date, transaction_type), quantity, value, 1)
+
+
+def _apply_delta(product_id, day, transaction_type, quantity, value, count):
+    rows = StockDailyMovement.objects.filter(product_id=product_id, day=day, transaction_type=transaction_type)
+    updates = {
+        'quantity': F('quantity') + quantity,
+        'total_value': F('total_value') + value,
+        'movement_count': F('movement_count') + count,
+        'updated_at': timezone.now(),
+    }
+    if rows.update(**updates):
+        return
+
+    _, created = StockDailyMovement.objects.get_or_create(
+        product_id=product_id, day=day, transaction_type=transaction_type,
+        defaults={'quantity': quantity, 'total_value': value, 'movement_count': count}
+    )
+    if not created:
+        # Another writer created the row between our update and insert
+        rows.update(**updates)
+
+
+def revert_from_rollup(product_id, movement_date, transaction_type, quantity, value):
+    """Remove a previously applied movement from its daily rollup"""
+    product_id, day, transaction_type = _rollup_key(product_id, movement_date, transaction_type)
+    rows = StockDailyMovement.objects.filter(product_id=product_id, day=day, transaction_type=transaction_type)
+    rows.update(
+        quantity=F('quantity') - quantity,
+        total_value=F('total_value') - value,
+        movement_count=F('movement_count') - 1,
+        updated_at=timezone.now(),
+    )
+    # Days without movements have no row
+    rows.filter(movement_count__lte=0).delete()
+
+
+def apply_details_to_rollup(details):
+    """Add stock details written without save() (e.g. bulk_create), one update per rollup row"""
+    deltas = {}
+    for detail in details:
+        key = _rollup_key(
+            detail.product_id, detail.transaction.transaction_date, detail.transaction.transaction_type
+        )
+        quantity, value, count = deltas.get(key, (Decimal('0'), Decimal('0'), 0))
+        deltas[key] = (
+            quantity + Decimal(detail.quantity),
+            value + Decimal(detail.quantity) * Decimal(detail.unit_price),
+            count + 1,
+        )
+    for key, (quantity, value, count) in deltas.items():
+        _apply_delta(*key, quantity, value, count)
+
+
+def aggregate_rollups():
+    """Compute the daily rollups from the full stock detail history"""
+    line_value = ExpressionWrapper(
+        F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=16, decimal_places=2)
+    )
+    rows = StockDetail.objects.order_by().annotate(
+        day=TruncDate('transaction__transaction_date')
+    ).values('product_id', 'day', 'transaction__transaction_type').annotate(
+        total_quantity=Sum('quantity'),
+        value=Sum(line_value),
+        lines=Count('detail_id'),
+    )
+    return {
+        (row['product_id'], row['day'], row['transaction__transaction_type']): StockDailyMovement(
+            product_id=row['product_id'],
+            day=row['day'],
+            transaction_type=row['transaction__transaction_type'],
+            quantity=row['total_quantity'] or 0,
+            total_value=Decimal(row['value'] or 0).quantize(CENT),
+            movement_count=row['lines'],
+        )
+        for row in rows
+    }
+
+
+def rebuild_rollups(batch_size=1000):
+    """Replace the contents of the rollup table with freshly aggregated rows"""
+    rollups = aggregate_rollups()
+    with transaction.atomic():
+        StockDailyMovement.objects.all().delete()
+        StockDailyMovement.objects.bulk_create(rollups.values(), batch_size=batch_size)
+    return len(rollups)
+
+
+def find_rollup_discrepancies():
+    """Return (key, stored, expected) for every rollup row that disagrees with the history"""
+    expected = aggregate_rollups()
+    stored = {
+        (row.product_id, row.day, row.transaction_type): row
+        for row in StockDailyMovement.objects.order_by()
+    }
+
+    discrepancies = []
+    for key in expected.keys() | stored.keys():
+        want = expected.get(key)
+        have = stored.get(key)
+        want_state = (want.quantity, want.total_value, want.movement_count) if want else (0, 0, 0)
+        have_state = (have.quantity, have.total_value, have.movement_count) if have else (0, 0, 0)
+        if want_state != have_state:
+            discrepancies.append((key, have_state, want_state))
+    return sorted(discrepancies)
+
+
+def bucket_start(day, bucket):
+    """First day of the day, week (Monday) or month bucket containing the day"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_count(start, end, bucket):
+    """Number of buckets between two days, both included"""
+    start, end = bucket_start(start, bucket), bucket_start(end, bucket)
+    if bucket == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (end - start).days // (7 if bucket == 'week' else 1) + 1
+
+
+def movement_timeseries(rollups, start, end, bucket='day'):
+    """
+    In, out and adjustment totals per bucket between two days (both included)
+    from a StockDailyMovement queryset. Every bucket is present, empty ones
+    as zeros.
+    """
+    period = {'day': F('day'), 'week': TruncWeek('day'), 'month': TruncMonth('day')}[bucket]
+    rows = rollups.filter(day__gte=start, day__lte=end).order_by().annotate(
+        period=period
+    ).values('period', 'transaction_type').annotate(
+        total_quantity=Sum('quantity'),
+        value=Sum('total_value'),
+        lines=Sum('movement_count'),
+    )
+
+    series = {}
+    current = bucket_start(start, bucket)
+    while current <= end:
+        point = {'period': current, 'net_quantity': Decimal('0'), 'net_value': Decimal('0'), 'movement_count': 0}
+        for prefix in SERIES_PREFIXES.values():
+            point[f'{prefix}_quantity'] = Decimal('0')
+            point[f'{prefix}_value'] = Decimal('0')
+        series[current] = point
+        current = next_bucket(current, bucket)
+
+    for row in rows:
+        point = series.get(row['period'])
+        prefix = SERIES_PREFIXES.get(row['transaction_type'])
+        if point is None or prefix is None:
+            continue
+        point[f'{prefix}_quantity'] += row['total_quantity'] or 0
+        point[f'{prefix}_value'] += row['value'] or 0
+        point['net_quantity'] += row['total_quantity'] or 0
+        point['net_value'] += row['value'] or 0
+        point['movement_count'] += row['lines'] or 0
+    return list(series.values())
@@ -0,0 +1,191 @@
+"""
+Indexed search for products and transactions.
+
+On PostgreSQL the searched columns carry pg_trgm GIN indexes on
+UPPER(column), which is exactly what icontains compiles to, and results are
+ranked by trigram similarity. Other databases (SQLite) get a maintained
+token table (srchtoken): every word of the searched columns is stored
+lower-cased and a search term matches any token it is a prefix of, using an
+index range scan instead of a leading-wildcard LIKE.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import (
+    Case, Count, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce
+
+from .models import ProductMaster, SearchToken, StockMain
+
+# Runs of letters and digits in any script
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+# Searched columns of each indexed entity
+SEARCH_FIELDS = {
+    SearchToken.PRODUCT: ('product_code', 'product_name'),
+    SearchToken.TRANSACTION: ('reference_number', 'supplier_customer'),
+}
+
+
+class Similarity(Func):
+    """pg_trgm similarity of a column and a search string"""
+    function = 'SIMILARITY'
+    output_field = FloatField()
+
+
+def uses_trigram_search():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(*values):
+    """Lower-cased words of the given values, e.g. 'ABC-12 Crème' -> {'abc', '12', 'crème'}"""
+    tokens = set()
+    for value in values:
+        if value:
+            # Composed, so an accented letter typed as letter + combining accent stays one letter
+            value = unicodedata.normalize('NFC', value).lower()
+            tokens.update(token[:SearchToken.TOKEN_LENGTH] for token in TOKEN_RE.findall(value))
+    return tokens
+
+
+def _prefix_range(term):
+    """Bounds [term, upper) covering every string that starts with term"""
+    return term, term[:-1] + chr(ord(term[-1]) + 1)
+
+
+def _no_results(queryset):
+    # Still annotated, so callers can order by the rank
+    return queryset.none().annotate(search_rank=Value(0.0))
+
+
+def _token_search(queryset, entity, query):
+    terms = sorted(tokenize(query))
+    if not terms:
+        return _no_results(queryset)
+
+    # Every term has to prefix one of the object's tokens
+    for term in terms:
+        lower, upper = _prefix_range(term)
+        queryset = queryset.filter(pk__in=SearchToken.objects.filter(
+            entity=entity, token__gte=lower, token__lt=upper
+        ).values('object_id'))
+
+    # Whole-word matches rank above prefix matches
+    exact_matches = SearchToken.objects.filter(
+        entity=entity, object_id=OuterRef('pk'), token__in=terms
+    ).order_by().values('object_id').annotate(matches=Count('token')).values('matches')
+    return queryset.annotate(
+        search_rank=Coalesce(Subquery(exact_matches, output_field=FloatField()), Value(0.0))
+    )
+
+
+def _trigram_search(queryset, fields, query):
+    terms = query.split()
+    if not terms:
+        return _no_results(queryset)
+
+    for term in terms:
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(condition)
+
+    rank = Value(0.0)
+    for field in fields:
+        rank = rank + Coalesce(Similarity(field, Value(query)), Value(0.0))
+    return queryset.annotate(search_rank=rank)
+
+
+def search_products(queryset, query):
+    """Filter products by code/name and annotate search_rank; exact code matches come first"""
+    fields = SEARCH_FIELDS[SearchToken.PRODUCT]
+    if uses_trigram_search():
+        queryset = _trigram_search(queryset, fields, query)
+    else:
+        queryset = _token_search(queryset, SearchToken.PRODUCT, query)
+    return queryset.annotate(
+        code_match=Case(
+            When(product_code=query.strip(), then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    ).order_by('-code_match', '-search_rank', 'product_name', 'product_id')
+
+
+def search_transactions(queryset, query):
+    """Filter transactions by reference number/supplier or customer and annotate search_rank"""
+    fields = SEARCH_FIELDS[SearchToken.TRANSACTION]
+    if uses_trigram_search():
+        return _trigram_search(queryset, fields, query)
+    return _token_search(queryset, SearchToken.TRANSACTION, query)
+
+
+def _entity_for(instance):
+    if isinstance(instance, ProductMaster):
+        return SearchToken.PRODUCT
+    if isinstance(instance, StockMain):
+        return SearchToken.TRANSACTION
+    raise TypeError(f"{type(instance).__name__} is not search indexed")
+
+
+def index_objects(instances):
+    """(Re)write the search tokens of the given products or transactions"""
+    if uses_trigram_search():
+        return
+    instances = list(instances)
+    if not instances:
+        return
+
+    entity = _entity_for(instances[0])
+    index_rows(entity, [
+        (obj.pk, *(getattr(obj, field) for field in SEARCH_FIELDS[entity]))
+        for obj in instances
+    ])
+
+
+def index_rows(entity, rows, replace=True):
+    """
+    Write search tokens from (pk, *SEARCH_FIELDS values) tuples. Pass
+    replace=False for objects that were just created and have no tokens yet.
+    """
+    if uses_trigram_search() or not rows:
+        return
+    if replace:
+        SearchToken.objects.filter(entity=entity, object_id__in=[row[0] for row in rows]).delete()
+
+    # Imports index hundreds of thousands of tokens, so skip model instances here
+    tokens = [(entity, row[0], token) for row in rows for token in tokenize(*row[1:])]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {quote(SearchToken._meta.db_table)} "
+            f"({quote('entity')}, {quote('object_id')}, {quote('token')}) VALUES (%s, %s, %s)",
+            tokens
+        )
+
+
+def unindex_object(instance):
+    if uses_trigram_search():
+        return
+    SearchToken.objects.filter(entity=_entity_for(instance), object_id=instance.pk).delete()
+
+
+def rebuild_search_index(batch_size=2000):
+    """Rebuild the token table for every product and transaction; returns the object count"""
+    if uses_trigram_search():
+        return 0
+    SearchToken.objects.all().delete()
+    total = 0
+    for model, entity in ((ProductMaster, SearchToken.PRODUCT), (StockMain, SearchToken.TRANSACTION)):
+        batch = []
+        for obj in model.objects.order_by().only(*SEARCH_FIELDS[entity]).iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                index_objects(batch)
+                total += len(batch)
+                batch = []
+        index_objects(batch)
+        total += len(batch)
+    return total
@@ -1,5 +1,10 @@
+from django.db import transaction as db_transaction
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import serializers
-from .models import ProductMaster, StockMain, StockDetail
+from .models import ProductMaster, ReportJob, StockMain, StockDetail
+from .balances import lock_balances
+from .reports import REPORTS
 
 
 class ProductMasterSerializer(serializers.ModelSerializer):
@@ -10,14 +15,17 @@ class ProductMasterSerializer(serializers.ModelSerializer):
         model = ProductMaster
         fields = [
             'product_id', 'product_code', 'product_name', 'description', 
-            'category', 'unit', 'unit_price', 'is_active', 'current_stock',
-            'created_at', 'updated_at'
+            'category', 'unit', 'unit_price', 'reorder_point', 'reorder_quantity',
+            'is_active', 'current_stock', 'needs_reorder', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['product_id', 'created_at', 'updated_at', 'current_stock']
+        read_only_fields = ['product_id', 'created_at', 'updated_at', 'current_stock', 'needs_reorder']
 
     def validate_product_code(self, value):
-        """Validate product code uniqueness"""
-        if ProductMaster.objects.filter(product_code=value).exists():
+        """Validate product code uniqueness, allowing a product to keep its own code"""
+        products = ProductMaster.objects.filter(product_code=value)
+        if self.instance is not None:
+            products = products.exclude(pk=self.instance.pk)
+        if products.exists():
             raise serializers.ValidationError("Product code already exists.")
         return value
 
@@ -56,7 +64,34 @@ class StockDetailSerializer(serializers.ModelSerializer):
         return value
 
 
-class StockMainSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Trim serialized fields from the request: ?fields=a,b keeps only the listed
+    fields, and fields in `expandable_fields` are left out of list responses
+    unless requested with ?expand=name.
+    """
+    expandable_fields = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        requested = request.query_params.get('fields')
+        if requested:
+            keep = {name.strip() for name in requested.split(',')}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+        view = self.context.get('view')
+        if getattr(view, 'action', None) == 'list':
+            expand = {name.strip() for name in request.query_params.get('expand', '').split(',')}
+            for name in set(self.expandable_fields) - expand:
+                self.fields.pop(name, None)
+
+
+class StockMainSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for StockMain model"""
     details = StockDetailSerializer(many=True, read_only=True)
     transaction_type_display = serializers.CharField(source='get_transaction_type_display', read_only=True)
@@ -71,9 +106,12 @@ class StockMainSerializer(serializers.ModelSerializer):
             'details', 'details_count', 'created_at', 'updated_at'
         ]
         read_only_fields = ['transaction_id', 'transaction_code', 'created_at', 'updated_at']
+    expandable_fields = ['details']
 
     def get_details_count(self, obj):
-        """Get count of details in this transaction"""
+        """Get count of details in this transaction, annotated by the view when available"""
+        if hasattr(obj, 'details_count'):
+            return obj.details_count
         return obj.details.count()
 
     def validate_transaction_type(self, value):
@@ -103,12 +141,20 @@ class StockMainCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         details_data = validated_data.pop('details', [])
-        transaction = StockMain.objects.create(**validated_data)
-        
-        # Create stock details
-        for detail_data in details_data:
-            detail_data['transaction'] = transaction
-            StockDetail.objects.create(**detail_data)
+
+        # Header, lines and stock balances are committed together or not at all
+        with db_transaction.atomic():
+            # Lock every product a stock out touches up front, in one order, so
+            # concurrent multi-line transactions queue instead of deadlocking
+            if validated_data.get('transaction_type') in ('OUT', 'ADJUST'):
+                lock_balances(detail_data['product'].pk for detail_data in details_data)
+
+            transaction = StockMain.objects.create(**validated_data)
+
+            # Create stock details
+            for detail_data in details_data:
+                detail_data['transaction'] = transaction
+                StockDetail.objects.create(**detail_data)
         
         return transaction
 
@@ -119,28 +165,188 @@ class StockMainCreateSerializer(serializers.ModelSerializer):
         return value
 
 
+class BulkStockDetailSerializer(serializers.Serializer):
+    """Serializer for a line of a bulk-ingested transaction, validated without queries"""
+    product = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    batch_number = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    expiry_date = serializers.DateField(required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_quantity(self, value):
+        """Validate quantity is positive"""
+        if value <= 0:
+            raise serializers.ValidationError("Quantity must be greater than zero.")
+        return value
+
+    def validate_unit_price(self, value):
+        """Validate unit price is non-negative"""
+        if value < 0:
+            raise serializers.ValidationError("Unit price cannot be negative.")
+        return value
+
+
+class BulkStockMainSerializer(serializers.Serializer):
+    """Serializer for a bulk-ingested transaction; totals are computed server-side"""
+    transaction_type = serializers.ChoiceField(choices=StockMain.TRANSACTION_TYPES)
+    transaction_date = serializers.DateTimeField(required=False)
+    reference_number = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    supplier_customer = serializers.CharField(max_length=200, required=False, allow_blank=True, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    created_by = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    details = BulkStockDetailSerializer(many=True)
+
+    def validate_details(self, value):
+        """Validate that details are provided"""
+        if not value:
+            raise serializers.ValidationError("At least one product detail is required.")
+        return value
+
+
 class InventorySummarySerializer(serializers.Serializer):
     """Serializer for inventory summary"""
     product_id = serializers.IntegerField()
     product_code = serializers.CharField()
     product_name = serializers.CharField()
-    category = serializers.CharField()
+    category = serializers.SerializerMethodField()
     unit = serializers.CharField()
     current_stock = serializers.DecimalField(max_digits=10, decimal_places=2)
     unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    reorder_point = serializers.DecimalField(max_digits=12, decimal_places=2)
+    reorder_quantity = serializers.DecimalField(max_digits=12, decimal_places=2)
     total_value = serializers.DecimalField(max_digits=12, decimal_places=2)
+    cost_value = serializers.DecimalField(max_digits=18, decimal_places=2, allow_null=True)
+    unit_cost = serializers.DecimalField(max_digits=16, decimal_places=4, allow_null=True)
     last_movement_date = serializers.DateTimeField(allow_null=True)
     is_low_stock = serializers.BooleanField()
 
+    def get_category(self, obj):
+        return obj['category'] or ''
+
+
+class StockBatchSerializer(serializers.Serializer):
+    """Serializer for the stock on hand of a batch"""
+    product_id = serializers.IntegerField()
+    product_code = serializers.CharField(source='product.product_code')
+    product_name = serializers.CharField(source='product.product_name')
+    unit = serializers.CharField(source='product.unit')
+    batch_number = serializers.SerializerMethodField()
+    expiry_date = serializers.DateField(allow_null=True)
+    days_to_expiry = serializers.SerializerMethodField()
+    quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+    def get_batch_number(self, obj):
+        return obj.batch_number or None
+
+    def get_days_to_expiry(self, obj):
+        if obj.expiry_date is None:
+            return None
+        return (obj.expiry_date - timezone.localdate()).days
+
+
+class FefoPickSerializer(serializers.Serializer):
+    """Serializer for the quantity a stock out should take from one batch"""
+    batch_number = serializers.SerializerMethodField()
+    expiry_date = serializers.DateField(allow_null=True)
+    available = serializers.DecimalField(max_digits=14, decimal_places=2)
+    quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+    def get_batch_number(self, obj):
+        return obj['batch_number'] or None
+
+
+class FefoAllocationSerializer(serializers.Serializer):
+    """Serializer for a first-expired-first-out split of a stock out over batches"""
+    product_id = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    shortfall = serializers.DecimalField(max_digits=14, decimal_places=2)
+    picks = FefoPickSerializer(many=True)
+
+
+class ReorderSuggestionSerializer(serializers.Serializer):
+    """Serializer for a product to reorder and the quantity to order"""
+    product_id = serializers.IntegerField()
+    product_code = serializers.CharField()
+    product_name = serializers.CharField()
+    category = serializers.CharField(allow_null=True)
+    unit = serializers.CharField()
+    current_stock = serializers.DecimalField(max_digits=14, decimal_places=2)
+    reorder_point = serializers.DecimalField(max_digits=12, decimal_places=2)
+    reorder_quantity = serializers.DecimalField(max_digits=12, decimal_places=2)
+    shortage = serializers.DecimalField(max_digits=14, decimal_places=2)
+    suggested_quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    unit_cost = serializers.DecimalField(max_digits=16, decimal_places=4)
+    estimated_cost = serializers.DecimalField(max_digits=18, decimal_places=2)
+
 
 class StockMovementSerializer(serializers.Serializer):
     """Serializer for stock movement history"""
     transaction_id = serializers.IntegerField()
-    transaction_code = serializers.CharField()
-    transaction_type = serializers.CharField()
-    transaction_date = serializers.DateTimeField()
+    transaction_code = serializers.CharField(source='transaction.transaction_code')
+    transaction_type = serializers.CharField(source='transaction.transaction_type')
+    transaction_date = serializers.DateTimeField(source='transaction.transaction_date')
     quantity = serializers.DecimalField(max_digits=10, decimal_places=2)
     unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
     total_price = serializers.DecimalField(max_digits=12, decimal_places=2)
-    reference_number = serializers.CharField(allow_null=True)
-    notes = serializers.CharField(allow_null=True) 
\ No newline at end of file
+    reference_number = serializers.CharField(source='transaction.reference_number', allow_null=True)
+    notes = serializers.CharField(allow_null=True) 
+
+class StockAsOfSerializer(serializers.Serializer):
+    """Serializer for the stock of a product at a point in time"""
+    checkpoint = serializers.DateTimeField(allow_null=True)
+    quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    stock_value = serializers.DecimalField(max_digits=16, decimal_places=2)
+    last_movement_date = serializers.DateTimeField(allow_null=True)
+
+
+class MovementTimeseriesSerializer(serializers.Serializer):
+    """Serializer for one bucket of a stock movement time series"""
+    period = serializers.DateField()
+    in_quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    in_value = serializers.DecimalField(max_digits=16, decimal_places=2)
+    out_quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    out_value = serializers.DecimalField(max_digits=16, decimal_places=2)
+    adjust_quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    adjust_value = serializers.DecimalField(max_digits=16, decimal_places=2)
+    net_quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    net_value = serializers.DecimalField(max_digits=16, decimal_places=2)
+    movement_count = serializers.IntegerField()
+
+
+class ReportRequestSerializer(serializers.Serializer):
+    """Serializer for a request to run a background report"""
+    report = serializers.ChoiceField(choices=list(REPORTS))
+    export_format = serializers.ChoiceField(choices=ReportJob.FORMATS, default='csv')
+    params = serializers.DictField(required=False, default=dict)
+    refresh = serializers.BooleanField(
+        default=False, help_text="Run the report again even if a fresh result exists"
+    )
+
+    def validate(self, attrs):
+        try:
+            attrs['params'] = REPORTS[attrs['report']].clean(attrs['params'])
+        except ValueError as e:
+            raise serializers.ValidationError({'params': str(e)})
+        return attrs
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    """Serializer for a background report job and where to download its result"""
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'job_id', 'report', 'export_format', 'params', 'status', 'requested_by', 'attempts',
+            'row_count', 'result_size', 'error', 'created_at', 'started_at', 'heartbeat_at', 'finished_at',
+            'download_url'
+        ]
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.DONE:
+            return None
+        url = reverse('report-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
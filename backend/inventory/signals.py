@@ -0,0 +1,112 @@
+import threading
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .balances import check_availability, lock_balances, revert_movement
+from .metrics import install_query_recorder
+from .models import ProductMaster, ResourceVersion, StockDetail, StockMain
+from .querylog import install_query_logger
+from .search import index_objects, unindex_object
+from .stats import invalidate_dashboard_stats
+from .versions import bump_versions
+
+# Version counter bumped by writes to each model
+VERSIONED_MODELS = {
+    ProductMaster: ResourceVersion.PRODUCTS,
+    StockMain: ResourceVersion.TRANSACTIONS,
+    StockDetail: ResourceVersion.STOCK,
+}
+
+
+# Transactions of the delete running on this thread, so their cascaded lines are
+# reverted without loading the transaction again for every line
+_deleting = threading.local()
+
+
+def _deleting_transactions():
+    if not hasattr(_deleting, 'transactions'):
+        _deleting.transactions = {}
+    return _deleting.transactions
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+@receiver(pre_delete, sender=StockMain)
+def stock_main_deleting(sender, instance, **kwargs):
+    _deleting_transactions()[instance.pk] = instance
+    if instance.transaction_type != 'OUT':
+        # Lock every product the delete may lower up front, in one order, so concurrent deletes cannot deadlock
+        lock_balances(instance.details.values_list('product_id', flat=True))
+
+
+@receiver(post_delete, sender=StockMain)
+def stock_main_deleted(sender, instance, **kwargs):
+    _deleting_transactions().pop(instance.pk, None)
+
+
+@receiver(post_delete, sender=StockDetail)
+def stock_detail_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Take a deleted line (including cascaded deletes) out of the product stock
+    balance. Removing stock received or adjusted upwards locks the balance and
+    is refused with InsufficientStock if it would go negative, which rolls the
+    whole delete back.
+    """
+    origin_model = _origin_model(origin)
+    if origin_model is ProductMaster:
+        # The product's balances, batches, rollups and checkpoints are deleted with it
+        return
+
+    transaction = None
+    if origin_model is StockMain:
+        # Collected by this delete, whose pre_delete signals have all been sent
+        transaction = _deleting_transactions().get(instance.transaction_id)
+    if transaction is None:
+        transaction = instance.transaction
+
+    # Deletes on one thread run their signals in turn, so each check sees the lines reverted before it
+    check_availability({instance.product_id: -instance.quantity})
+    revert_movement(
+        instance.product_id, instance.quantity, instance.unit_price,
+        transaction.transaction_date, transaction.transaction_type,
+        instance.batch_number, instance.expiry_date, instance.pk
+    )
+
+
+@receiver(post_save, sender=ProductMaster)
+@receiver(post_delete, sender=ProductMaster)
+@receiver(post_save, sender=StockMain)
+@receiver(post_delete, sender=StockMain)
+@receiver(post_save, sender=StockDetail)
+@receiver(post_delete, sender=StockDetail)
+def inventory_changed(sender, **kwargs):
+    """Any inventory write makes the dashboard statistics snapshot and cached API responses stale"""
+    invalidate_dashboard_stats()
+    bump_versions(VERSIONED_MODELS[sender])
+
+
+@receiver(post_save, sender=ProductMaster)
+@receiver(post_save, sender=StockMain)
+def searchable_saved(sender, instance, **kwargs):
+    """Refresh the search tokens of a saved product or transaction"""
+    index_objects([instance])
+
+
+@receiver(post_delete, sender=ProductMaster)
+@receiver(post_delete, sender=StockMain)
+def searchable_deleted(sender, instance, **kwargs):
+    unindex_object(instance)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """Count and time the queries of every database connection for the request metrics and slow-query log"""
+    install_query_recorder(connection)
+    if settings.SLOW_QUERY_LOG_ENABLED:
+        install_query_logger(connection)
@@ -0,0 +1,152 @@
+"""
+Dashboard statistics snapshot.
+
+The statistics are computed with two conditional aggregate queries, one over
+the active products and one over the last week's transactions and their lines
+(run concurrently on the async path), and kept in Django's cache framework. Writes
+to products, transactions or stock details drop the snapshot once they
+commit, so the next dashboard load recomputes it. The snapshot also records
+the version counters (with their nonces) of the products, transactions and
+stock it was computed from, read before the statistics: one computed while a
+write committed, and stored after that write dropped the old snapshot, or one
+from another database (before a flush or restore, or by a previous test
+database), does not match the counters and is never served.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ProductMaster, ResourceVersion, StockMain
+from .parallel import gather_queries, run_query
+from .replicas import current_replica
+from .versions import get_versions
+
+CACHE_KEY = 'inventory:dashboard-stats'
+
+
+def _product_stats():
+    """Active product count, stock value at list price and at cost, and how many need reordering"""
+    return ProductMaster.objects.filter(is_active=True).annotate(
+        stock=Coalesce(
+            F('stock_balance__quantity'), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        )
+    ).aggregate(
+        total_products=Count('pk'),
+        total_stock_value=Sum(
+            F('stock') * F('unit_price'),
+            output_field=DecimalField(max_digits=18, decimal_places=2)
+        ),
+        total_cost_value=Sum('stock_valuation__cost_value'),
+        low_stock_products=Count('pk', filter=Q(needs_reorder=True)),
+    )
+
+
+def _transaction_stats(now):
+    """Transactions dated in the last seven days and today, and today's stock detail lines"""
+    today = Q(transaction_date__date=now.date())
+    # Today's transactions are recent too, so only the recent ones are joined to their lines
+    return StockMain.objects.filter(transaction_date__gte=now - timedelta(days=7)).aggregate(
+        today_transactions=Count('pk', filter=today, distinct=True),
+        recent_transactions=Count('pk', distinct=True),
+        today_movements=Count('details', filter=today),
+    )
+
+
+def _combine(products, transactions):
+    return {
+        'total_products': products['total_products'],
+        'today_transactions': transactions['today_transactions'],
+        'total_stock_value': float(products['total_stock_value'] or 0),
+        'total_cost_value': float(round(products['total_cost_value'] or 0, 2)),
+        'valuation_method': settings.INVENTORY_VALUATION_METHOD,
+        'low_stock_products': products['low_stock_products'],
+        'recent_transactions': transactions['recent_transactions'],
+        'today_movements': transactions['today_movements']
+    }
+
+
+def compute_dashboard_stats():
+    """Compute the dashboard statistics straight from the database"""
+    now = timezone.now()
+    return _combine(_product_stats(), _transaction_stats(now))
+
+
+async def acompute_dashboard_stats():
+    """Compute the dashboard statistics with the two queries running concurrently"""
+    now = timezone.now()
+    return _combine(*await gather_queries(_product_stats, partial(_transaction_stats, now)))
+
+
+# Every resource the statistics are computed from
+RESOURCES = (ResourceVersion.PRODUCTS, ResourceVersion.TRANSACTIONS, ResourceVersion.STOCK)
+
+
+def _database_versions():
+    # Read before the statistics, so a write in between leaves the snapshot behind its counters
+    return {name: (nonce, version) for name, (version, _, nonce) in get_versions(RESOURCES).items()}
+
+
+def _new_snapshot(now, stats, versions):
+    return {'date': now.date(), 'generated_at': now, 'versions': versions, 'stats': stats}
+
+
+def _is_current(snapshot, now, versions):
+    # Day-based counters roll over at midnight, and a database without counters cannot be told apart
+    return (
+        snapshot is not None and snapshot['date'] == now.date()
+        and all(nonce for nonce, _ in versions.values()) and snapshot.get('versions') == versions
+    )
+
+
+def _present(snapshot, now):
+    return {
+        **snapshot['stats'],
+        'generated_at': snapshot['generated_at'],
+        'snapshot_age_seconds': round((now - snapshot['generated_at']).total_seconds(), 3),
+    }
+
+
+def _snapshot_timeout():
+    # A replica may not have caught up with the write that dropped the last snapshot yet
+    if current_replica() is not None:
+        return min(settings.DASHBOARD_STATS_CACHE_TIMEOUT, settings.REPLICA_STICKY_SECONDS)
+    return settings.DASHBOARD_STATS_CACHE_TIMEOUT
+
+
+def get_dashboard_stats():
+    """Return the cached statistics snapshot, recomputing it when missing or stale"""
+    now = timezone.now()
+    snapshot = cache.get(CACHE_KEY)
+    versions = _database_versions()
+
+    if not _is_current(snapshot, now, versions):
+        snapshot = _new_snapshot(now, compute_dashboard_stats(), versions)
+        cache.set(CACHE_KEY, snapshot, _snapshot_timeout())
+
+    return _present(snapshot, now)
+
+
+async def aget_dashboard_stats():
+    """Async get_dashboard_stats() for the ASGI read path"""
+    now = timezone.now()
+    snapshot = await cache.aget(CACHE_KEY)
+    versions = await run_query(_database_versions)
+
+    if not _is_current(snapshot, now, versions):
+        snapshot = _new_snapshot(now, await acompute_dashboard_stats(), versions)
+        await cache.aset(CACHE_KEY, snapshot, _snapshot_timeout())
+
+    return _present(snapshot, now)
+
+
+def invalidate_dashboard_stats():
+    """Drop the snapshot once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
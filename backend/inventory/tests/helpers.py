@@ -0,0 +1,18 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from inventory.balances import lock_balances
+from inventory.models import StockDetail, StockMain
+
+
+def write_line(product, transaction_type, quantity, batch_number=None, expiry_date=None):
+    """Write a one-line transaction the way the transaction create endpoint does and return its line"""
+    with transaction.atomic():
+        if transaction_type in ('OUT', 'ADJUST'):
+            lock_balances([product.pk])
+        header = StockMain.objects.create(transaction_type=transaction_type)
+        return StockDetail.objects.create(
+            transaction=header, product=product, quantity=Decimal(quantity), unit_price=Decimal('1.00'),
+            batch_number=batch_number, expiry_date=expiry_date
+        )
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from inventory.balances import InsufficientBatchStock
+from inventory.batches import find_batch_discrepancies
+from inventory.models import ProductMaster, StockBatchAllocation, StockBatchBalance
+from inventory.tests.helpers import write_line
+
+
+class BatchDrawdownTests(TestCase):
+    """Stock outs against the batch balances"""
+
+    def setUp(self):
+        self.product = ProductMaster.objects.create(
+            product_code='LOT', product_name='Batched product', unit_price=Decimal('1.00')
+        )
+        self.today = timezone.localdate()
+
+    def batches(self):
+        return {
+            (row.batch_number, row.expiry_date): row.quantity
+            for row in StockBatchBalance.objects.filter(product=self.product)
+        }
+
+    def receive_batches(self):
+        self.late = self.today + timedelta(days=60)
+        self.soon = self.today + timedelta(days=10)
+        write_line(self.product, 'IN', 5, 'LATE', self.late)
+        write_line(self.product, 'IN', 3, 'SOON', self.soon)
+        write_line(self.product, 'IN', 2)
+
+    def test_unbatched_stock_out_draws_soonest_expiring_batches_first(self):
+        self.receive_batches()
+
+        detail = write_line(self.product, 'OUT', -6)
+
+        self.assertEqual(self.batches(), {('LATE', self.late): Decimal('2'), ('', None): Decimal('2')})
+        self.assertEqual(StockBatchAllocation.objects.filter(detail_id=detail.pk).count(), 2)
+        self.assertEqual(find_batch_discrepancies(), [])
+
+    def test_expired_batches_are_drawn_last(self):
+        expired = self.today - timedelta(days=1)
+        write_line(self.product, 'IN', 4, 'OLD', expired)
+        write_line(self.product, 'IN', 1)
+
+        write_line(self.product, 'OUT', -3)
+
+        self.assertEqual(self.batches(), {('OLD', expired): Decimal('2')})
+
+    def test_deleting_or_editing_a_stock_out_puts_its_batches_back(self):
+        self.receive_batches()
+        before = self.batches()
+
+        detail = write_line(self.product, 'OUT', -6)
+        detail.quantity = Decimal('-1')
+        detail.save()
+        self.assertEqual(self.batches()[('SOON', self.soon)], Decimal('2'))
+
+        detail.delete()
+        self.assertEqual(self.batches(), before)
+        self.assertFalse(StockBatchAllocation.objects.exists())
+        self.assertEqual(find_batch_discrepancies(), [])
+
+    def test_stock_out_may_not_take_a_named_batch_below_zero(self):
+        self.receive_batches()
+
+        with self.assertRaises(InsufficientBatchStock):
+            write_line(self.product, 'OUT', -4, 'SOON', self.soon)
+
+        self.assertEqual(self.batches()[('SOON', self.soon)], Decimal('3'))
+        self.assertEqual(find_batch_discrepancies(), [])
+
+    def test_deleting_a_receipt_drawn_from_is_refused(self):
+        receipt = write_line(self.product, 'IN', 3, 'ONLY', date(2099, 1, 1))
+        write_line(self.product, 'OUT', -2)
+        # The product still has enough stock, the batch does not
+        write_line(self.product, 'IN', 5)
+
+        with self.assertRaises(InsufficientBatchStock):
+            with transaction.atomic():
+                receipt.delete()
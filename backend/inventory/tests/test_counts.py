@@ -0,0 +1,25 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from inventory.counts import estimated_count
+from inventory.models import ProductMaster
+
+
+@skipUnless(connection.vendor == 'sqlite', 'reads the SQLite statistics table')
+class SqliteEstimatedCountTests(TestCase):
+    """Table sizes read from sqlite_stat1 after ANALYZE"""
+
+    def test_partial_indexes_do_not_size_the_table(self):
+        for number in range(30):
+            ProductMaster.objects.create(
+                product_code=f'EST-{number}', product_name=f'Estimated {number}',
+                # Only the products that need reordering are in the partial reorder index
+                reorder_point=10 if number < 2 else 0,
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.assertEqual(estimated_count(ProductMaster.objects.all()), 30)
+
@@ -0,0 +1,60 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.test import TestCase
+
+from inventory.models import ProductMaster, StockDetail, StockMain
+
+
+def cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+class KeysetCursorTests(TestCase):
+    """Cursors are client input: a bad one is a 404, never a server error"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = ProductMaster.objects.create(product_code='PAGE', product_name='Paged product')
+        for _ in range(3):
+            header = StockMain.objects.create(transaction_type='IN')
+            StockDetail.objects.create(
+                transaction=header, product=cls.product, quantity=Decimal('1'), unit_price=Decimal('1.00')
+            )
+
+    def urls(self):
+        return [
+            '/api/transactions/',
+            '/api/stock-details/',
+            f'/api/products/{self.product.pk}/stock_movements/',
+        ]
+
+    def test_cursor_walks_every_page(self):
+        for url in self.urls():
+            seen = 0
+            response = self.client.get(url, {'page_size': 1})
+            while True:
+                self.assertEqual(response.status_code, 200, url)
+                seen += len(response.data['results'])
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+            self.assertEqual(seen, 3, url)
+
+    def test_bad_cursors_are_not_found(self):
+        bad_cursors = [
+            'not base64 json',
+            cursor({'a': 1}),
+            cursor(['2026-01-01T00:00:00+00:00']),
+            cursor(['abc', 'x']),
+            cursor([{'a': 1}, 1]),
+            cursor(['2026-01-01T00:00:00+00:00', 'x']),
+            cursor(['2026-01-01T00:00:00+00:00', None]),
+            cursor(['2026-01-01T00:00:00+00:00', 10 ** 30]),
+        ]
+        for url in self.urls():
+            for bad_cursor in bad_cursors:
+                with self.subTest(url=url, cursor=bad_cursor):
+                    response = self.client.get(url, {'cursor': bad_cursor})
+                    self.assertEqual(response.status_code, 404)
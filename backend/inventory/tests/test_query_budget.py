@@ -0,0 +1,72 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from inventory.models import ProductMaster, StockDetail, StockMain
+
+
+class TransactionQueryBudgetTests(TestCase):
+    """The transaction endpoints take the same number of queries however many rows they return"""
+
+    # Page count, page rows and their details (list); the transaction and its details (detail)
+    LIST_QUERIES = 2
+    EXPANDED_LIST_QUERIES = 3
+    DETAIL_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            ProductMaster.objects.create(product_code=f'QB-{number}', product_name=f'Budget product {number}')
+            for number in range(5)
+        ]
+
+    def add_transactions(self, count, lines):
+        for _ in range(count):
+            header = StockMain.objects.create(transaction_type='IN', reference_number='BUDGET')
+            for line in range(lines):
+                StockDetail.objects.create(
+                    transaction=header, product=self.products[line % len(self.products)],
+                    quantity=Decimal('2'), unit_price=Decimal('1.50')
+                )
+        return header
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant(self, url, expected, grow):
+        """Count the queries of url, grow the data, and count again"""
+        small = self.count_queries(url())
+        grow()
+        large = self.count_queries(url())
+        self.assertEqual((small, large), (expected, expected), url())
+
+    def test_list_is_constant_in_transactions_and_lines(self):
+        self.add_transactions(3, lines=1)
+        self.assert_constant(
+            lambda: '/api/transactions/', self.LIST_QUERIES,
+            lambda: self.add_transactions(30, lines=5)
+        )
+
+    def test_expanded_list_is_constant_in_transactions_and_lines(self):
+        self.add_transactions(3, lines=1)
+        self.assert_constant(
+            lambda: '/api/transactions/?expand=details', self.EXPANDED_LIST_QUERIES,
+            lambda: self.add_transactions(30, lines=5)
+        )
+
+    def test_detail_is_constant_in_lines(self):
+        transaction = self.add_transactions(1, lines=1)
+        self.assert_constant(
+            lambda: f'/api/transactions/{transaction.pk}/', self.DETAIL_QUERIES,
+            lambda: [
+                StockDetail.objects.create(
+                    transaction=transaction, product=product, quantity=Decimal('1'), unit_price=Decimal('1')
+                )
+                for product in self.products * 5
+            ]
+        )
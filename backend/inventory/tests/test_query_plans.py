@@ -0,0 +1,38 @@
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+
+from inventory.queryplans import check_hot_queries, explain, plans_checked, view_queryset
+from inventory.models import ProductMaster, StockDetail, StockMain
+from inventory.pagination import StockDetailPagination
+from inventory.views import StockDetailViewSet
+
+
+@unittest.skipUnless(plans_checked(), "Query plans are not checked on this database")
+class HotQueryPlanTests(TestCase):
+    """Every hot list/filter query is answered from an index, never a full table scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        product = ProductMaster.objects.create(product_code='PLAN', product_name='Planned product')
+        receipt = StockMain.objects.create(transaction_type='IN')
+        StockDetail.objects.create(
+            transaction=receipt, product=product, quantity=Decimal('5'), unit_price=Decimal('1'),
+            batch_number='B1', expiry_date=date.today() + timedelta(days=10)
+        )
+        shipment = StockMain.objects.create(transaction_type='OUT')
+        StockDetail.objects.create(transaction=shipment, product=product, quantity=Decimal('2'), unit_price=Decimal('1'))
+
+    def test_hot_queries_use_indexes(self):
+        for name, plan, scanned in check_hot_queries():
+            with self.subTest(query=name):
+                self.assertEqual(scanned, [], f"{name} scans {', '.join(scanned)}:\n{plan}")
+
+    def test_movement_type_pages_read_their_partial_index(self):
+        for movement_type, index in (('IN', 'stckdetail_in_created_id_idx'), ('OUT', 'stckdetail_out_created_id_idx')):
+            queryset = view_queryset(StockDetailViewSet, {'movement_type': movement_type})
+            page = StockDetailPagination().page_queryset(queryset)
+            with self.subTest(movement_type=movement_type):
+                self.assertIn(index, explain(page))
@@ -0,0 +1,50 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from inventory.models import ReportJob
+from inventory.reports import claim_job, requeue_abandoned, run_job, submit_report
+
+
+class AbandonedReportJobTests(TestCase):
+    """A report job given up on while its worker is still running it"""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        settings_override = override_settings(REPORTS_ROOT=self.root, REPORT_JOB_TIMEOUT=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.job, _ = submit_report('inventory_valuation')
+
+    def go_quiet(self, seconds=120):
+        """Pretend the running job has not reported progress for a while"""
+        ReportJob.objects.filter(pk=self.job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_job_with_a_recent_heartbeat_is_left_running(self):
+        claim_job('first')
+        self.go_quiet(seconds=10)
+
+        self.assertEqual(requeue_abandoned(), (0, 0))
+        self.assertEqual(ReportJob.objects.get(pk=self.job.pk).status, ReportJob.RUNNING)
+
+    def test_late_finish_of_an_abandoned_attempt_keeps_the_retry(self):
+        first = claim_job('first')
+        self.go_quiet()
+        self.assertEqual(requeue_abandoned(), (1, 0))
+        second = claim_job('second')
+
+        # The first worker finishes after the job was handed to the second one
+        self.assertFalse(run_job(first))
+        job = ReportJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.worker, job.attempts), (ReportJob.RUNNING, 'second', 2))
+
+        self.assertTrue(run_job(second))
+        job = ReportJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.worker), (ReportJob.DONE, 'second'))
+        # Only the retry's result is left behind
+        self.assertEqual(os.listdir(self.root), [job.result_file])
@@ -0,0 +1,34 @@
+from django.test import TestCase
+
+from inventory.models import ProductMaster
+from inventory.search import tokenize
+
+
+class ProductSearchTests(TestCase):
+    """Product search through the endpoints, on whichever search backend the database uses"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tea = ProductMaster.objects.create(product_code='TEA-1', product_name='चाय masala')
+        cls.cream = ProductMaster.objects.create(product_code='CR-2', product_name='Crème brûlée')
+
+    def search(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        data = response.json()
+        rows = data['results'] if isinstance(data, dict) else data
+        return [row['product_id'] for row in rows]
+
+    def test_words_in_any_script_are_single_tokens(self):
+        self.assertEqual(tokenize('Crème brûlée', 'ABC-12'), {'crème', 'brûlée', 'abc', '12'})
+        # A letter followed by a combining accent is the same word as the composed letter
+        self.assertEqual(tokenize('Cre\u0300me'), {'crème'})
+
+    def test_non_latin_and_accented_words_are_found(self):
+        self.assertEqual(self.search('/api/products/?search=चाय'), [self.tea.pk])
+        self.assertEqual(self.search('/api/products/?search=crème'), [self.cream.pk])
+        self.assertEqual(self.search('/api/products/search/?q=चाय'), [self.tea.pk])
+
+    def test_terms_without_words_find_nothing(self):
+        for url in ('/api/products/?search=-', '/api/products/search/?q=-'):
+            self.assertEqual(self.search(url), [])
@@ -0,0 +1,48 @@
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TransactionTestCase
+
+from inventory import stats
+from inventory.models import ProductMaster, ResourceVersion
+from inventory.versions import bump_versions
+
+
+class DashboardSnapshotTests(TransactionTestCase):
+    """The cached dashboard statistics snapshot, with writes committing (and bumping counters) as they happen"""
+
+    def setUp(self):
+        cache.delete(stats.CACHE_KEY)
+        self.addCleanup(cache.delete, stats.CACHE_KEY)
+        ProductMaster.objects.create(product_code='DASH-1', product_name='Dashboard product')
+        bump_versions(*stats.RESOURCES)
+
+    def test_snapshot_computed_across_a_write_is_not_served(self):
+        compute = stats.compute_dashboard_stats
+
+        def compute_then_write():
+            # A write commits, and drops the snapshot, after the statistics were read
+            result = compute()
+            ProductMaster.objects.create(product_code='DASH-2', product_name='Written meanwhile')
+            return result
+
+        with patch.object(stats, 'compute_dashboard_stats', compute_then_write):
+            self.assertEqual(stats.get_dashboard_stats()['total_products'], 1)
+
+        self.assertEqual(stats.get_dashboard_stats()['total_products'], 2)
+
+    def test_snapshot_is_reused_until_a_counter_moves(self):
+        first = stats.get_dashboard_stats()
+        self.assertEqual(stats.get_dashboard_stats()['generated_at'], first['generated_at'])
+
+        bump_versions(ResourceVersion.TRANSACTIONS)
+        self.assertNotEqual(stats.get_dashboard_stats()['generated_at'], first['generated_at'])
+
+    def test_endpoint_reports_the_snapshot_age_when_served(self):
+        first = self.client.get('/api/dashboard-stats/').json()
+        time.sleep(0.01)
+        second = self.client.get('/api/dashboard-stats/').json()
+
+        self.assertEqual(second['generated_at'], first['generated_at'])
+        self.assertGreater(second['snapshot_age_seconds'], first['snapshot_age_seconds'])
@@ -0,0 +1,85 @@
+import threading
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client, TransactionTestCase
+
+from inventory.balances import InsufficientStock
+from inventory.models import ProductMaster, StockBalance, StockDetail, StockMain
+from inventory.tests.helpers import write_line
+
+
+class ConcurrentStockOutTests(TransactionTestCase):
+    """Stock outs racing for the same units, each on its own thread and database connection"""
+
+    rounds = 5
+
+    def setUp(self):
+        self.product = ProductMaster.objects.create(
+            product_code='RACE', product_name='Contended product', unit_price=Decimal('1.00')
+        )
+
+    def race_stock_outs(self, quantity, threads=2):
+        """Start one stock out on each thread at the same moment and return their outcomes"""
+        barrier = threading.Barrier(threads)
+        outcomes = []
+        errors = []
+
+        def ship():
+            try:
+                barrier.wait()
+                try:
+                    write_line(self.product, 'OUT', quantity)
+                    outcomes.append('shipped')
+                except InsufficientStock:
+                    outcomes.append('refused')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=ship) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        return sorted(outcomes)
+
+    def balance(self):
+        return StockBalance.objects.get(product=self.product).quantity
+
+    def test_only_one_of_two_simultaneous_stock_outs_succeeds(self):
+        for _ in range(self.rounds):
+            write_line(self.product, 'IN', 10)
+
+            # Each order wants all the stock on hand, so exactly one may ship
+            self.assertEqual(self.race_stock_outs(10), ['refused', 'shipped'])
+            self.assertEqual(self.balance(), Decimal('0'))
+
+        history = StockDetail.objects.filter(product=self.product).aggregate(total=Sum('quantity'))['total']
+        self.assertEqual(history, Decimal('0'))
+        self.assertEqual(StockMain.objects.filter(transaction_type='OUT').count(), self.rounds)
+
+    def test_stock_never_goes_negative_under_contention(self):
+        write_line(self.product, 'IN', 5)
+
+        outcomes = self.race_stock_outs(1, threads=8)
+        self.assertEqual(outcomes.count('shipped'), 5)
+        self.assertEqual(outcomes.count('refused'), 3)
+        self.assertEqual(self.balance(), Decimal('0'))
+
+    def test_deleting_a_shipped_receipt_is_refused(self):
+        client = Client()
+        receipt = write_line(self.product, 'IN', 20).transaction
+        write_line(self.product, 'OUT', 15)
+
+        response = client.delete(f'/api/transactions/{receipt.pk}/')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(StockMain.objects.filter(pk=receipt.pk).exists())
+        self.assertEqual(self.balance(), Decimal('5.00'))
+
+        detail = receipt.details.get()
+        self.assertEqual(client.delete(f'/api/stock-details/{detail.pk}/').status_code, 409)
+        self.assertEqual(self.balance(), Decimal('5.00'))
@@ -5,9 +5,11 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView, TokenRefreshView
 )
 from .views import (
-    ProductMasterViewSet, StockMainViewSet, StockDetailViewSet,
-    InventorySummaryView, DashboardStatsView, RegisterView
+    ProductMasterViewSet, StockMainViewSet, StockDetailViewSet, ReportJobViewSet,
+    InventorySummaryView, ExpiringStockView, ReorderSuggestionView, DashboardStatsView, RegisterView, SlowQueryLogView,
+    prometheus_metrics
 )
+from . import async_views
 
 def health_check(request):
     return JsonResponse({'status': 'healthy', 'message': 'API is running'})
@@ -17,10 +19,12 @@ router = DefaultRouter()
 router.register(r'products', ProductMasterViewSet)
 router.register(r'transactions', StockMainViewSet)
 router.register(r'stock-details', StockDetailViewSet)
+router.register(r'reports', ReportJobViewSet, basename='report')
 
 urlpatterns = [
-    # Health check endpoint
+    # Health check and Prometheus metrics endpoints
     path('health/', health_check, name='health_check'),
+    path('metrics/', prometheus_metrics, name='metrics'),
     
     # JWT Auth endpoints
     path('auth/register/', RegisterView.as_view(), name='auth_register'),
@@ -32,5 +36,15 @@ urlpatterns = [
     
     # Custom endpoints
     path('inventory-summary/', InventorySummaryView.as_view(), name='inventory-summary'),
+    path('inventory/expiring/', ExpiringStockView.as_view(), name='inventory-expiring'),
+    path('reorder-suggestions/', ReorderSuggestionView.as_view(), name='reorder-suggestions'),
     path('dashboard-stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
-] 
\ No newline at end of file
+    path('slow-queries/', SlowQueryLogView.as_view(), name='slow-queries'),
+]
+
+# Async read path served in front of urlpatterns by the ASGI deployment
+async_urlpatterns = [
+    path('health/', async_views.health_check, name='health_check'),
+    path('inventory-summary/', async_views.AsyncInventorySummaryView.as_view(), name='inventory-summary'),
+    path('dashboard-stats/', async_views.AsyncDashboardStatsView.as_view(), name='dashboard-stats'),
+]
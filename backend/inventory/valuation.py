@@ -0,0 +1,357 @@
+"""
+Inventory valuation at cost (stckval and stckcostlyr).
+
+Stock is valued with INVENTORY_VALUATION_METHOD: 'average' keeps a running
+weighted average cost per product, 'fifo' keeps the receipts still on hand
+as cost layers and issues stock from the oldest layer first. Lines with a
+positive quantity (stock in, upward adjustments) are receipts at their unit
+price; lines with a negative quantity are issued at cost, whatever price
+they went out at.
+
+Both methods depend on the order of the movements (transaction date, then
+line), so every StockValuation row records the last movement it covers. A
+line that comes after it is valued in the transaction that writes it, in
+O(1) for the average and O(layers issued) for FIFO. Backdated lines, edits,
+deletes and transactions moved in time replay the history of their products
+once the write commits. Reading the valuation of a product is one row.
+"""
+import threading
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import ResourceVersion, StockCostLayer, StockDetail, StockValuation
+from .stats import invalidate_dashboard_stats
+from .versions import bump_versions
+
+VALUE_PLACES = Decimal('0.0001')
+COST_PLACES = Decimal('0.000001')
+ZERO = Decimal('0')
+
+
+def valuation_method():
+    method = settings.INVENTORY_VALUATION_METHOD
+    if method not in dict(StockValuation.METHODS):
+        raise ImproperlyConfigured(
+            f"INVENTORY_VALUATION_METHOD must be one of: {', '.join(dict(StockValuation.METHODS))}"
+        )
+    return method
+
+
+class CostState:
+    """The valuation of one product's stock, advanced one movement at a time"""
+
+    def __init__(self, method, quantity=ZERO, cost_value=ZERO, unit_cost=None, layers=()):
+        self.method = method
+        self.quantity = Decimal(quantity)
+        self.cost_value = Decimal(cost_value)
+        self.unit_cost = None if unit_cost is None else Decimal(unit_cost)
+        # [detail_id, received_at, quantity left, unit cost] of the FIFO receipts on hand, oldest first
+        self.layers = deque(list(layer) for layer in layers)
+
+    def apply(self, detail_id, moved_at, quantity, unit_price):
+        quantity = Decimal(quantity)
+        if quantity > 0:
+            self.receive(detail_id, moved_at, quantity, Decimal(unit_price))
+        elif quantity < 0:
+            self.issue(-quantity)
+
+    def receive(self, detail_id, received_at, quantity, unit_cost):
+        on_hand = self.quantity + quantity
+        if self.method == StockValuation.AVERAGE:
+            if self.quantity > 0:
+                unit_cost = (self.quantity * self.unit_cost + quantity * unit_cost) / on_hand
+            self.settle(on_hand, None, unit_cost)
+            return
+
+        # Stock issued before it was received is covered first
+        layered = quantity if self.quantity >= 0 else max(on_hand, ZERO)
+        value = self.cost_value if self.quantity > 0 else ZERO
+        if layered:
+            self.layers.append([detail_id, received_at, layered, unit_cost])
+            value += layered * unit_cost
+        self.settle(on_hand, value, unit_cost)
+
+    def issue(self, quantity):
+        on_hand = self.quantity - quantity
+        if self.method == StockValuation.AVERAGE:
+            self.settle(on_hand, None, self.unit_cost)
+            return
+
+        value = self.cost_value if self.quantity > 0 else ZERO
+        last_cost = self.unit_cost
+        while quantity and self.layers:
+            layer = self.layers[0]
+            taken = min(quantity, layer[2])
+            value -= taken * layer[3]
+            layer[2] -= taken
+            quantity -= taken
+            last_cost = layer[3]
+            if not layer[2]:
+                self.layers.popleft()
+        # Whatever is issued beyond the layers is owed at the latest cost
+        self.settle(on_hand, value, last_cost)
+
+    def settle(self, on_hand, value, unit_cost):
+        """Store the new quantity; value is the FIFO layer total, the average is quantity x unit cost"""
+        self.quantity = on_hand
+        if unit_cost is not None:
+            self.unit_cost = Decimal(unit_cost).quantize(COST_PLACES)
+        if on_hand > 0 and value is not None:
+            self.cost_value = value.quantize(VALUE_PLACES)
+            self.unit_cost = (self.cost_value / on_hand).quantize(COST_PLACES)
+        elif self.unit_cost is not None:
+            self.cost_value = (on_hand * self.unit_cost).quantize(VALUE_PLACES)
+        else:
+            self.cost_value = ZERO
+
+
+def replay_history(rows, method):
+    """
+    Fold (product_id, detail_id, moved_at, quantity, unit_price) rows, ordered by
+    product and movement, into (product_id, CostState, position of the last movement)
+    """
+    product_id = state = position = None
+    for row_product_id, detail_id, moved_at, quantity, unit_price in rows:
+        if row_product_id != product_id:
+            if state is not None:
+                yield product_id, state, position
+            product_id, state = row_product_id, CostState(method)
+        state.apply(detail_id, moved_at, quantity, unit_price)
+        position = (moved_at, detail_id)
+    if state is not None:
+        yield product_id, state, position
+
+
+def _history(product_ids=None):
+    details = StockDetail.objects.all()
+    if product_ids is not None:
+        details = details.filter(product_id__in=product_ids)
+    return details.order_by('product_id', 'transaction__transaction_date', 'detail_id').values_list(
+        'product_id', 'detail_id', 'transaction__transaction_date', 'quantity', 'unit_price'
+    ).iterator(chunk_size=2000)
+
+
+def _valuation_row(product_id, state, position):
+    return StockValuation(
+        product_id=product_id,
+        method=state.method,
+        quantity=state.quantity,
+        cost_value=state.cost_value,
+        unit_cost=state.unit_cost,
+        valued_through=position[0],
+        last_detail_id=position[1],
+    )
+
+
+def _layer_rows(product_id, state):
+    return [
+        StockCostLayer(
+            product_id=product_id, detail_id=detail_id, received_at=received_at,
+            quantity=quantity, unit_cost=unit_cost
+        )
+        for detail_id, received_at, quantity, unit_cost in state.layers
+    ]
+
+
+class _Pending(threading.local):
+    """Products to replay when the current thread's open transaction commits"""
+
+    def __init__(self):
+        self.product_ids = set()
+
+
+_pending = _Pending()
+
+
+def _replay_pending():
+    product_ids, _pending.product_ids = _pending.product_ids, set()
+    if product_ids:
+        revalue_products(product_ids)
+
+
+def _pending_products():
+    connection = connections[DEFAULT_DB_ALIAS]
+    if any(callback is _replay_pending for _, callback, *_ in connection.run_on_commit):
+        return _pending.product_ids
+    return set()
+
+
+def revalue_on_commit(product_ids):
+    """Replay the valuation of the products once the current transaction commits"""
+    connection = connections[DEFAULT_DB_ALIAS]
+    if not connection.in_atomic_block:
+        revalue_products(product_ids)
+        return
+
+    # One replay per product and transaction, however many of its lines were touched
+    if not any(callback is _replay_pending for _, callback, *_ in connection.run_on_commit):
+        _pending.product_ids = set()
+        transaction.on_commit(_replay_pending)
+    _pending.product_ids.update(product_ids)
+
+
+def revalue_products(product_ids):
+    """Replay the movement history of the products and store their valuations"""
+    from .balances import lock_balances
+
+    method = valuation_method()
+    for product_id in sorted(set(product_ids)):
+        with transaction.atomic():
+            # Serializes with writers of the product, who hold its balance row
+            lock_balances([product_id])
+            StockCostLayer.objects.filter(product_id=product_id).delete()
+            StockValuation.objects.filter(product_id=product_id).delete()
+            for _, state, position in replay_history(_history([product_id]), method):
+                _valuation_row(product_id, state, position).save(force_insert=True)
+                StockCostLayer.objects.bulk_create(_layer_rows(product_id, state))
+    # The write that asked for the replay has already bumped the version readers cached it under
+    invalidate_dashboard_stats()
+    bump_versions(ResourceVersion.STOCK)
+
+
+def _load(valuation, method):
+    """(CostState, {detail_id: quantity} of the stored layers) of a stored valuation"""
+    if valuation is None:
+        return CostState(method), {}
+    layers = []
+    if method == StockValuation.FIFO:
+        layers = list(StockCostLayer.objects.filter(product_id=valuation.product_id).order_by(
+            'received_at', 'detail_id'
+        ).values_list('detail_id', 'received_at', 'quantity', 'unit_cost'))
+    state = CostState(method, valuation.quantity, valuation.cost_value, valuation.unit_cost, layers)
+    return state, {layer[0]: layer[2] for layer in layers}
+
+
+def _store(product_id, state, position, exists, stored_layers):
+    row = _valuation_row(product_id, state, position)
+    if exists:
+        StockValuation.objects.filter(product_id=product_id).update(
+            quantity=row.quantity, cost_value=row.cost_value, unit_cost=row.unit_cost,
+            valued_through=row.valued_through, last_detail_id=row.last_detail_id, updated_at=timezone.now(),
+        )
+    else:
+        row.save(force_insert=True)
+
+    # Issues shrink or use up the oldest layers, receipts append new ones
+    layers = {layer[0]: layer for layer in state.layers}
+    used_up = stored_layers.keys() - layers.keys()
+    if used_up:
+        StockCostLayer.objects.filter(product_id=product_id, detail_id__in=used_up).delete()
+    for detail_id, layer in layers.items():
+        if detail_id in stored_layers and stored_layers[detail_id] != layer[2]:
+            StockCostLayer.objects.filter(product_id=product_id, detail_id=detail_id).update(quantity=layer[2])
+    StockCostLayer.objects.bulk_create([
+        layer for layer in _layer_rows(product_id, state) if layer.detail_id not in stored_layers
+    ])
+
+
+def value_movements(movements):
+    """
+    Value new stock movements, (product_id, detail_id, moved_at, quantity, unit_price),
+    inside the transaction that writes them. Call after the product balances are
+    updated: their row locks keep concurrent writers of a product in order.
+    """
+    by_product = defaultdict(list)
+    for movement in movements:
+        by_product[movement[0]].append(movement[1:])
+
+    method = valuation_method()
+    pending = _pending_products()
+    replay = []
+    for product_id, lines in sorted(by_product.items()):
+        if product_id in pending:
+            continue
+        if any(detail_id is None for detail_id, *_ in lines):
+            replay.append(product_id)
+            continue
+        lines.sort(key=lambda line: (line[1], line[0]))
+        valuation = StockValuation.objects.filter(product_id=product_id).first()
+        # Only lines after everything valued so far can be added on top
+        if valuation is not None and (
+            valuation.method != method
+            or (valuation.valued_through, valuation.last_detail_id) >= (lines[0][1], lines[0][0])
+        ):
+            replay.append(product_id)
+            continue
+
+        state, stored_layers = _load(valuation, method)
+        for detail_id, moved_at, quantity, unit_price in lines:
+            state.apply(detail_id, moved_at, quantity, unit_price)
+        _store(product_id, state, (lines[-1][1], lines[-1][0]), valuation is not None, stored_layers)
+    if replay:
+        revalue_on_commit(replay)
+
+
+def apply_details_to_valuation(details):
+    """Value stock details written without save() (e.g. bulk_create)"""
+    value_movements(
+        (detail.product_id, detail.pk, detail.transaction.transaction_date, detail.quantity, detail.unit_price)
+        for detail in details
+    )
+
+
+def rebuild_valuations(batch_size=1000):
+    """Replay the whole stock detail history into the valuation tables"""
+    method = valuation_method()
+    count = 0
+    with transaction.atomic():
+        StockCostLayer.objects.all().delete()
+        StockValuation.objects.all().delete()
+        valuations, layers = [], []
+        for product_id, state, position in replay_history(_history(), method):
+            valuations.append(_valuation_row(product_id, state, position))
+            layers += _layer_rows(product_id, state)
+            if len(valuations) >= batch_size or len(layers) >= batch_size:
+                StockValuation.objects.bulk_create(valuations, batch_size=batch_size)
+                StockCostLayer.objects.bulk_create(layers, batch_size=batch_size)
+                count += len(valuations)
+                valuations, layers = [], []
+        StockValuation.objects.bulk_create(valuations, batch_size=batch_size)
+        StockCostLayer.objects.bulk_create(layers, batch_size=batch_size)
+        count += len(valuations)
+        invalidate_dashboard_stats()
+        bump_versions(ResourceVersion.STOCK)
+    return count
+
+
+def _snapshot(valuation, layers):
+    return (
+        valuation.method, valuation.quantity, valuation.cost_value, valuation.unit_cost,
+        valuation.valued_through, valuation.last_detail_id, tuple(layers),
+    )
+
+
+def find_valuation_discrepancies():
+    """Return (product_id, stored, expected) for every valuation that disagrees with a replay"""
+    method = valuation_method()
+    expected = {
+        product_id: _snapshot(
+            _valuation_row(product_id, state, position),
+            [(detail_id, quantity, unit_cost) for detail_id, _, quantity, unit_cost in state.layers]
+        )
+        for product_id, state, position in replay_history(_history(), method)
+    }
+    stored_layers = defaultdict(list)
+    for product_id, detail_id, quantity, unit_cost in StockCostLayer.objects.order_by(
+        'product_id', 'received_at', 'detail_id'
+    ).values_list('product_id', 'detail_id', 'quantity', 'unit_cost'):
+        stored_layers[product_id].append((detail_id, quantity, unit_cost))
+    stored = {
+        valuation.product_id: _snapshot(valuation, stored_layers[valuation.product_id])
+        for valuation in StockValuation.objects.all()
+    }
+
+    discrepancies = []
+    for product_id in expected.keys() | stored.keys() | stored_layers.keys():
+        want = expected.get(product_id)
+        have = stored.get(product_id)
+        if have is None and stored_layers.get(product_id):
+            have = ('layers only', tuple(stored_layers[product_id]))
+        if want != have:
+            discrepancies.append((product_id, have, want))
+    return sorted(discrepancies, key=lambda discrepancy: discrepancy[0])
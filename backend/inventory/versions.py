@@ -0,0 +1,70 @@
+"""
+Per-resource version counters (resver) for conditional GET.
+
+Writes bump the counters of the resources they touch once the surrounding
+transaction commits, and only once per transaction however many rows it
+wrote. Readers fetch the counters of the resources a response depends on
+with a single primary key lookup and derive its ETag from them. Counter rows
+carry a random nonce, drawn whenever the row is created, so the same version
+numbers of a flushed, restored or test database never identify the same data.
+"""
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ResourceVersion
+
+
+class _Pending(threading.local):
+    """Resources written in the current thread's open transaction"""
+
+    def __init__(self):
+        self.names = set()
+
+
+_pending = _Pending()
+
+
+def _write(names):
+    names = set(names)
+    updated = ResourceVersion.objects.filter(name__in=names).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if updated < len(names):
+        for name in names:
+            ResourceVersion.objects.get_or_create(name=name, defaults={'version': 1})
+
+
+def _flush():
+    names, _pending.names = _pending.names, set()
+    if names:
+        _write(names)
+
+
+def bump_versions(*names, using=DEFAULT_DB_ALIAS):
+    """Bump the version of the named resources when the current transaction commits"""
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        _write(names)
+        return
+
+    # One flush per transaction; a rolled back transaction drops its callback
+    if not any(callback is _flush for _, callback, *_ in connection.run_on_commit):
+        _pending.names = set()
+        transaction.on_commit(_flush, using=using)
+    _pending.names.update(names)
+
+
+def get_versions(names):
+    """
+    {name: (version, updated_at, nonce)} of the named resources, read with one
+    query. Resources never written have no counter row and a nonce of None.
+    """
+    versions = {name: (0, None, None) for name in names}
+    for name, version, updated_at, nonce in ResourceVersion.objects.filter(name__in=names).values_list(
+        'name', 'version', 'updated_at', 'nonce'
+    ):
+        versions[name] = (version, updated_at, nonce)
+    return versions
@@ -1,10 +1,21 @@
-from rest_framework import viewsets, status, generics
+from rest_framework import mixins, viewsets, status, generics
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from django.db.models import Sum, Q, F
+from rest_framework.permissions import AllowAny, IsAdminUser
+from django.db.models import (
+    BooleanField, Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef,
+    Prefetch, Q, Subquery, Sum, Value, When
+)
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import datetime, timedelta
+import hmac
+import io
 from decimal import Decimal
 from django.contrib.auth.models import User
 from rest_framework import generics, permissions
@@ -12,21 +23,113 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.serializers import ModelSerializer, EmailField, CharField, ValidationError
 
-from .models import ProductMaster, StockMain, StockDetail
+from .models import (
+    ProductMaster, ReportJob, ResourceVersion, StockBatchBalance, StockDailyMovement, StockMain,
+    StockDetail
+)
 from .serializers import (
     ProductMasterSerializer, StockMainSerializer, StockDetailSerializer,
-    StockMainCreateSerializer, InventorySummarySerializer, StockMovementSerializer
+    StockMainCreateSerializer, InventorySummarySerializer, StockMovementSerializer,
+    StockAsOfSerializer, MovementTimeseriesSerializer, StockBatchSerializer, FefoAllocationSerializer,
+    ReorderSuggestionSerializer, ReportJobSerializer, ReportRequestSerializer
+)
+from .balances import InsufficientStock
+from .batches import expiring_batches, fefo_allocation
+from .bulk import ingest_transactions
+from .conditional import ConditionalGetMixin
+from .checkpoints import annotate_stock_as_of, parse_as_of, stock_as_of
+from .rollups import BUCKETS, bucket_count, movement_timeseries
+from .importers import import_products
+from .metrics import render_prometheus
+from .querylog import KINDS, slow_query_log
+from .exports import (
+    EXPORT_FORMATS, STOCK_DETAIL_COLUMNS, STOCK_MOVEMENT_COLUMNS, TRANSACTION_COLUMNS,
+    get_export_format, invalid_format_message, stream_export
 )
+from .reports import REPORTS, result_path, submit_report
+from .pagination import StockDetailPagination, StockMovementPagination, TransactionPagination
+from .search import search_products, search_transactions
+from .stats import get_dashboard_stats
+
+# Default time series window and the most buckets one request may ask for
+TIMESERIES_DEFAULT_DAYS = {'day': 90, 'week': 182, 'month': 365}
+TIMESERIES_MAX_BUCKETS = 400
+
+# Default and longest window of the expiring stock report
+EXPIRING_DEFAULT_DAYS = 30
+EXPIRING_MAX_DAYS = 3650
+
+
+def get_as_of(request):
+    """Exclusive upper bound of the movements covered by the as_of parameter, or None"""
+    value = request.query_params.get('as_of')
+    if not value:
+        return None
+    try:
+        return parse_as_of(value)
+    except ValueError as e:
+        raise ValidationError({'as_of': str(e)})
+
+
+def get_timeseries_range(request):
+    """(start, end, bucket) of a time series request, defaulting to a window ending today"""
+    bucket = request.query_params.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValidationError({'bucket': f"bucket must be one of: {', '.join(BUCKETS)}"})
+
+    dates = {}
+    for name in ('start_date', 'end_date'):
+        value = request.query_params.get(name)
+        if value:
+            dates[name] = parse_date(value)
+            if dates[name] is None:
+                raise ValidationError({name: f"{name} must be a date (YYYY-MM-DD)."})
+    end = dates.get('end_date') or timezone.localdate()
+    start = dates.get('start_date') or end - timedelta(days=TIMESERIES_DEFAULT_DAYS[bucket] - 1)
+
+    if start > end:
+        raise ValidationError({'start_date': "start_date must not be after end_date."})
+    if bucket_count(start, end, bucket) > TIMESERIES_MAX_BUCKETS:
+        raise ValidationError({'bucket': f"At most {TIMESERIES_MAX_BUCKETS} buckets per request; use a larger bucket."})
+    return start, end, bucket
 
 
-class ProductMasterViewSet(viewsets.ModelViewSet):
+def timeseries_response(rollups, request, **extra):
+    start, end, bucket = get_timeseries_range(request)
+    series = movement_timeseries(rollups, start, end, bucket)
+    return Response({
+        **extra,
+        'bucket': bucket,
+        'start_date': start,
+        'end_date': end,
+        'results': MovementTimeseriesSerializer(series, many=True).data,
+    })
+
+
+class InsufficientStockMixin:
+    """Answer stock writes refused for lack of stock with 409 Conflict"""
+
+    def handle_exception(self, exc):
+        if isinstance(exc, InsufficientStock):
+            return Response(exc.as_dict(), status=status.HTTP_409_CONFLICT)
+        return super().handle_exception(exc)
+
+
+class ProductMasterViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for ProductMaster CRUD operations"""
     queryset = ProductMaster.objects.all()
     serializer_class = ProductMasterSerializer
     permission_classes = [AllowAny]
+    version_resources = (ResourceVersion.PRODUCTS, ResourceVersion.STOCK)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().retrieve, *args, **kwargs)
 
     def get_queryset(self):
-        queryset = ProductMaster.objects.all()
+        queryset = ProductMaster.objects.select_related('stock_balance')
         
         # Filter by category
         category = self.request.query_params.get('category', None)
@@ -38,48 +141,163 @@ class ProductMasterViewSet(viewsets.ModelViewSet):
         if is_active is not None:
             queryset = queryset.filter(is_active=is_active.lower() == 'true')
         
-        # Search by name or code
+        # Search by name or code, best matches first
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(product_name__icontains=search) | 
-                Q(product_code__icontains=search)
-            )
+            queryset = search_products(queryset, search)
         
         return queryset
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_catalogue(self, request):
+        """Create or update products from an uploaded CSV file keyed on product_code"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload the CSV as "file".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = import_products(
+                io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''),
+                dry_run=request.query_params.get('dry_run', 'false').lower() == 'true'
+            )
+        except (UnicodeDecodeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(result.as_dict())
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Compact, ranked product lookup for pickers"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response([])
+
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            limit = 20
+
+        queryset = ProductMaster.objects.all()
+        is_active = request.query_params.get('is_active', None)
+        if is_active is not None:
+            queryset = queryset.filter(is_active=is_active.lower() == 'true')
+
+        results = search_products(queryset, query).values(
+            'product_id', 'product_code', 'product_name', 'unit', 'unit_price'
+        )[:limit]
+        return Response(list(results))
+
+    @action(detail=True, methods=['get'])
+    def timeseries(self, request, pk=None):
+        """In/out totals of a product per day, week or month, read from the daily rollup"""
+        product = self.get_object()
+        return timeseries_response(
+            StockDailyMovement.objects.filter(product=product), request, product_id=product.pk
+        )
+
+    @action(detail=False, methods=['get'], url_path='timeseries', url_name='category-timeseries')
+    def category_timeseries(self, request):
+        """In/out totals of a category (or of all products) per day, week or month"""
+        rollups = StockDailyMovement.objects.all()
+        category = request.query_params.get('category', None)
+        if category:
+            rollups = rollups.filter(product__category=category)
+        return timeseries_response(rollups, request, category=category)
+
+    def get_movements(self, product):
+        """Stock movements of a product, filtered by the requested date range"""
+        movements = StockDetail.objects.filter(product=product).select_related('transaction')
+        
+        # Filter by date range
+        start_date = self.request.query_params.get('start_date', None)
+        end_date = self.request.query_params.get('end_date', None)
+        
+        if start_date:
+            movements = movements.filter(transaction__transaction_date__gte=start_date)
+        if end_date:
+            movements = movements.filter(transaction__transaction_date__lte=end_date)
+
+        as_of = get_as_of(self.request)
+        if as_of is not None:
+            movements = movements.filter(transaction__transaction_date__lt=as_of)
+        
+        return movements.order_by('-transaction__transaction_date', '-detail_id')
+
     @action(detail=True, methods=['get'])
     def stock_movements(self, request, pk=None):
         """Get stock movement history for a specific product"""
         try:
             product = self.get_object()
-            movements = StockDetail.objects.filter(product=product).select_related('transaction')
-            
-            # Filter by date range
-            start_date = request.query_params.get('start_date', None)
-            end_date = request.query_params.get('end_date', None)
-            
-            if start_date:
-                movements = movements.filter(transaction__transaction_date__gte=start_date)
-            if end_date:
-                movements = movements.filter(transaction__transaction_date__lte=end_date)
+            movements = self.get_movements(product)
             
-            movements = movements.order_by('-transaction__transaction_date')
-            
-            serializer = StockMovementSerializer(movements, many=True)
-            return Response(serializer.data)
+            paginator = StockMovementPagination()
+            page = paginator.paginate_queryset(movements, request, view=self)
+            serializer = StockMovementSerializer(page, many=True)
+            response = paginator.get_paginated_response(serializer.data)
+
+            # The stock level the listed history ends at
+            as_of = get_as_of(request)
+            if as_of is not None:
+                response.data['stock_as_of'] = StockAsOfSerializer(stock_as_of(product.pk, as_of)).data
+            return response
         except ProductMaster.DoesNotExist:
             return Response(
                 {'error': 'Product not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    @action(detail=True, methods=['get'])
+    def batches(self, request, pk=None):
+        """Stock on hand of a product per batch, soonest expiry first"""
+        product = self.get_object()
+        batches = StockBatchBalance.objects.filter(product=product, quantity__gt=0).select_related('product')
+        batches = batches.order_by(F('expiry_date').asc(nulls_last=True), 'batch_number')
+        return Response(StockBatchSerializer(batches, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def fefo(self, request, pk=None):
+        """Batches a stock out of the given quantity should take, first expired first out"""
+        product = self.get_object()
+        try:
+            quantity = Decimal(request.query_params.get('quantity', ''))
+        except ArithmeticError:
+            quantity = None
+        if quantity is None or not quantity.is_finite() or quantity <= 0:
+            raise ValidationError({'quantity': "quantity must be a positive number."})
+
+        picks, shortfall = fefo_allocation(product.pk, quantity)
+        picks = [
+            {'batch_number': batch.batch_number, 'expiry_date': batch.expiry_date,
+             'available': batch.quantity, 'quantity': taken}
+            for batch, taken in picks
+        ]
+        return Response(FefoAllocationSerializer({
+            'product_id': product.pk,
+            'quantity': quantity,
+            'shortfall': shortfall,
+            'picks': picks,
+        }).data)
 
-class StockMainViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], url_path='stock_movements/export')
+    def stock_movements_export(self, request, pk=None):
+        """Stream the full stock movement history of a product as CSV or NDJSON"""
+        export_format = get_export_format(request)
+        if export_format is None:
+            return Response({'error': invalid_format_message()}, status=status.HTTP_400_BAD_REQUEST)
+
+        product = self.get_object()
+        return stream_export(
+            self.get_movements(product), STOCK_MOVEMENT_COLUMNS, export_format,
+            f"stock-movements-{product.product_code}"
+        )
+
+
+class StockMainViewSet(InsufficientStockMixin, viewsets.ModelViewSet):
     """ViewSet for StockMain CRUD operations"""
     queryset = StockMain.objects.all()
     serializer_class = StockMainSerializer
     permission_classes = [AllowAny]
+    pagination_class = TransactionPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -106,19 +324,70 @@ class StockMainViewSet(viewsets.ModelViewSet):
         # Search by reference number or supplier/customer
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(reference_number__icontains=search) | 
-                Q(supplier_customer__icontains=search)
-            )
+            queryset = search_transactions(queryset, search)
+
+        if self.action in ('list', 'retrieve', 'update', 'partial_update'):
+            queryset = self.with_serializer_data(queryset)
         
-        return queryset.order_by('-transaction_date')
+        return queryset.order_by('-transaction_date', '-transaction_id')
+
+    def with_serializer_data(self, queryset):
+        """Load what StockMainSerializer reads with a fixed number of queries per page"""
+        # A correlated count is evaluated for the page rows only, unlike a JOIN + GROUP BY
+        details_count = StockDetail.objects.filter(
+            transaction=OuterRef('pk')
+        ).order_by().values('transaction').annotate(total=Count('pk')).values('total')
+        queryset = queryset.annotate(
+            details_count=Coalesce(Subquery(details_count, output_field=IntegerField()), Value(0))
+        )
+
+        expand = self.request.query_params.get('expand', '').split(',')
+        if self.action != 'list' or 'details' in expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('details', queryset=StockDetail.objects.select_related('product'))
+            )
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many transactions in one request, reporting the outcome per document"""
+        documents = request.data.get('transactions') if isinstance(request.data, dict) else None
+        if not isinstance(documents, list) or not documents:
+            return Response(
+                {'error': 'Provide a non-empty "transactions" list.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = ingest_transactions(documents)
+        created = sum(1 for result in results if result['success'])
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response(
+            {'created': created, 'failed': len(results) - created, 'results': results},
+            status=response_status
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream filtered transactions with their line items as CSV or NDJSON"""
+        export_format = get_export_format(request)
+        if export_format is None:
+            return Response({'error': invalid_format_message()}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset().order_by('-transaction_date', '-transaction_id', 'details__detail_id')
+        return stream_export(queryset, TRANSACTION_COLUMNS, export_format, 'transactions')
 
     @action(detail=True, methods=['get'])
     def details(self, request, pk=None):
         """Get details for a specific transaction"""
         try:
             transaction = self.get_object()
-            details = transaction.details.all()
+            details = transaction.details.select_related('product')
             serializer = StockDetailSerializer(details, many=True)
             return Response(serializer.data)
         except StockMain.DoesNotExist:
@@ -128,11 +397,12 @@ class StockMainViewSet(viewsets.ModelViewSet):
             )
 
 
-class StockDetailViewSet(viewsets.ModelViewSet):
+class StockDetailViewSet(InsufficientStockMixin, viewsets.ModelViewSet):
     """ViewSet for StockDetail CRUD operations"""
     queryset = StockDetail.objects.all()
     serializer_class = StockDetailSerializer
     permission_classes = [AllowAny]
+    pagination_class = StockDetailPagination
 
     def get_queryset(self):
         queryset = StockDetail.objects.select_related('product', 'transaction')
@@ -155,123 +425,253 @@ class StockDetailViewSet(viewsets.ModelViewSet):
             elif movement_type.upper() == 'OUT':
                 queryset = queryset.filter(quantity__lt=0)
         
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-detail_id')
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream filtered stock details as CSV or NDJSON"""
+        export_format = get_export_format(request)
+        if export_format is None:
+            return Response({'error': invalid_format_message()}, status=status.HTTP_400_BAD_REQUEST)
+
+        return stream_export(self.get_queryset(), STOCK_DETAIL_COLUMNS, export_format, 'stock-details')
 
 
-class InventorySummaryView(generics.ListAPIView):
+class InventorySummaryView(ConditionalGetMixin, generics.ListAPIView):
     """View for inventory summary with current stock levels"""
     serializer_class = InventorySummarySerializer
     permission_classes = [AllowAny]
+    version_resources = (ResourceVersion.PRODUCTS, ResourceVersion.STOCK)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    SORT_FIELDS = ['current_stock', 'product_name', 'total_value', 'cost_value']
 
     def get_queryset(self):
-        # Get all active products with their current stock levels
-        products = ProductMaster.objects.filter(is_active=True)
-        
-        summary_data = []
-        for product in products:
-            # Calculate current stock
-            current_stock = product.current_stock
-            
-            # Calculate total value
-            total_value = current_stock * product.unit_price
-            
-            # Get last movement date
-            last_movement = StockDetail.objects.filter(
-                product=product
-            ).select_related('transaction').order_by('-transaction__transaction_date').first()
-            
-            last_movement_date = last_movement.transaction.transaction_date if last_movement else None
-            
-            # Check if stock is low (less than 10 units)
-            is_low_stock = current_stock < 10
-            
-            summary_data.append({
-                'product_id': product.product_id,
-                'product_code': product.product_code,
-                'product_name': product.product_name,
-                'category': product.category or '',
-                'unit': product.unit,
-                'current_stock': current_stock,
-                'unit_price': product.unit_price,
-                'total_value': total_value,
-                'last_movement_date': last_movement_date,
-                'is_low_stock': is_low_stock
-            })
-        
-        return summary_data
+        # Active products with their stock balance, valued and flagged in a single query
+        queryset = ProductMaster.objects.filter(is_active=True)
+        low_stock_only = self.request.query_params.get('low_stock_only', 'false').lower() == 'true'
+        queryset = queryset.values(
+            'product_id', 'product_code', 'product_name', 'category', 'unit', 'unit_price',
+            'reorder_point', 'reorder_quantity'
+        )
+        as_of = get_as_of(self.request)
+        if as_of is not None:
+            # Past stock is the nearest checkpoint plus the movements since it; costs are only kept for now
+            queryset = annotate_stock_as_of(queryset, as_of).annotate(
+                cost_value=Value(None, output_field=DecimalField(max_digits=20, decimal_places=4)),
+                unit_cost=Value(None, output_field=DecimalField(max_digits=18, decimal_places=6)),
+                is_low_stock=Case(
+                    When(current_stock__lt=F('reorder_point'), then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField()
+                ),
+            )
+            if low_stock_only:
+                queryset = queryset.filter(current_stock__lt=F('reorder_point'))
+        else:
+            # The maintained reorder flag makes low stock an indexed lookup
+            if low_stock_only:
+                queryset = queryset.filter(needs_reorder=True)
+            queryset = queryset.annotate(
+                current_stock=Coalesce(
+                    F('stock_balance__quantity'), Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=14, decimal_places=2)
+                ),
+                last_movement_date=F('stock_balance__last_movement_date'),
+                cost_value=Coalesce(
+                    F('stock_valuation__cost_value'), Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=20, decimal_places=4)
+                ),
+                unit_cost=F('stock_valuation__unit_cost'),
+                is_low_stock=F('needs_reorder'),
+            )
+        queryset = queryset.annotate(
+            total_value=ExpressionWrapper(
+                F('current_stock') * F('unit_price'),
+                output_field=DecimalField(max_digits=16, decimal_places=2)
+            ),
+        )
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        
         # Filter by category
-        category = request.query_params.get('category', None)
+        category = self.request.query_params.get('category', None)
         if category:
-            queryset = [item for item in queryset if category.lower() in item['category'].lower()]
-        
-        # Filter by low stock
-        low_stock_only = request.query_params.get('low_stock_only', None)
-        if low_stock_only and low_stock_only.lower() == 'true':
-            queryset = [item for item in queryset if item['is_low_stock']]
-        
+            queryset = queryset.filter(category__icontains=category)
+
         # Sort by current stock (ascending for low stock first)
-        sort_by = request.query_params.get('sort_by', 'product_name')
-        reverse_sort = request.query_params.get('reverse', 'false').lower() == 'true'
-        
-        if sort_by in ['current_stock', 'product_name', 'total_value']:
-            queryset = sorted(queryset, key=lambda x: x[sort_by], reverse=reverse_sort)
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        sort_by = self.request.query_params.get('sort_by', 'product_name')
+        if sort_by not in self.SORT_FIELDS:
+            sort_by = 'product_name'
+        if self.request.query_params.get('reverse', 'false').lower() == 'true':
+            sort_by = f'-{sort_by}'
+
+        # Product id breaks ties so pages never overlap
+        return queryset.order_by(sort_by, 'product_id')
 
 
-class DashboardStatsView(generics.GenericAPIView):
+class ReorderSuggestionView(ConditionalGetMixin, generics.ListAPIView):
+    """View for the active products below their reorder point and the quantity to order"""
+    serializer_class = ReorderSuggestionSerializer
+    permission_classes = [AllowAny]
+    version_resources = (ResourceVersion.PRODUCTS, ResourceVersion.STOCK)
+
+    SORT_FIELDS = ['product_name', 'shortage', 'suggested_quantity', 'estimated_cost']
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    def get_queryset(self):
+        quantity_field = DecimalField(max_digits=14, decimal_places=2)
+        queryset = ProductMaster.objects.filter(is_active=True, needs_reorder=True).values(
+            'product_id', 'product_code', 'product_name', 'category', 'unit', 'reorder_point', 'reorder_quantity'
+        ).annotate(
+            current_stock=Coalesce(F('stock_balance__quantity'), Value(Decimal('0')), output_field=quantity_field),
+            # Latest cost, or the list price of products never valued
+            unit_cost=Coalesce(
+                F('stock_valuation__unit_cost'), F('unit_price'),
+                output_field=DecimalField(max_digits=18, decimal_places=6)
+            ),
+        ).annotate(
+            shortage=ExpressionWrapper(F('reorder_point') - F('current_stock'), output_field=quantity_field),
+        ).annotate(
+            # The reorder quantity, or more when that would not get back to the reorder point
+            suggested_quantity=Greatest(F('reorder_quantity'), F('shortage'), output_field=quantity_field),
+        ).annotate(
+            estimated_cost=ExpressionWrapper(
+                F('suggested_quantity') * F('unit_cost'),
+                output_field=DecimalField(max_digits=18, decimal_places=2)
+            ),
+        )
+
+        # Filter by category
+        category = self.request.query_params.get('category', None)
+        if category:
+            queryset = queryset.filter(category__icontains=category)
+
+        sort_by = self.request.query_params.get('sort_by', 'product_name')
+        if sort_by not in self.SORT_FIELDS:
+            sort_by = 'product_name'
+        if self.request.query_params.get('reverse', 'false').lower() == 'true':
+            sort_by = f'-{sort_by}'
+
+        # Product id breaks ties so pages never overlap
+        return queryset.order_by(sort_by, 'product_id')
+
+
+class ExpiringStockView(ConditionalGetMixin, generics.ListAPIView):
+    """View for the batches on hand that expire within a number of days"""
+    serializer_class = StockBatchSerializer
+    permission_classes = [AllowAny]
+    version_resources = (ResourceVersion.PRODUCTS, ResourceVersion.STOCK)
+    # The window is counted from today
+    version_lifetime = 24 * 60 * 60
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    def get_queryset(self):
+        try:
+            within_days = int(self.request.query_params.get('within_days', EXPIRING_DEFAULT_DAYS))
+        except ValueError:
+            within_days = -1
+        if not 0 <= within_days <= EXPIRING_MAX_DAYS:
+            raise ValidationError({'within_days': f"within_days must be a whole number from 0 to {EXPIRING_MAX_DAYS}."})
+        include_expired = self.request.query_params.get('include_expired', 'true').lower() != 'false'
+
+        queryset = expiring_batches(within_days, include_expired).select_related('product')
+
+        # Filter by category
+        category = self.request.query_params.get('category', None)
+        if category:
+            queryset = queryset.filter(product__category__icontains=category)
+        return queryset
+
+
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """Queue background reports, poll their status and download their results"""
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        queryset = ReportJob.objects.order_by('-created_at', '-job_id')
+
+        # Filter by report and status
+        report = self.request.query_params.get('report', None)
+        if report:
+            queryset = queryset.filter(report=report)
+        job_status = self.request.query_params.get('status', None)
+        if job_status:
+            queryset = queryset.filter(status=job_status)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        """Queue a report, or return the queued, running or fresh job with the same parameters"""
+        serializer = ReportRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job, reused = submit_report(
+            serializer.validated_data['report'], serializer.validated_data['export_format'],
+            serializer.validated_data['params'], refresh=serializer.validated_data['refresh'],
+            requested_by=request.user.get_username() if request.user.is_authenticated else None,
+        )
+        data = {**self.get_serializer(job).data, 'reused': reused}
+        response = Response(
+            data, status=status.HTTP_200_OK if job.status == ReportJob.DONE else status.HTTP_202_ACCEPTED
+        )
+        response['Location'] = request.build_absolute_uri(reverse('report-detail', args=[job.pk]))
+        return self.with_retry_after(response, job)
+
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        return self.with_retry_after(Response(self.get_serializer(job).data), job)
+
+    def with_retry_after(self, response, job):
+        # Tell pollers when to look again
+        if job.status in (ReportJob.QUEUED, ReportJob.RUNNING):
+            response['Retry-After'] = str(max(1, round(settings.REPORT_WORKER_POLL_INTERVAL)))
+        return response
+
+    @action(detail=False, methods=['get'])
+    def types(self, request):
+        """The reports that can be requested and their parameters"""
+        return Response([report.describe() for report in REPORTS.values()])
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """The result file of a finished report"""
+        job = self.get_object()
+        if job.status != ReportJob.DONE:
+            return Response(
+                {'error': f'Report is {job.status}.', 'status': job.status}, status=status.HTTP_409_CONFLICT
+            )
+        try:
+            result = open(result_path(job), 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'Report result has expired.'}, status=status.HTTP_410_GONE)
+        filename = f"{job.report.replace('_', '-')}-{job.finished_at:%Y%m%d%H%M%S}.{job.export_format}"
+        return FileResponse(
+            result, as_attachment=True, filename=filename, content_type=EXPORT_FORMATS[job.export_format]
+        )
+
+
+class DashboardStatsView(ConditionalGetMixin, generics.GenericAPIView):
     """View for dashboard statistics"""
     permission_classes = [AllowAny]
+    version_resources = (ResourceVersion.PRODUCTS, ResourceVersion.TRANSACTIONS, ResourceVersion.STOCK)
+    # Day and week counters move with the clock as well as with writes
+    version_lifetime = settings.DASHBOARD_STATS_CACHE_TIMEOUT
+    # The snapshot is cached already, and its age has to be computed when it is served
+    cache_responses = False
 
     def get(self, request):
         """Get dashboard statistics"""
+        return self.conditional_get(request, self.get_stats)
+
+    def get_stats(self, request):
         try:
-            # Total products
-            total_products = ProductMaster.objects.filter(is_active=True).count()
-            
-            # Total transactions today
-            today = timezone.now().date()
-            today_transactions = StockMain.objects.filter(
-                transaction_date__date=today
-            ).count()
-            
-            # Total stock value
-            total_value = 0
-            for product in ProductMaster.objects.filter(is_active=True):
-                total_value += product.current_stock * product.unit_price
-            
-            # Low stock products
-            low_stock_products = 0
-            for product in ProductMaster.objects.filter(is_active=True):
-                if product.current_stock < 10:
-                    low_stock_products += 1
-            
-            # Recent transactions (last 7 days)
-            week_ago = timezone.now() - timedelta(days=7)
-            recent_transactions = StockMain.objects.filter(
-                transaction_date__gte=week_ago
-            ).count()
-            
-            # Stock movements today
-            today_movements = StockDetail.objects.filter(
-                transaction__transaction_date__date=today
-            ).count()
-            
-            stats = {
-                'total_products': total_products,
-                'today_transactions': today_transactions,
-                'total_stock_value': float(total_value),
-                'low_stock_products': low_stock_products,
-                'recent_transactions': recent_transactions,
-                'today_movements': today_movements
-            }
-            
-            return Response(stats)
+            return Response(get_dashboard_stats())
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
@@ -279,6 +679,35 @@ class DashboardStatsView(generics.GenericAPIView):
             )
 
 
+def prometheus_metrics(request):
+    """Request metrics of every worker in the Prometheus text format"""
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        response = HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SlowQueryLogView(generics.GenericAPIView):
+    """Slow-query log entries of every worker, newest first (staff only)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        kind = request.query_params.get('kind')
+        if kind and kind not in KINDS:
+            raise ValidationError({'kind': f"kind must be one of: {', '.join(KINDS)}"})
+        try:
+            limit = int(request.query_params.get('limit', 100))
+        except ValueError:
+            raise ValidationError({'limit': "limit must be a number."})
+        if limit < 1:
+            raise ValidationError({'limit': "limit must be at least 1."})
+
+        entries = slow_query_log.entries(kind=kind, view=request.query_params.get('view'), limit=limit)
+        return Response({'enabled': settings.SLOW_QUERY_LOG_ENABLED, 'results': entries})
+
+
 class RegisterSerializer(ModelSerializer):
     email = EmailField(required=True)
     password = CharField(write_only=True, min_length=8)
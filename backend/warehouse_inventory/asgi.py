@@ -1,6 +1,22 @@
 import os
-from django.core.asgi import get_asgi_application
+
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'warehouse_inventory.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+ASGI_URLCONF = 'warehouse_inventory.urls_asgi'
+
+
+class WarehouseASGIHandler(ASGIHandler):
+    """ASGI handler that serves the async read views of urls_asgi"""
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = ASGI_URLCONF
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = WarehouseASGIHandler()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 from decouple import config
 import dj_database_url
+from corsheaders.defaults import default_headers
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.metrics.RequestMetricsMiddleware',
+    'inventory.querylog.SlowQueryLogMiddleware',
+    'inventory.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -103,10 +107,93 @@ if DATABASE_URL == 'your_neon_database_url_here' or not DATABASE_URL:
         }
     }
 else:
+    # Persistent connections spare the async views a connection setup per concurrent query
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL)
+        'default': dj_database_url.parse(
+            DATABASE_URL,
+            conn_max_age=config('CONN_MAX_AGE', default=0, cast=int),
+            conn_health_checks=True,
+        )
     }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Tests use a file rather than the shared in-memory database, whose table locks fail
+    # concurrent writers at once instead of making them wait like the real database
+    DATABASES['default']['TEST'] = {'NAME': str(BASE_DIR / 'test_db.sqlite3')}
+
+# Read replicas (comma separated URLs) for the reads of GET requests, added as replica1, replica2, ...
+DATABASE_REPLICA_URLS = [
+    url.strip().replace('postgres://', 'postgresql://', 1)
+    for url in config('DATABASE_REPLICA_URLS', default='').split(',') if url.strip()
+]
+for number, url in enumerate(DATABASE_REPLICA_URLS, 1):
+    DATABASES[f'replica{number}'] = {
+        **dj_database_url.parse(
+            url,
+            conn_max_age=config('CONN_MAX_AGE', default=0, cast=int),
+            conn_health_checks=True,
+        ),
+        # Tests read and write the test copy of the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['inventory.replicas.ReplicaRouter'] if REPLICA_DATABASES else []
+# Seconds after a write during which the writing client reads from the primary
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=15, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# File based so every gunicorn worker sees the same snapshots and invalidations
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache')),
+    }
+}
+
+# Seconds a dashboard statistics snapshot may be served before it is recomputed
+DASHBOARD_STATS_CACHE_TIMEOUT = config('DASHBOARD_STATS_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds a rendered API response is kept for requests with the same ETag
+API_RESPONSE_CACHE_TIMEOUT = config('API_RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+
+
+# Request metrics served at /api/metrics/; every worker merges its counts into one SQLite file
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_LOCATION = config('METRICS_LOCATION', default=str(BASE_DIR / 'metrics.sqlite3'))
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=int)
+# Bearer token required to read /api/metrics/ (open when empty)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Slow-query log, kept as a ring buffer in the METRICS_LOCATION file and read at /api/slow-queries/
+SLOW_QUERY_LOG_ENABLED = config('SLOW_QUERY_LOG_ENABLED', default=False, cast=bool)
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=float)
+# Executions of the same statement within one request that are logged as an N+1 pattern
+SLOW_QUERY_REPEAT_THRESHOLD = config('SLOW_QUERY_REPEAT_THRESHOLD', default=10, cast=int)
+SLOW_QUERY_LOG_SIZE = config('SLOW_QUERY_LOG_SIZE', default=500, cast=int)
+
+
+# Transaction codes reserved per database round-trip by each worker thread
+TRANSACTION_CODE_BLOCK_SIZE = config('TRANSACTION_CODE_BLOCK_SIZE', default=100, cast=int)
+
+# Costing method of the stock valuation: 'average' or 'fifo' (run rebuild_valuations after changing it)
+INVENTORY_VALUATION_METHOD = config('INVENTORY_VALUATION_METHOD', default='average')
+
+# Background reports run by manage.py run_report_worker; result files are written under REPORTS_ROOT
+REPORTS_ROOT = config('REPORTS_ROOT', default=str(BASE_DIR / 'reports'))
+# Seconds a finished report is kept, and reused for identical requests while the data is unchanged
+REPORT_RESULT_TTL = config('REPORT_RESULT_TTL', default=86400, cast=int)
+# Jobs each worker process runs at a time, and seconds between looks at an empty queue
+REPORT_WORKER_CONCURRENCY = config('REPORT_WORKER_CONCURRENCY', default=2, cast=int)
+REPORT_WORKER_POLL_INTERVAL = config('REPORT_WORKER_POLL_INTERVAL', default=2, cast=float)
+# Seconds after which a running job is considered abandoned by its worker and queued again
+REPORT_JOB_TIMEOUT = config('REPORT_JOB_TIMEOUT', default=3600, cast=int)
+
+# Admin change lists show the database's row estimate instead of a COUNT(*) from this many rows
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -156,6 +243,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = config('CORS_ALLOW_ALL_ORIGINS', default=True, cast=bool)
 CORS_ALLOW_CREDENTIALS = True
+# Clients without cookies echo X-Recent-Write back to keep reading their writes from the primary
+CORS_ALLOW_HEADERS = (*default_headers, 'x-recent-write')
+CORS_EXPOSE_HEADERS = ['X-Recent-Write']
 
 # REST Framework Settings
 REST_FRAMEWORK = {
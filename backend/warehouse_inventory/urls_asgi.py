@@ -0,0 +1,14 @@
+"""
+URL configuration of the ASGI deployment (see asgi.py).
+
+The read-heavy endpoints resolve to async views first; every other URL falls
+through to the regular URL configuration and its synchronous views.
+"""
+from django.urls import path, include
+
+from inventory.urls import async_urlpatterns
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include(async_urlpatterns)),
+] + sync_urlpatterns
@@ -3,16 +3,26 @@ import { getApiUrl, config } from "../config";
 export const getToken = () => localStorage.getItem("access_token");
 export const getRefreshToken = () => localStorage.getItem("refresh_token");
 
+// Echoed back so reads right after a write are served by the primary database, not a lagging replica
+const getRecentWrite = () => sessionStorage.getItem("recent_write");
+const rememberRecentWrite = (res) => {
+  const writtenAt = res.headers.get("X-Recent-Write");
+  if (writtenAt) sessionStorage.setItem("recent_write", writtenAt);
+};
+
 export async function apiFetch(endpoint, options = {}) {
   const token = getToken();
+  const recentWrite = getRecentWrite();
   const headers = {
     "Content-Type": "application/json",
     ...(token && { Authorization: `Bearer ${token}` }),
+    ...(recentWrite && { "X-Recent-Write": recentWrite }),
     ...options.headers,
   };
   
     try {
     const res = await fetch(getApiUrl(endpoint), { ...options, headers });
+    rememberRecentWrite(res);
       
       // If token is expired, try to refresh it
       if (res.status === 401 && token) {
@@ -23,9 +33,11 @@ export async function apiFetch(endpoint, options = {}) {
         const newHeaders = {
           "Content-Type": "application/json",
           ...(newToken && { Authorization: `Bearer ${newToken}` }),
+          ...(recentWrite && { "X-Recent-Write": recentWrite }),
           ...options.headers,
         };
         const retryRes = await fetch(getApiUrl(endpoint), { ...options, headers: newHeaders });
+        rememberRecentWrite(retryRes);
                         if (!retryRes.ok) {
                   const error = await retryRes.json().catch(() => ({}));
                   throw error;